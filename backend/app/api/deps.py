@@ -1,19 +1,53 @@
-from fastapi import Depends, Header, HTTPException
+from collections.abc import Generator
+
+from fastapi import Depends, Header, HTTPException, Request
 from sqlalchemy.orm import Session
 
 from app.db.models import User
-from app.db.postgres import get_db
+from app.db.postgres import read_session
+from app.db.sharding import LazySession, session_for_user, shard_of
+from app.db.user_cache import cache_user, get_cached_user
 
 
 def get_user_id(x_user_id: int | None = Header(default=None, alias="X-User-Id")) -> int:
     return x_user_id or 1
 
 
+def get_db(request: Request, user_id: int = Depends(get_user_id)) -> Generator[Session, None, None]:
+    # UserMovingError from the first query of a write request becomes a 503 in main.py
+    write = request.method not in ("GET", "HEAD")
+    db = LazySession(lambda: session_for_user(user_id, write=write))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _read_session_for(user_id: int) -> Session:
+    # replicas only exist for shard 0
+    return read_session(user_id) if shard_of(user_id) == 0 else session_for_user(user_id)
+
+
+def get_read_db(user_id: int = Depends(get_user_id)) -> Generator[Session, None, None]:
+    db = LazySession(lambda: _read_session_for(user_id))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def get_current_user(
     user_id: int = Depends(get_user_id),
     db: Session = Depends(get_db),
 ) -> User:
+    # commits on this request's session make the user's next reads go to the primary
+    db.info["user_id"] = user_id
+    # the session only resolves the shard and checks out a connection on a cache miss
+    user = get_cached_user(user_id)
+    if user is not None:
+        return user
     user = db.get(User, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
+    cache_user(user)
     return user
@@ -6,11 +6,10 @@ from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_db, get_read_db
+from app.db.checkin_archive import MIN_ARCHIVE_DAYS, checkin_dates, get_archive, has_date
 from app.db.models import Checkin, Habit, User
-from app.db.postgres import get_db
-from app.db.rabbitmq import publish_event
-from app.db.redis import compute_and_store_streak
+from app.db.outbox import RECOMPUTE_STREAK, add_outbox, add_outbox_event
 
 router = APIRouter()
 
@@ -39,8 +38,23 @@ def create_checkin(
     if habit is None:
         raise HTTPException(status_code=404, detail="Привычка не найдена")
 
+    # the unique constraint only covers the hot table
+    if date < dt.date.today() - dt.timedelta(days=MIN_ARCHIVE_DAYS):
+        archive = get_archive(db, user.id, payload.habit_id)
+        if archive is not None and has_date(archive, date):
+            raise HTTPException(status_code=409, detail="Отметка за этот день уже существует")
+
     checkin = Checkin(user_id=user.id, habit_id=payload.habit_id, date=date)
     db.add(checkin)
+    event = {
+        "user_id": user.id,
+        "habit_id": payload.habit_id,
+        "date": date.isoformat(),
+        "username": user.username,
+        "habit_title": habit.title,
+    }
+    add_outbox(db, RECOMPUTE_STREAK, event)
+    add_outbox_event(db, "habits.checkin.recorded", event)
     try:
         db.commit()
     except IntegrityError:
@@ -48,15 +62,23 @@ def create_checkin(
         raise HTTPException(status_code=409, detail="Отметка за этот день уже существует")
 
     db.refresh(checkin)
-    try:
-        compute_and_store_streak(db=db, user_id=user.id, habit_id=payload.habit_id, end_date=date)
-    except Exception:
-        pass
-    try:
-        publish_event(
-            "habits.checkin.recorded",
-            {"user_id": user.id, "habit_id": payload.habit_id, "date": date.isoformat()},
-        )
-    except Exception:
-        pass
     return checkin
+
+
+class CheckinHistoryOut(BaseModel):
+    habit_id: int
+    dates: list[dt.date]
+
+
+@router.get("/history", response_model=CheckinHistoryOut)
+def get_history(
+    habit_id: int,
+    since: dt.date | None = None,
+    until: dt.date | None = None,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+) -> CheckinHistoryOut:
+    habit = db.scalar(select(Habit.id).where(Habit.id == habit_id, Habit.user_id == user.id))
+    if habit is None:
+        raise HTTPException(status_code=404, detail="Привычка не найдена")
+    return CheckinHistoryOut(habit_id=habit_id, dates=checkin_dates(db, user.id, habit_id, since, until))
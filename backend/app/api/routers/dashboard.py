@@ -5,9 +5,9 @@ from pydantic import BaseModel
 from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_read_db
+from app.db.checkin_archive import archive_summaries
 from app.db.models import Checkin, Habit, User
-from app.db.postgres import get_db
 
 router = APIRouter()
 
@@ -28,7 +28,7 @@ class DashboardOut(BaseModel):
 @router.get("", response_model=DashboardOut)
 def get_dashboard(
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ) -> DashboardOut:
     habits = list(
         db.scalars(
@@ -52,6 +52,9 @@ def get_dashboard(
     ).all()
 
     by_habit: dict[int, tuple[int, dt.date | None]] = {r[0]: (int(r[1]), r[2]) for r in rows}
+    for habit_id, (archived, archived_last) in archive_summaries(db, user.id, habit_ids).items():
+        total, last = by_habit.get(habit_id, (0, None))
+        by_habit[habit_id] = (total + archived, max(last or archived_last, archived_last))
     from app.db.redis import get_streak
 
     return DashboardOut(
@@ -95,7 +98,7 @@ class DashboardSummaryOut(BaseModel):
 @router.get("/summary", response_model=DashboardSummaryOut)
 def get_dashboard_summary(
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ) -> DashboardSummaryOut:
     from app.db.mongo import get_diary_collection
     from app.db.redis import get_streak
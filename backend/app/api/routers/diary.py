@@ -6,9 +6,13 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 
 from app.api.deps import get_current_user
+from app.core.minhash import signature
+from app.core.settings import settings
+from app.db.diary_lsh import find_duplicate, index_entry, remove_entry
 from app.db.mongo import get_diary_collection
 from app.db.qdrant import delete_diary_entry, upsert_diary_entry, vector_search_diary
 from app.db.rabbitmq import publish_event
+from app.db.redis import get_friend_ids
 from app.db.models import User
 
 router = APIRouter()
@@ -19,6 +23,7 @@ class DiaryCreate(BaseModel):
     tags: list[str] = []
     mood: str | None = None
     metadata: dict[str, Any] = {}
+    shared: bool = False
 
 
 class DiaryUpdate(BaseModel):
@@ -26,6 +31,7 @@ class DiaryUpdate(BaseModel):
     tags: list[str] | None = None
     mood: str | None = None
     metadata: dict[str, Any] | None = None
+    shared: bool | None = None
 
 
 class DiaryOut(BaseModel):
@@ -37,6 +43,8 @@ class DiaryOut(BaseModel):
     metadata: dict[str, Any]
     created_at: dt.datetime
     updated_at: dt.datetime | None = None
+    duplicate_of: str | None = None
+    shared: bool = False
 
 
 class DiaryListOut(BaseModel):
@@ -47,8 +55,44 @@ class DiaryListOut(BaseModel):
     sort: str
 
 
+def _entry_out(doc: dict) -> DiaryOut:
+    return DiaryOut(
+        id=str(doc["_id"]),
+        user_id=doc["user_id"],
+        text=doc.get("text", ""),
+        tags=doc.get("tags", []),
+        mood=doc.get("mood"),
+        metadata=doc.get("metadata", {}),
+        created_at=doc.get("created_at") or dt.datetime.now(tz=dt.UTC),
+        updated_at=doc.get("updated_at"),
+        duplicate_of=doc.get("duplicate_of"),
+        shared=bool(doc.get("shared")),
+    )
+
+
+def _find_duplicate_root(user_id: int, sig: list[int] | None) -> str | None:
+    if settings.diary_dedup_mode == "off" or sig is None:
+        return None
+    try:
+        found = find_duplicate(user_id=user_id, sig=sig, threshold=settings.diary_dedup_threshold)
+    except Exception:
+        return None
+    if not found:
+        return None
+    entry_id = found[0]
+    original = _get_entry_by_id(entry_id)
+    if not original:
+        return None
+    return original.get("duplicate_of") or entry_id
+
+
 @router.post("", response_model=DiaryOut)
 def create_entry(payload: DiaryCreate, user: User = Depends(get_current_user)) -> DiaryOut:
+    sig = signature(payload.text)
+    duplicate_of = _find_duplicate_root(user.id, sig)
+    if duplicate_of and settings.diary_dedup_mode == "reject":
+        raise HTTPException(status_code=409, detail="Такая запись в дневнике уже есть")
+
     col = get_diary_collection()
     doc = {
         "user_id": user.id,
@@ -56,12 +100,20 @@ def create_entry(payload: DiaryCreate, user: User = Depends(get_current_user)) -
         "tags": payload.tags,
         "mood": payload.mood,
         "metadata": payload.metadata,
+        "shared": payload.shared,
         "created_at": dt.datetime.now(tz=dt.UTC),
         "updated_at": None,
     }
+    if duplicate_of:
+        doc["duplicate_of"] = duplicate_of
     inserted = col.insert_one(doc)
     doc["_id"] = inserted.inserted_id
 
+    try:
+        index_entry(user_id=user.id, entry_id=str(doc["_id"]), sig=sig)
+    except Exception:
+        pass
+
     try:
         upsert_diary_entry(
             entry_id=str(doc["_id"]),
@@ -70,6 +122,7 @@ def create_entry(payload: DiaryCreate, user: User = Depends(get_current_user)) -
             tags=payload.tags,
             mood=payload.mood,
             created_at=doc["created_at"],
+            shared=payload.shared,
         )
     except Exception:
         pass
@@ -79,16 +132,7 @@ def create_entry(payload: DiaryCreate, user: User = Depends(get_current_user)) -
     except Exception:
         pass
 
-    return DiaryOut(
-        id=str(doc["_id"]),
-        user_id=doc["user_id"],
-        text=doc["text"],
-        tags=doc["tags"],
-        mood=doc["mood"],
-        metadata=doc["metadata"],
-        created_at=doc["created_at"],
-        updated_at=doc.get("updated_at"),
-    )
+    return _entry_out(doc)
 
 
 @router.get("", response_model=DiaryListOut)
@@ -110,20 +154,7 @@ def list_entries(
         .limit(limit)
     )
 
-    items: list[DiaryOut] = []
-    for doc in cursor:
-        items.append(
-            DiaryOut(
-                id=str(doc["_id"]),
-                user_id=doc["user_id"],
-                text=doc.get("text", ""),
-                tags=doc.get("tags", []),
-                mood=doc.get("mood"),
-                metadata=doc.get("metadata", {}),
-                created_at=doc.get("created_at") or dt.datetime.now(tz=dt.UTC),
-                updated_at=doc.get("updated_at"),
-            )
-        )
+    items = [_entry_out(doc) for doc in cursor]
     return DiaryListOut(items=items, total=total, limit=limit, offset=offset, sort=sort)
 
 
@@ -147,9 +178,12 @@ def similar_entries(
     text: str | None = None,
     entry_id: str | None = None,
     limit: int = 5,
+    scope: str = "own",
 ) -> list[SimilarOut]:
     if not text and not entry_id:
         raise HTTPException(status_code=400, detail="Нужно передать text или entry_id")
+    if scope not in ("own", "friends"):
+        raise HTTPException(status_code=400, detail="scope должен быть own или friends")
 
     query_text = text
     if entry_id:
@@ -158,29 +192,38 @@ def similar_entries(
             raise HTTPException(status_code=404, detail="Запись дневника не найдена")
         query_text = doc.get("text") or ""
 
-    results = vector_search_diary(user_id=user.id, text=query_text or "", limit=min(max(1, limit), 20))
+    limit = min(max(1, limit), 20)
+    friend_ids: list[int] | None = None
+    if scope == "friends":
+        friend_ids = get_friend_ids(user_id=user.id)
+        if not friend_ids:
+            return []
+    results = vector_search_diary(
+        user_id=user.id,
+        text=query_text or "",
+        limit=limit * 3,
+        friend_ids=friend_ids,
+    )
 
     col = get_diary_collection()
+    docs = {
+        str(doc["_id"]): doc
+        for doc in col.find({"_id": {"$in": [ObjectId(r["entry_id"]) for r in results]}})
+    }
+
     out: list[SimilarOut] = []
+    seen_clusters: set[str] = set()
     for r in results:
-        doc = col.find_one({"_id": ObjectId(r["entry_id"])})
+        doc = docs.get(r["entry_id"])
         if not doc:
             continue
-        out.append(
-            SimilarOut(
-                entry=DiaryOut(
-                    id=str(doc["_id"]),
-                    user_id=doc["user_id"],
-                    text=doc.get("text", ""),
-                    tags=doc.get("tags", []),
-                    mood=doc.get("mood"),
-                    metadata=doc.get("metadata", {}),
-                    created_at=doc.get("created_at") or dt.datetime.now(tz=dt.UTC),
-                    updated_at=doc.get("updated_at"),
-                ),
-                score=float(r["score"]),
-            )
-        )
+        cluster = doc.get("duplicate_of") or r["entry_id"]
+        if cluster in seen_clusters:
+            continue
+        seen_clusters.add(cluster)
+        out.append(SimilarOut(entry=_entry_out(doc), score=float(r["score"])))
+        if len(out) >= limit:
+            break
     return out
 
 
@@ -197,22 +240,21 @@ def update_entry(
 
     updates = payload.model_dump(exclude_unset=True)
     if not updates:
-        return DiaryOut(
-            id=str(doc["_id"]),
-            user_id=doc["user_id"],
-            text=doc.get("text", ""),
-            tags=doc.get("tags", []),
-            mood=doc.get("mood"),
-            metadata=doc.get("metadata", {}),
-            created_at=doc.get("created_at") or dt.datetime.now(tz=dt.UTC),
-            updated_at=doc.get("updated_at"),
-        )
+        return _entry_out(doc)
 
+    old_text = doc.get("text", "")
     updates["updated_at"] = dt.datetime.now(tz=dt.UTC)
     col.update_one({"_id": doc["_id"]}, {"$set": updates})
     doc = _get_entry_by_id(entry_id)
 
     if payload.text is not None:
+        try:
+            remove_entry(user_id=user.id, entry_id=entry_id, sig=signature(old_text))
+            index_entry(user_id=user.id, entry_id=entry_id, sig=signature(doc.get("text", "")))
+        except Exception:
+            pass
+
+    if updates.keys() & {"text", "tags", "mood", "shared"}:
         try:
             upsert_diary_entry(
                 entry_id=str(doc["_id"]),
@@ -221,20 +263,12 @@ def update_entry(
                 tags=doc.get("tags", []),
                 mood=doc.get("mood"),
                 created_at=doc.get("created_at") or dt.datetime.now(tz=dt.UTC),
+                shared=bool(doc.get("shared")),
             )
         except Exception:
             pass
 
-    return DiaryOut(
-        id=str(doc["_id"]),
-        user_id=doc["user_id"],
-        text=doc.get("text", ""),
-        tags=doc.get("tags", []),
-        mood=doc.get("mood"),
-        metadata=doc.get("metadata", {}),
-        created_at=doc.get("created_at") or dt.datetime.now(tz=dt.UTC),
-        updated_at=doc.get("updated_at"),
-    )
+    return _entry_out(doc)
 
 
 @router.delete("/{entry_id}")
@@ -245,6 +279,10 @@ def delete_entry(entry_id: str, user: User = Depends(get_current_user)) -> dict:
         raise HTTPException(status_code=404, detail="Запись дневника не найдена")
 
     col.delete_one({"_id": doc["_id"]})
+    try:
+        remove_entry(user_id=user.id, entry_id=entry_id, sig=signature(doc.get("text", "")))
+    except Exception:
+        pass
     try:
         delete_diary_entry(entry_id=entry_id)
     except Exception:
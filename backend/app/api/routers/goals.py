@@ -1,13 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel, Field
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_db, get_read_db
+from app.db.goal_catalog import get_goal_catalog
 from app.db.models import Goal, User
-from app.db.postgres import get_db
-from app.db.neo4j import link_user_goal, list_goal_catalog, unlink_user_goal
-from app.db.rabbitmq import publish_event
+from app.db.outbox import LINK_GOAL, UNLINK_GOAL, add_outbox, add_outbox_event
 
 router = APIRouter()
 
@@ -35,9 +34,23 @@ class GoalUpdate(BaseModel):
     is_archived: bool | None = None
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses weak comparison: W/"v" matches "v"
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
 @router.get("/catalog", response_model=list[GoalCatalogOut])
-def get_catalog() -> list[dict]:
-    return list_goal_catalog()
+def get_catalog(request: Request, response: Response):
+    catalog = get_goal_catalog()
+    headers = {"ETag": catalog.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match", ""), catalog.etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return [dict(item) for item in catalog.items]
 
 
 @router.post("", response_model=GoalOut)
@@ -46,8 +59,7 @@ def select_goal(
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ) -> Goal:
-    catalog = {item["id"]: item for item in list_goal_catalog()}
-    item = catalog.get(payload.catalog_id)
+    item = get_goal_catalog().by_id.get(payload.catalog_id)
     if not item:
         raise HTTPException(status_code=404, detail="Цель не найдена")
 
@@ -59,12 +71,9 @@ def select_goal(
             goal.is_archived = False
             goal.title = item["title"]
             goal.description = item.get("description")
+            add_outbox(db, LINK_GOAL, {"user_id": user.id, "goal_id": payload.catalog_id})
             db.commit()
             db.refresh(goal)
-        try:
-            link_user_goal(user_id=user.id, goal_id=payload.catalog_id)
-        except Exception:
-            pass
         return goal
 
     goal = Goal(
@@ -75,16 +84,11 @@ def select_goal(
         is_archived=False,
     )
     db.add(goal)
+    db.flush()
+    add_outbox(db, LINK_GOAL, {"user_id": user.id, "goal_id": payload.catalog_id})
+    add_outbox_event(db, "user.goals.changed", {"user_id": user.id, "goal_id": goal.id})
     db.commit()
     db.refresh(goal)
-    try:
-        link_user_goal(user_id=user.id, goal_id=payload.catalog_id)
-    except Exception:
-        pass
-    try:
-        publish_event("user.goals.changed", {"user_id": user.id, "goal_id": goal.id})
-    except Exception:
-        pass
     return goal
 
 
@@ -92,7 +96,7 @@ def select_goal(
 def list_goals(
     status: str | None = None,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ) -> list[Goal]:
     query = select(Goal).where(Goal.user_id == user.id)
     if status == "active" or status is None:
@@ -117,14 +121,9 @@ def update_goal(
         raise HTTPException(status_code=400, detail="Нет данных для обновления")
 
     goal.is_archived = payload.is_archived
+    if goal.catalog_id is not None:
+        kind = UNLINK_GOAL if payload.is_archived else LINK_GOAL
+        add_outbox(db, kind, {"user_id": user.id, "goal_id": goal.catalog_id})
     db.commit()
     db.refresh(goal)
-    if goal.catalog_id is not None:
-        try:
-            if payload.is_archived:
-                unlink_user_goal(user_id=user.id, goal_id=goal.catalog_id)
-            else:
-                link_user_goal(user_id=user.id, goal_id=goal.catalog_id)
-        except Exception:
-            pass
     return goal
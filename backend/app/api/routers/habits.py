@@ -3,11 +3,9 @@ from pydantic import BaseModel, Field
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_db, get_read_db
 from app.db.models import Goal, Habit, User
-from app.db.postgres import get_db
-from app.db.neo4j import link_user_habit
-from app.db.rabbitmq import publish_event
+from app.db.outbox import LINK_HABIT, add_outbox, add_outbox_event
 
 router = APIRouter()
 
@@ -65,16 +63,11 @@ def create_habit(
         is_archived=False,
     )
     db.add(habit)
+    db.flush()
+    add_outbox(db, LINK_HABIT, {"user_id": user.id, "habit_id": habit.id, "title": habit.title})
+    add_outbox_event(db, "user.habits.changed", {"user_id": user.id, "habit_id": habit.id})
     db.commit()
     db.refresh(habit)
-    try:
-        link_user_habit(user_id=user.id, habit_id=habit.id, title=habit.title)
-    except Exception:
-        pass
-    try:
-        publish_event("user.habits.changed", {"user_id": user.id, "habit_id": habit.id})
-    except Exception:
-        pass
     return habit
 
 
@@ -82,7 +75,7 @@ def create_habit(
 def list_habits(
     status: str | None = None,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ) -> list[Habit]:
     query = select(Habit).where(Habit.user_id == user.id)
     if status == "active" or status is None:
@@ -111,11 +104,8 @@ def update_habit(
     updates = payload.model_dump(exclude_unset=True)
     for field, value in updates.items():
         setattr(habit, field, value)
+    if "title" in updates:
+        add_outbox(db, LINK_HABIT, {"user_id": user.id, "habit_id": habit.id, "title": habit.title})
     db.commit()
     db.refresh(habit)
-    if "title" in updates:
-        try:
-            link_user_habit(user_id=user.id, habit_id=habit.id, title=habit.title)
-        except Exception:
-            pass
     return habit
@@ -5,10 +5,9 @@ from pydantic import BaseModel
 from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_read_db
 from app.db.models import Checkin, Goal, Habit, User
 from app.db.mongo import get_diary_collection
-from app.db.postgres import get_db
 from app.db.redis import get_streak
 
 router = APIRouter()
@@ -25,7 +24,7 @@ class OverviewOut(BaseModel):
 
 
 @router.get("", response_model=OverviewOut)
-def get_overview(user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> OverviewOut:
+def get_overview(user: User = Depends(get_current_user), db: Session = Depends(get_read_db)) -> OverviewOut:
     today = dt.date.today()
     since = today - dt.timedelta(days=6)
 
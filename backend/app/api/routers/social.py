@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel
 
-from app.api.deps import get_current_user
-from app.db.neo4j import add_friend, list_friends, recommend_users
+from app.api.deps import get_current_user, get_user_id
+from app.core.settings import settings
 from app.db.models import User
+from app.db.feed import follow_if_hub, read_feed
+from app.db.neo4j import add_friend, list_friends, recommend_friends_of_friends
+from app.db.recommendations import TOP_K, cached_recommendations, mark_dirty
+from app.db.redis import invalidate_friend_ids, leaderboard_friends, leaderboard_global
+from app.db.sharding import usernames
 
 router = APIRouter()
 
@@ -17,6 +22,7 @@ class RecommendationOut(BaseModel):
     username: str | None = None
     shared_goals: int
     shared_habits: int
+    mutual_friends: int = 0
     score: int
 
 
@@ -25,12 +31,123 @@ def add_friendship(payload: AddFriendIn, user: User = Depends(get_current_user))
     if payload.friend_user_id == user.id:
         raise HTTPException(status_code=400, detail="Нельзя добавить в друзья самого себя")
     add_friend(user_id=user.id, friend_user_id=payload.friend_user_id)
+    try:
+        invalidate_friend_ids(user.id, payload.friend_user_id)
+        follow_if_hub(user.id, payload.friend_user_id)
+        mark_dirty([user.id, payload.friend_user_id], debounce_seconds=0)
+    except Exception:
+        pass
     return {"status": "ok"}
 
 
+def _parse_cursor(cursor: str | None) -> tuple[int, int] | None:
+    if not cursor:
+        return None
+    try:
+        score, user_id = cursor.split(":", 1)
+        return int(score), int(user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный курсор")
+
+
+def _friends_of_friends(user: User, response: Response, limit: int, cursor: str | None) -> list[dict]:
+    rows = recommend_friends_of_friends(
+        user_id=user.id,
+        limit=limit + 1,
+        fanout=settings.social_fof_fanout,
+        after=_parse_cursor(cursor),
+    )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = f"{last['score']}:{last['user_id']}"
+    return rows
+
+
 @router.get("/recommendations", response_model=list[RecommendationOut])
-def get_recommendations(user: User = Depends(get_current_user), limit: int = 10) -> list[dict]:
-    return recommend_users(user_id=user.id, limit=min(max(1, limit), 50))
+def get_recommendations(
+    response: Response,
+    user: User = Depends(get_current_user),
+    limit: int = 10,
+    strategy: str = "shared",
+    cursor: str | None = None,
+) -> list[dict]:
+    limit = min(max(1, limit), TOP_K)
+    if strategy == "fof":
+        return _friends_of_friends(user, response, limit, cursor)
+    if strategy != "shared":
+        raise HTTPException(status_code=400, detail="strategy должен быть 'shared' или 'fof'")
+    rows = cached_recommendations(user_id=user.id, limit=limit)
+    names = usernames(row["user_id"] for row in rows)
+    return [{**row, "username": names.get(row["user_id"])} for row in rows]
+
+
+class FeedItemOut(BaseModel):
+    id: str
+    type: str
+    user_id: int
+    username: str | None = None
+    habit_id: int | None = None
+    habit_title: str | None = None
+    date: str | None = None
+    streak: int | None = None
+    occurred_at_ms: int
+
+
+class FeedOut(BaseModel):
+    items: list[FeedItemOut]
+    next_cursor: str | None = None
+
+
+@router.get("/feed", response_model=FeedOut)
+def get_feed(
+    user_id: int = Depends(get_user_id),
+    limit: int = 20,
+    cursor: str | None = None,
+) -> FeedOut:
+    limit = min(max(1, limit), 100)
+    try:
+        items, next_cursor = read_feed(user_id=user_id, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный курсор")
+    return FeedOut(items=items, next_cursor=next_cursor)
+
+
+class LeaderboardEntryOut(BaseModel):
+    rank: int
+    user_id: int
+    username: str | None = None
+    streak: int
+
+
+class LeaderboardOut(BaseModel):
+    scope: str
+    items: list[LeaderboardEntryOut]
+    my_streak: int
+
+
+@router.get("/leaderboard", response_model=LeaderboardOut)
+def get_leaderboard(
+    user: User = Depends(get_current_user),
+    scope: str = "friends",
+    limit: int = 20,
+) -> LeaderboardOut:
+    limit = min(max(1, limit), 100)
+    if scope == "friends":
+        rows = leaderboard_friends(user_id=user.id, limit=limit)
+        my_streak = next((streak for uid, streak in rows if uid == user.id), 0)
+    elif scope == "global":
+        rows, mine = leaderboard_global(user_id=user.id, limit=limit)
+        my_streak = mine or 0
+    else:
+        raise HTTPException(status_code=400, detail="scope должен быть 'friends' или 'global'")
+
+    names = usernames(uid for uid, _ in rows)
+    items = [
+        LeaderboardEntryOut(rank=i, user_id=uid, username=names.get(uid), streak=streak)
+        for i, (uid, streak) in enumerate(rows, start=1)
+    ]
+    return LeaderboardOut(scope=scope, items=items, my_streak=my_streak)
 
 
 class FriendOut(BaseModel):
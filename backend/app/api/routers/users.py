@@ -1,12 +1,16 @@
+from itertools import chain
+
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
-from sqlalchemy import select
+from sqlalchemy import func, select
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_db
 from app.db.models import User
-from app.db.postgres import get_db
-from app.db.neo4j import upsert_user
+from app.db.outbox import UPSERT_USER, add_outbox
+from app.db.sharding import place_new_user, register_user, scatter, session_for_shard, username_taken
+from app.db.user_cache import invalidate_user
 
 router = APIRouter()
 
@@ -24,22 +28,38 @@ class UserUpdate(BaseModel):
     username: str = Field(min_length=2, max_length=64)
 
 
-@router.post("", response_model=UserOut)
-def create_user(payload: UserCreate, db: Session = Depends(get_db)) -> User:
-    user = User(username=payload.username)
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    try:
-        upsert_user(user_id=user.id, username=user.username)
-    except Exception:
-        pass
-    return user
+class UserListOut(BaseModel):
+    items: list[UserOut]
+    next_after_id: int | None = None
 
 
-@router.get("", response_model=list[UserOut])
-def list_users(db: Session = Depends(get_db)) -> list[User]:
-    return list(db.scalars(select(User).order_by(User.id)))
+@router.post("", response_model=UserOut)
+def create_user(payload: UserCreate) -> User:
+    if username_taken(payload.username):
+        raise HTTPException(status_code=409, detail="Это имя уже занято")
+    shard = place_new_user(payload.username)
+    with session_for_shard(shard) as db:
+        user = User(username=payload.username)
+        db.add(user)
+        db.flush()
+        add_outbox(db, UPSERT_USER, {"user_id": user.id, "username": user.username})
+        # a directory entry without a committed user only yields 404s, the reverse would hide the user
+        register_user(user.id, shard)
+        db.commit()
+        db.refresh(user)
+        return user
+
+
+@router.get("", response_model=UserListOut)
+def list_users(after_id: int = 0, limit: int = 50) -> UserListOut:
+    limit = min(max(1, limit), 200)
+    pages = scatter(
+        lambda _, db: list(db.scalars(select(User).where(User.id > after_id).order_by(User.id).limit(limit))),
+        read=True,
+    )
+    users = sorted(chain.from_iterable(pages), key=lambda u: u.id)[:limit]
+    next_after_id = users[-1].id if len(users) == limit else None
+    return UserListOut(items=users, next_after_id=next_after_id)
 
 
 @router.get("/me", response_model=UserOut)
@@ -49,32 +69,72 @@ def get_me(user: User = Depends(get_current_user)) -> User:
 
 @router.patch("/me", response_model=UserOut)
 def update_me(payload: UserUpdate, user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> User:
-    existing = db.scalar(select(User).where(User.username == payload.username, User.id != user.id))
-    if existing:
+    if username_taken(payload.username, exclude_user_id=user.id):
         raise HTTPException(status_code=409, detail="Это имя уже занято")
 
+    user = db.get(User, user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
     user.username = payload.username
+    add_outbox(db, UPSERT_USER, {"user_id": user.id, "username": user.username})
     db.commit()
+    invalidate_user(user.id)
     db.refresh(user)
-    try:
-        upsert_user(user_id=user.id, username=user.username)
-    except Exception:
-        pass
     return user
 
 
+def _search_shard(db: Session, q: str, limit: int, exclude_id: int) -> list[tuple[tuple, User]]:
+    name = func.lower(User.username)
+    pattern = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+    # prefix fast path: btree on lower(username) text_pattern_ops
+    found = list(
+        db.scalars(
+            select(User)
+            .where(name.like(f"{pattern}%"), User.id != exclude_id)
+            .order_by(name.asc())
+            .limit(limit)
+        )
+    )
+    # shard results are merged by (prefix first, similarity, name)
+    ranked = [((0, 0.0, u.username.lower()), u) for u in found]
+    if len(found) == limit or len(q) < 3:
+        return ranked
+
+    seen = {u.id for u in found}
+    try:
+        # trigram GIN index serves both the substring match and the % similarity operator
+        similarity = func.similarity(name, q)
+        rest = db.execute(
+            select(User, similarity)
+            .where(name.like(f"%{pattern}%") | name.op("%")(q), User.id != exclude_id)
+            .order_by(similarity.desc(), name.asc())
+            .limit(limit + len(found))
+        ).all()
+    except DBAPIError:
+        db.rollback()
+        rest = [
+            (u, 0.0)
+            for u in db.scalars(
+                select(User)
+                .where(User.username.ilike(f"%{pattern}%"), User.id != exclude_id)
+                .order_by(User.username.asc())
+                .limit(limit + len(found))
+            )
+        ]
+    ranked += [((1, -float(score), u.username.lower()), u) for u, score in rest if u.id not in seen]
+    return ranked
+
+
 @router.get("/search", response_model=list[UserOut])
 def search_users(
     q: str,
     limit: int = 10,
     user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
 ) -> list[User]:
-    return list(
-        db.scalars(
-            select(User)
-            .where(User.username.ilike(f"%{q}%"), User.id != user.id)
-            .order_by(User.username.asc())
-            .limit(min(max(1, limit), 20))
-        )
-    )
+    limit = min(max(1, limit), 20)
+    q = q.strip().lower()
+    if not q:
+        return []
+    ranked = chain.from_iterable(scatter(lambda _, db: _search_shard(db, q, limit, user.id), read=True))
+    return [u for _, u in sorted(ranked, key=lambda item: item[0])[:limit]]
@@ -0,0 +1,255 @@
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+from app.core import metrics
+from app.core.lru import TTLCache
+from app.core.settings import settings
+
+# stored for loaders that returned None, so repeated lookups of missing data stay cheap
+NEGATIVE = "\x00none"
+
+_RELEASE_LOCK = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.cache_refresh_workers, thread_name_prefix="cache")
+        return _executor
+
+
+def _redis():
+    from app.db.redis import get_redis
+
+    return get_redis()
+
+
+# Entries are fresh for soft_ttl seconds and served stale until ttl while one caller
+# reloads them in the background. In Redis the age is derived from the remaining TTL,
+# so values keep their plain format and can be written by other code with SET ... EX.
+# Subclasses override queue_read / queue_write to keep a value in another Redis type.
+class Cache:
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        soft_ttl: float | None = None,
+        negative_ttl: float = 0,
+        encode: Callable[[Any], str] = str,
+        decode: Callable[[str], Any] = str,
+        local: bool = False,
+        maxsize: int = 10_000,
+        loader_stores: bool = False,
+        near: bool = False,
+    ) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.soft_ttl = ttl if soft_ttl is None else soft_ttl
+        self.negative_ttl = negative_ttl
+        self.encode = encode
+        self.decode = decode
+        # loader_stores: the loader writes the value itself (e.g. together with derived keys)
+        self.loader_stores = loader_stores
+        # near: serve repeat reads from the Redis near-cache when it is enabled
+        self.near = near
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl) if local else None
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _read(self, key: str) -> tuple[Any, str]:
+        if self._local is not None:
+            item = self._local.get(key)
+            if item is None:
+                return None, "miss"
+            value, fresh_until = item
+            return value, "fresh" if time.monotonic() < fresh_until else "stale"
+
+        if self.near:
+            from app.db.near_cache import near_get
+
+            raw, expires_at = near_get(key, lambda: self._fetch(key))
+        else:
+            raw, expires_at = self._fetch(key)
+        now = time.monotonic()
+        if raw is None or (expires_at is not None and expires_at <= now):
+            return None, "miss"
+        if raw == NEGATIVE:
+            metrics.inc(f"cache.{self.name}.negative_hits")
+            return None, "fresh"
+        # no expiry: written without a TTL, never stale
+        stale = expires_at is not None and expires_at - now < self.ttl - self.soft_ttl
+        return self.decode(raw), "stale" if stale else "fresh"
+
+    def queue_read(self, pipe, key: str) -> None:
+        pipe.get(key)
+
+    def queue_write(self, pipe, key: str, raw: Any, px: int) -> None:
+        pipe.set(key, raw, px=px)
+
+    def _fetch(self, key: str) -> tuple[Any, float | None]:
+        pipe = _redis().pipeline(transaction=False)
+        self.queue_read(pipe, key)
+        pipe.pttl(key)
+        raw, pttl = pipe.execute()
+        # an empty read (no key, or an empty collection) is a miss
+        if not raw:
+            return None, None
+        # kept as a deadline so a near-cached copy keeps ageing
+        return raw, time.monotonic() + pttl / 1000 if pttl >= 0 else None
+
+    def peek(self, key: str) -> Any:
+        try:
+            value, _ = self._read(key)
+        except Exception:
+            metrics.inc(f"cache.{self.name}.errors")
+            return None
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self._local is not None:
+            ttl = self.negative_ttl if value is None else self.ttl
+            if ttl > 0:
+                self._local.set(key, (value, time.monotonic() + min(self.soft_ttl, ttl)), ttl=ttl)
+            return
+        pipe = _redis().pipeline(transaction=False)
+        self.queue_set(pipe, key, value)
+        pipe.execute()
+
+    def queue_set(self, pipe, key: str, value: Any) -> None:
+        if value is None:
+            if self.negative_ttl > 0:
+                pipe.set(key, NEGATIVE, px=int(self.negative_ttl * 1000))
+            return
+        self.queue_write(pipe, key, self.encode(value), int(self.ttl * 1000))
+
+    def invalidate(self, key: str) -> None:
+        if self._local is not None:
+            self._local.pop(key)
+        else:
+            _redis().delete(key)
+
+    def get(self, key: str, loader: Callable[[], Any], refresh: Callable[[], Any] | None = None) -> Any:
+        # refresh runs on a background thread: pass one that does not use request-scoped state
+        try:
+            value, state = self._read(key)
+        except Exception:
+            metrics.inc(f"cache.{self.name}.errors")
+            value, state = None, "miss"
+        if state == "fresh":
+            metrics.inc(f"cache.{self.name}.hits")
+            return value
+        if state == "stale":
+            metrics.inc(f"cache.{self.name}.stale")
+            self._refresh_async(key, refresh or loader)
+            return value
+        metrics.inc(f"cache.{self.name}.misses")
+        return self._single_flight(key, loader)
+
+    def _single_flight(self, key: str, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            metrics.inc(f"cache.{self.name}.coalesced")
+            return future.result()
+        try:
+            token = self._acquire(key)
+            found, value = self._wait_for(key) if token is None else (False, None)
+            if not found:
+                value = self._load_and_store(key, loader, token)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _acquire(self, key: str) -> str | None:
+        if self._local is not None:
+            return "local"
+        token = uuid.uuid4().hex
+        try:
+            if _redis().set(f"lock:{key}", token, nx=True, px=int(settings.cache_lock_timeout * 1000)):
+                return token
+        except Exception:
+            # without Redis every process loads on its own
+            return "unlocked"
+        return None
+
+    def _release(self, key: str, token: str) -> None:
+        if self._local is not None or token == "unlocked":
+            return
+        try:
+            _redis().eval(_RELEASE_LOCK, 1, f"lock:{key}", token)
+        except Exception:
+            pass
+
+    def _wait_for(self, key: str) -> tuple[bool, Any]:
+        # another process is loading: wait for its value instead of repeating the query
+        deadline = time.monotonic() + settings.cache_lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(0.025)
+            try:
+                value, state = self._read(key)
+            except Exception:
+                break
+            if state != "miss":
+                metrics.inc(f"cache.{self.name}.coalesced")
+                return True, value
+        return False, None
+
+    def _load_and_store(self, key: str, loader: Callable[[], Any], token: str | None) -> Any:
+        try:
+            started = time.perf_counter()
+            value = loader()
+            metrics.observe(f"cache.{self.name}.load", time.perf_counter() - started)
+            if not self.loader_stores:
+                try:
+                    self.set(key, value)
+                except Exception:
+                    metrics.inc(f"cache.{self.name}.errors")
+            return value
+        finally:
+            if token is not None:
+                self._release(key, token)
+
+    def _refresh_async(self, key: str, loader: Callable[[], Any]) -> None:
+        with self._lock:
+            if key in self._inflight:
+                metrics.inc(f"cache.{self.name}.coalesced")
+                return
+            future = self._inflight[key] = Future()
+
+        def _run() -> None:
+            try:
+                token = self._acquire(key)
+                if token is None:
+                    # another process is already refreshing this key
+                    future.set_result(None)
+                    return
+                metrics.inc(f"cache.{self.name}.refreshes")
+                future.set_result(self._load_and_store(key, loader, token))
+            except BaseException as e:
+                metrics.inc(f"cache.{self.name}.errors")
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+        try:
+            _get_executor().submit(_run)
+        except RuntimeError:
+            with self._lock:
+                self._inflight.pop(key, None)
@@ -0,0 +1,267 @@
+import json
+import os
+import shutil
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import chain
+
+import numpy as np
+from scipy import sparse
+
+HEAVY_MIN_DF = 5000
+MAX_HEAVY = 16
+
+_MATRICES = ("light", "light_t", "goals", "friends")
+_ARRAYS = ("user_ids", "heavy_mask", "patterns", "pattern_indptr", "pattern_rows")
+
+
+# score(u, v) = |features(u) ∩ features(v)| over catalog goals and habit kinds.
+# Columns shared by many users ("heavy", e.g. the few catalog goals) would make the
+# sparse product dense, so they are kept as a per-user bitmask and scored through
+# groups of users with the same mask instead.
+@dataclass
+class Bipartite:
+    user_ids: np.ndarray
+    light: sparse.csr_matrix
+    light_t: sparse.csr_matrix
+    goals: sparse.csr_matrix
+    friends: sparse.csr_matrix
+    heavy_mask: np.ndarray
+    patterns: np.ndarray
+    pattern_indptr: np.ndarray
+    pattern_rows: np.ndarray
+
+
+def _csr(rows: list[list[int]], n_cols: int) -> sparse.csr_matrix:
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in rows], out=indptr[1:])
+    indices = np.fromiter(chain.from_iterable(rows), dtype=np.int32, count=int(indptr[-1]))
+    data = np.ones(len(indices), dtype=np.int32)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), n_cols))
+
+
+def build(rows: Iterable[dict], heavy_min_df: int = HEAVY_MIN_DF, max_heavy: int = MAX_HEAVY) -> Bipartite:
+    user_ids: list[int] = []
+    goal_cols: dict[int, int] = {}
+    kind_cols: dict[str, int] = {}
+    goal_rows: list[list[int]] = []
+    kind_rows: list[list[int]] = []
+    friend_ids: list[list[int]] = []
+
+    for row in rows:
+        if user_ids and row["user_id"] <= user_ids[-1]:
+            raise ValueError("rows must be ordered by user_id")
+        user_ids.append(int(row["user_id"]))
+        goal_rows.append(sorted({goal_cols.setdefault(g, len(goal_cols)) for g in row["goals"]}))
+        kind_rows.append(sorted({kind_cols.setdefault(k, len(kind_cols)) for k in row["kinds"]}))
+        friend_ids.append(row["friends"])
+
+    index = {uid: i for i, uid in enumerate(user_ids)}
+    friend_rows = [sorted({index[f] for f in ids if f in index}) for ids in friend_ids]
+
+    goals = _csr(goal_rows, len(goal_cols))
+    features = sparse.hstack([goals, _csr(kind_rows, len(kind_cols))], format="csr", dtype=np.int32)
+
+    df = np.bincount(features.indices, minlength=features.shape[1])
+    by_df = np.argsort(-df, kind="stable")[: min(max_heavy, 62)]
+    heavy = np.sort(by_df[df[by_df] >= heavy_min_df])
+    light_cols = np.setdiff1d(np.arange(features.shape[1]), heavy)
+
+    by_col = features.tocsc()
+    heavy_mask = np.zeros(len(user_ids), dtype=np.int64)
+    for bit, col in enumerate(heavy):
+        heavy_mask[by_col.indices[by_col.indptr[col] : by_col.indptr[col + 1]]] |= np.int64(1) << bit
+    patterns, inverse = np.unique(heavy_mask, return_inverse=True)
+    pattern_rows = np.argsort(inverse, kind="stable").astype(np.int64)
+    pattern_indptr = np.zeros(len(patterns) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(inverse, minlength=len(patterns)), out=pattern_indptr[1:])
+
+    light = features[:, light_cols].tocsr()
+    return Bipartite(
+        user_ids=np.asarray(user_ids, dtype=np.int64),
+        light=light,
+        light_t=light.T.tocsr(),
+        goals=goals,
+        friends=_csr(friend_rows, len(user_ids)),
+        heavy_mask=heavy_mask,
+        patterns=patterns,
+        pattern_indptr=pattern_indptr,
+        pattern_rows=pattern_rows,
+    )
+
+
+def save(bp: Bipartite, directory: str) -> None:
+    tmp = f"{directory}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in _ARRAYS:
+        np.save(os.path.join(tmp, f"{name}.npy"), getattr(bp, name))
+    meta = {}
+    for name in _MATRICES:
+        m: sparse.csr_matrix = getattr(bp, name)
+        for part in ("data", "indices", "indptr"):
+            np.save(os.path.join(tmp, f"{name}.{part}.npy"), getattr(m, part))
+        meta[name] = list(m.shape)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    # swap the whole directory so readers never see a half-written set
+    old = f"{directory}.old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, old)
+    os.replace(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _load_array(path: str) -> np.ndarray:
+    try:
+        # plain ndarray view over the mapping, memmap indexing is noticeably slower
+        return np.asarray(np.load(path, mmap_mode="r"))
+    except ValueError:
+        # empty arrays cannot be memory-mapped
+        return np.load(path)
+
+
+def load(directory: str) -> Bipartite:
+    with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+
+    def _matrix(name: str) -> sparse.csr_matrix:
+        parts = tuple(_load_array(os.path.join(directory, f"{name}.{p}.npy")) for p in ("data", "indices", "indptr"))
+        return sparse.csr_matrix(parts, shape=tuple(meta[name]), copy=False)
+
+    return Bipartite(
+        **{name: _load_array(os.path.join(directory, f"{name}.npy")) for name in _ARRAYS},
+        **{name: _matrix(name) for name in _MATRICES},
+    )
+
+
+def _top_k(cols: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    if len(cols) > k:
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = np.flatnonzero(scores > threshold)
+        # rows are ordered by user_id, so the lowest columns win ties like ORDER BY user_id
+        tied = np.flatnonzero(scores == threshold)
+        tied = tied[np.argsort(cols[tied], kind="stable")][: k - len(above)]
+        pick = np.concatenate([above, tied])
+        cols, scores = cols[pick], scores[pick]
+    order = np.lexsort((cols, -scores))
+    return cols[order], scores[order]
+
+
+def _first_eligible(members: np.ndarray, excluded: np.ndarray, k: int) -> np.ndarray:
+    # excluded is sorted, membership through searchsorted
+    take = k
+    while True:
+        head = members[:take]
+        pos = np.minimum(np.searchsorted(excluded, head), len(excluded) - 1)
+        head = head[excluded[pos] != head]
+        if len(head) >= k or take >= len(members):
+            return head[:k]
+        take *= 2
+
+
+def top_k_rows(bp: Bipartite, start: int, stop: int, k: int) -> list[tuple[int, list[dict]]]:
+    block = bp.light[start:stop] @ bp.light_t
+    block.sort_indices()
+
+    selected: list[tuple[int, np.ndarray, np.ndarray]] = []
+    for i in range(stop - start):
+        row = start + i
+        cols = block.indices[block.indptr[i] : block.indptr[i + 1]]
+        scores = block.data[block.indptr[i] : block.indptr[i + 1]].astype(np.int64)
+        friends = bp.friends.indices[bp.friends.indptr[row] : bp.friends.indptr[row + 1]]
+        keep = cols != row
+        if len(friends):
+            keep &= ~np.isin(cols, friends)
+        cols, scores = cols[keep], scores[keep]
+
+        mask = int(bp.heavy_mask[row])
+        if mask:
+            scores = scores + np.bitwise_count(bp.heavy_mask[cols] & mask)
+            # users without a light overlap score only through the heavy mask: within
+            # one mask group they tie, so the first k eligible ids are enough
+            excluded = np.sort(np.concatenate([cols, friends, [row]]))
+            cand_cols, cand_scores = [cols], [scores]
+            overlaps = np.bitwise_count(bp.patterns & mask)
+            collected = 0
+            for overlap in sorted(set(overlaps[overlaps > 0].tolist()), reverse=True):
+                for p in np.flatnonzero(overlaps == overlap):
+                    head = _first_eligible(
+                        bp.pattern_rows[bp.pattern_indptr[p] : bp.pattern_indptr[p + 1]], excluded, k
+                    )
+                    cand_cols.append(head)
+                    cand_scores.append(np.full(len(head), overlap, dtype=np.int64))
+                    collected += len(head)
+                # lower levels cannot beat k candidates that already score at least this much
+                if collected + int(np.count_nonzero(scores >= overlap)) >= k:
+                    break
+            cols, scores = np.concatenate(cand_cols), np.concatenate(cand_scores)
+
+        cols, scores = _top_k(cols, scores, k)
+        selected.append((row, cols, scores))
+
+    pair_rows = np.concatenate([np.full(len(c), row, dtype=np.int64) for row, c, _ in selected])
+    pair_cols = np.concatenate([c for _, c, _ in selected]).astype(np.int64)
+    if len(pair_rows):
+        shared_goals = np.asarray(bp.goals[pair_rows].multiply(bp.goals[pair_cols]).sum(axis=1)).ravel()
+    else:
+        shared_goals = np.empty(0, dtype=np.int64)
+
+    out: list[tuple[int, list[dict]]] = []
+    offset = 0
+    for row, cols, scores in selected:
+        recs = []
+        for j in range(len(cols)):
+            g = int(shared_goals[offset + j])
+            score = int(scores[j])
+            recs.append(
+                {
+                    "user_id": int(bp.user_ids[cols[j]]),
+                    "shared_goals": g,
+                    "shared_habits": score - g,
+                    "score": score,
+                }
+            )
+        offset += len(cols)
+        out.append((int(bp.user_ids[row]), recs))
+    return out
+
+
+_worker_state: Bipartite | None = None
+
+
+def _init_worker(directory: str) -> None:
+    global _worker_state
+    _worker_state = load(directory)
+
+
+def _worker_block(start: int, stop: int, k: int) -> list[tuple[int, list[dict]]]:
+    assert _worker_state is not None
+    return top_k_rows(_worker_state, start, stop, k)
+
+
+def recompute_all(
+    directory: str,
+    k: int,
+    block_size: int,
+    processes: int,
+) -> Iterator[list[tuple[int, list[dict]]]]:
+    bp = load(directory)
+    n_users = len(bp.user_ids)
+    blocks = [(start, min(n_users, start + block_size)) for start in range(0, n_users, block_size)]
+    if processes <= 1:
+        for start, stop in blocks:
+            yield top_k_rows(bp, start, stop, k)
+        return
+
+    # workers memory-map the same files, so the matrices are shared through the page cache
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(directory,)) as pool:
+        yield from pool.map(
+            _worker_block,
+            [start for start, _ in blocks],
+            [stop for _, stop in blocks],
+            [k] * len(blocks),
+        )
@@ -0,0 +1,28 @@
+_RU_SUFFIXES = sorted(
+    [
+        "ться", "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими",
+        "ать", "ять", "еть", "ить", "ая", "яя", "ое", "ее", "ой", "ей", "ый", "ий",
+        "ые", "ие", "ах", "ях", "ов", "ев", "ом", "ем", "ам", "ям", "ую", "юю",
+        "а", "я", "ы", "и", "у", "ю", "е", "о", "ь",
+    ],
+    key=len,
+    reverse=True,
+)
+_EN_SUFFIXES = ["ing", "ies", "es", "ed", "s"]
+_MIN_STEM = 3
+
+
+def _stem(word: str) -> str:
+    if word.isdigit():
+        return word
+    suffixes = _RU_SUFFIXES if any("а" <= ch <= "я" for ch in word) else _EN_SUFFIXES
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM:
+            return word[: -len(suffix)]
+    return word
+
+
+def habit_kind_key(title: str) -> str:
+    text = title.lower().replace("ё", "е")
+    words = "".join(ch if ch.isalnum() else " " for ch in text).split()
+    return " ".join(_stem(w) for w in words)
@@ -0,0 +1,50 @@
+import threading
+from collections.abc import Callable
+
+_lock = threading.Lock()
+_counters: dict[str, int] = {}
+_gauges: dict[str, Callable[[], float]] = {}
+_timings: dict[str, dict[str, float]] = {}
+
+
+def inc(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def register_gauge(name: str, fn: Callable[[], float]) -> None:
+    with _lock:
+        _gauges[name] = fn
+
+
+def observe(name: str, seconds: float) -> None:
+    with _lock:
+        t = _timings.get(name)
+        if t is None:
+            t = _timings[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+        ms = seconds * 1000
+        t["count"] += 1
+        t["total_ms"] += ms
+        if ms > t["max_ms"]:
+            t["max_ms"] = ms
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timings = {k: dict(v) for k, v in _timings.items()}
+
+    gauge_values: dict[str, float | None] = {}
+    for name, fn in gauges.items():
+        try:
+            gauge_values[name] = fn()
+        except Exception:
+            gauge_values[name] = None
+
+    for t in timings.values():
+        t["avg_ms"] = round(t["total_ms"] / t["count"], 3) if t["count"] else 0.0
+        t["total_ms"] = round(t["total_ms"], 3)
+        t["max_ms"] = round(t["max_ms"], 3)
+
+    return {"counters": counters, "gauges": gauge_values, "timings": timings}
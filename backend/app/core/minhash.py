@@ -0,0 +1,55 @@
+import hashlib
+import random
+
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_rng = random.Random(0x4847)
+_PERMS: list[tuple[int, int]] = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)
+]
+
+
+def _words(text: str) -> list[str]:
+    return [w for w in "".join(ch if ch.isalnum() else " " for ch in text.lower()).split() if w]
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[int]:
+    words = _words(text)
+    if not words:
+        return set()
+    if len(words) <= size:
+        return {_hash64(" ".join(words))}
+    return {_hash64(" ".join(words[i : i + size])) for i in range(len(words) - size + 1)}
+
+
+def signature(text: str) -> list[int] | None:
+    # emoji- or punctuation-only text has no shingles and nothing to compare
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    return [min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes) for a, b in _PERMS]
+
+
+def band_keys(sig: list[int]) -> list[str]:
+    out: list[str] = []
+    for band in range(BANDS):
+        rows = sig[band * ROWS : (band + 1) * ROWS]
+        raw = b"".join(v.to_bytes(4, "big") for v in rows)
+        out.append(f"{band:x}{hashlib.blake2b(raw, digest_size=6).hexdigest()}")
+    return out
+
+
+def similarity_from_bands(matched: int) -> float:
+    if matched <= 0:
+        return 0.0
+    return (matched / BANDS) ** (1.0 / ROWS)
@@ -15,6 +15,20 @@ class Settings(BaseSettings):
     postgres_password: str = "habitgraph"
     postgres_db: str = "habitgraph"
     postgres_dsn: str | None = None
+    postgres_pool_size: int = 5
+    postgres_max_overflow: int = 10
+    postgres_pool_timeout: float = 30.0
+    postgres_pool_recycle: int = 1800
+    postgres_pre_ping: str = "idle"
+    postgres_pre_ping_idle_seconds: float = 30.0
+    postgres_statement_timeout_ms: int = 30_000
+    postgres_replica_dsns: str | None = None
+    postgres_shard_dsns: str | None = None
+    shard_directory_cache_seconds: float = 2.0
+    shard_scatter_workers: int = 8
+    postgres_replica_max_lag: float = 5.0
+    postgres_replica_check_interval: float = 1.0
+    postgres_read_your_writes_seconds: float = 5.0
 
     mongo_host: str | None = None
     mongo_port: int = 27017
@@ -27,6 +41,12 @@ class Settings(BaseSettings):
     redis_port: int = 6379
     redis_db: int = 0
     redis_url: str | None = None
+    redis_near_cache: bool = False
+    redis_near_cache_prefixes: str = "streak:,user:,goals:"
+    redis_near_cache_max_keys: int = 50_000
+    redis_near_cache_max_value_bytes: int = 2048
+    redis_near_cache_ttl: float = 300.0
+    redis_near_cache_ping_interval: float = 5.0
 
     qdrant_host: str | None = None
     qdrant_port: int = 6333
@@ -38,12 +58,68 @@ class Settings(BaseSettings):
     neo4j_user: str = "neo4j"
     neo4j_password: str = "habitgraph"
     neo4j_uri: str | None = None
+    neo4j_cluster_uri: str | None = None
+    neo4j_database: str | None = None
+    neo4j_max_pool_size: int = 100
+    neo4j_acquisition_timeout: float = 60.0
+    neo4j_fetch_size: int = 1000
+    neo4j_max_retry_time: float = 15.0
+    neo4j_read_your_writes_seconds: float = 5.0
 
     rabbitmq_host: str | None = None
     rabbitmq_port: int = 5672
     rabbitmq_user: str = "guest"
     rabbitmq_password: str = "guest"
     rabbitmq_url: str | None = None
+    rabbitmq_queue_size: int = 10_000
+    rabbitmq_batch_size: int = 100
+    rabbitmq_flush_interval: float = 0.05
+    rabbitmq_reconnect_max_delay: float = 30.0
+    rabbitmq_confirm_timeout: float = 10.0
+
+    event_bus: str = "rabbitmq"
+    worker_concurrency: int = 8
+    worker_pool: str = "thread"
+    worker_prefetch: int = 32
+    worker_dedup_ttl_seconds: int = 24 * 3600
+    worker_claim_ttl_seconds: int = 60
+
+    recs_debounce_seconds: float = 30.0
+    recs_fanout_limit: int = 500
+    recs_recompute_interval: float = 1.0
+    recs_matrix_dir: str = "/tmp/habitgraph/recs"
+    recs_block_size: int = 2000
+    recs_processes: int = 0
+
+    outbox_batch_size: int = 200
+    outbox_poll_interval: float = 0.5
+    outbox_max_attempts: int = 20
+    outbox_retry_base_seconds: float = 1.0
+    outbox_retry_max_seconds: float = 300.0
+
+    diary_dedup_mode: str = "flag"
+    diary_dedup_threshold: float = 0.85
+
+    goal_catalog_check_interval: float = 5.0
+
+    cache_lock_timeout: float = 5.0
+    cache_lock_wait: float = 1.0
+    cache_refresh_workers: int = 4
+    streak_soft_ttl_seconds: int = 600
+    recs_soft_ttl_seconds: int = 6 * 3600
+
+    social_fof_fanout: int = 200
+
+    user_cache_local_size: int = 10_000
+    user_cache_local_ttl: float = 5.0
+    user_cache_ttl_seconds: int = 300
+
+    checkin_archive_after_days: int = 90
+    checkin_archive_batch_size: int = 5000
+
+    feed_max_items: int = 500
+    feed_fanout_limit: int = 1000
+    feed_ttl_seconds: int = 30 * 24 * 3600
 
     def _slug(self, value: str) -> str:
         out = []
@@ -80,6 +156,19 @@ class Settings(BaseSettings):
         host = self.postgres_host or self.db_host
         return f"postgresql+psycopg2://{self.postgres_user}:{self.postgres_password}@{host}:{self.postgres_port}/{self.effective_postgres_db()}"
 
+    def postgres_replica_dsn_list(self) -> list[str]:
+        if not self.postgres_replica_dsns:
+            return []
+        return [dsn.strip() for dsn in self.postgres_replica_dsns.split(",") if dsn.strip()]
+
+    def postgres_shard_dsn_list(self) -> list[str]:
+        if not self.postgres_shard_dsns:
+            return []
+        return [dsn.strip() for dsn in self.postgres_shard_dsns.split(",") if dsn.strip()]
+
+    def redis_near_cache_prefix_list(self) -> list[str]:
+        return [p.strip() for p in self.redis_near_cache_prefixes.split(",") if p.strip()]
+
     def mongo_url(self) -> str:
         if self.mongo_uri:
             return self.mongo_uri
@@ -0,0 +1,138 @@
+import datetime as dt
+from collections import defaultdict
+from collections.abc import Iterable
+
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.db.models import Checkin, CheckinArchive
+
+# the dashboard week and the overview read only the hot table
+MIN_ARCHIVE_DAYS = 8
+
+
+def encode(dates: Iterable[dt.date]) -> tuple[dt.date, bytes]:
+    dates = sorted(set(dates))
+    start = dates[0]
+    bits = 0
+    for d in dates:
+        bits |= 1 << (d - start).days
+    return start, bits.to_bytes(((dates[-1] - start).days + 8) // 8, "little")
+
+
+def decode(start: dt.date, days: bytes) -> list[dt.date]:
+    bits = int.from_bytes(days, "little")
+    out = []
+    offset = 0
+    while bits:
+        if bits & 1:
+            out.append(start + dt.timedelta(days=offset))
+        bits >>= 1
+        offset += 1
+    return out
+
+
+def has_date(row: CheckinArchive, date: dt.date) -> bool:
+    offset = (date - row.start_date).days
+    if offset < 0 or offset >= len(row.days) * 8:
+        return False
+    return bool(row.days[offset // 8] >> (offset % 8) & 1)
+
+
+def get_archive(db: Session, user_id: int, habit_id: int) -> CheckinArchive | None:
+    return db.get(CheckinArchive, (user_id, habit_id))
+
+
+def archive_summaries(db: Session, user_id: int, habit_ids: list[int]) -> dict[int, tuple[int, dt.date]]:
+    if not habit_ids:
+        return {}
+    rows = db.execute(
+        select(CheckinArchive.habit_id, CheckinArchive.total, CheckinArchive.last_date).where(
+            CheckinArchive.user_id == user_id, CheckinArchive.habit_id.in_(habit_ids)
+        )
+    ).all()
+    return {r.habit_id: (int(r.total), r.last_date) for r in rows}
+
+
+def checkin_dates(
+    db: Session,
+    user_id: int,
+    habit_id: int,
+    since: dt.date | None = None,
+    until: dt.date | None = None,
+) -> list[dt.date]:
+    query = select(Checkin.date).where(Checkin.user_id == user_id, Checkin.habit_id == habit_id)
+    if since is not None:
+        query = query.where(Checkin.date >= since)
+    if until is not None:
+        query = query.where(Checkin.date <= until)
+    dates = set(db.scalars(query))
+
+    row = get_archive(db, user_id, habit_id)
+    if row is not None and (since is None or row.last_date >= since):
+        dates.update(
+            d for d in decode(row.start_date, row.days) if (since is None or d >= since) and (until is None or d <= until)
+        )
+    return sorted(dates)
+
+
+def archive_batch(db: Session, cutoff: dt.date, batch_size: int) -> list[tuple[int, int]]:
+    # one transaction: rows leave the hot table and land in the archive together
+    moved = db.execute(
+        text(
+            "DELETE FROM checkins WHERE id IN ("
+            "SELECT id FROM checkins WHERE date < :cutoff ORDER BY date LIMIT :n FOR UPDATE SKIP LOCKED"
+            ") RETURNING user_id, habit_id, date"
+        ),
+        {"cutoff": cutoff, "n": batch_size},
+    ).all()
+    if not moved:
+        db.rollback()
+        return []
+
+    by_pair: dict[tuple[int, int], set[dt.date]] = defaultdict(set)
+    for user_id, habit_id, date in moved:
+        by_pair[(user_id, habit_id)].add(date)
+
+    pairs = sorted(by_pair)
+    existing = {
+        (row.user_id, row.habit_id): row
+        for row in db.scalars(
+            select(CheckinArchive)
+            .where(tuple_(CheckinArchive.user_id, CheckinArchive.habit_id).in_(pairs))
+            .with_for_update()
+        )
+    }
+    values = []
+    for pair in pairs:
+        dates = by_pair[pair]
+        row = existing.get(pair)
+        if row is not None:
+            dates |= set(decode(row.start_date, row.days))
+        start, days = encode(dates)
+        values.append(
+            {
+                "user_id": pair[0],
+                "habit_id": pair[1],
+                "start_date": start,
+                "days": days,
+                "total": len(dates),
+                "last_date": max(dates),
+            }
+        )
+    stmt = insert(CheckinArchive).values(values)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[CheckinArchive.user_id, CheckinArchive.habit_id],
+            set_={
+                "start_date": stmt.excluded.start_date,
+                "days": stmt.excluded.days,
+                "total": stmt.excluded.total,
+                "last_date": stmt.excluded.last_date,
+                "updated_at": func.now(),
+            },
+        )
+    )
+    db.commit()
+    return pairs
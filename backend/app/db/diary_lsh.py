@@ -0,0 +1,52 @@
+from app.core.minhash import band_keys, similarity_from_bands
+from app.db.redis import get_redis
+
+LSH_PREFIX = "diary:lsh"
+
+
+def lsh_key(user_id: int, prefix: str = LSH_PREFIX) -> str:
+    return f"{prefix}:{user_id}"
+
+
+def find_duplicate(
+    user_id: int,
+    sig: list[int] | None,
+    threshold: float,
+    prefix: str = LSH_PREFIX,
+) -> tuple[str, float] | None:
+    if sig is None:
+        return None
+    r = get_redis()
+    values = r.hmget(lsh_key(user_id, prefix), band_keys(sig))
+
+    matches: dict[str, int] = {}
+    for entry_id in values:
+        if entry_id:
+            matches[entry_id] = matches.get(entry_id, 0) + 1
+    if not matches:
+        return None
+
+    entry_id, matched = max(matches.items(), key=lambda kv: (kv[1], kv[0]))
+    score = similarity_from_bands(matched)
+    if score < threshold:
+        return None
+    return entry_id, score
+
+
+def index_entry(user_id: int, entry_id: str, sig: list[int] | None, prefix: str = LSH_PREFIX) -> None:
+    if sig is None:
+        return
+    r = get_redis()
+    r.hset(lsh_key(user_id, prefix), mapping={band: entry_id for band in band_keys(sig)})
+
+
+def remove_entry(user_id: int, entry_id: str, sig: list[int] | None, prefix: str = LSH_PREFIX) -> None:
+    if sig is None:
+        return
+    r = get_redis()
+    key = lsh_key(user_id, prefix)
+    bands = band_keys(sig)
+    values = r.hmget(key, bands)
+    owned = [band for band, value in zip(bands, values) if value == entry_id]
+    if owned:
+        r.hdel(key, *owned)
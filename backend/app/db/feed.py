@@ -0,0 +1,126 @@
+import json
+
+from app.core.settings import settings
+from app.db.redis import get_redis
+
+HUBS_KEY = "feed:hubs"
+# a hub re-syncs its friends' follow sets at most this often, covering friendships missed on the way
+HUB_SYNC_SECONDS = 3600
+
+
+def feed_key(user_id: int) -> str:
+    return f"feed:{user_id}"
+
+
+def author_key(user_id: int) -> str:
+    return f"feed:author:{user_id}"
+
+
+def follows_key(user_id: int) -> str:
+    # hubs among the user's friends; no TTL, so the read path never needs the friend list
+    return f"feed:follows:{user_id}"
+
+
+def _hub_sync_key(author_id: int) -> str:
+    return f"feed:hubsync:{author_id}"
+
+
+def _sync_follows(r, author_id: int, friend_ids: list[int], follow: bool) -> None:
+    pipe = r.pipeline(transaction=False)
+    for i, friend_id in enumerate(friend_ids, start=1):
+        if follow:
+            pipe.sadd(follows_key(friend_id), str(author_id))
+        else:
+            pipe.srem(follows_key(friend_id), str(author_id))
+        if i % 500 == 0:
+            pipe.execute()
+    pipe.execute()
+
+
+def follow_if_hub(user_id: int, friend_user_id: int) -> None:
+    r = get_redis()
+    pipe = r.pipeline(transaction=False)
+    pipe.sismember(HUBS_KEY, str(user_id))
+    pipe.sismember(HUBS_KEY, str(friend_user_id))
+    user_is_hub, friend_is_hub = pipe.execute()
+    pipe = r.pipeline(transaction=False)
+    if user_is_hub:
+        pipe.sadd(follows_key(friend_user_id), str(user_id))
+    if friend_is_hub:
+        pipe.sadd(follows_key(user_id), str(friend_user_id))
+    pipe.execute()
+
+
+def fan_out(author_id: int, friend_ids: list[int], item: dict, score: int) -> None:
+    r = get_redis()
+    member = json.dumps(item, ensure_ascii=False, sort_keys=True)
+    cap = settings.feed_max_items
+
+    pipe = r.pipeline(transaction=False)
+    pipe.zadd(author_key(author_id), {member: score})
+    pipe.zremrangebyrank(author_key(author_id), 0, -cap - 1)
+    pipe.expire(author_key(author_id), settings.feed_ttl_seconds)
+    if len(friend_ids) > settings.feed_fanout_limit:
+        # too many timelines to write: friends pull this author's items on read instead
+        pipe.sadd(HUBS_KEY, str(author_id))
+        pipe.set(_hub_sync_key(author_id), 1, nx=True, ex=HUB_SYNC_SECONDS)
+        _, _, _, _, synced = pipe.execute()
+        if synced:
+            try:
+                _sync_follows(r, author_id, friend_ids, follow=True)
+            except Exception:
+                r.delete(_hub_sync_key(author_id))
+                raise
+        return
+    pipe.srem(HUBS_KEY, str(author_id))
+    pipe.delete(_hub_sync_key(author_id))
+    _, _, _, was_hub, _ = pipe.execute()
+    if was_hub:
+        _sync_follows(r, author_id, friend_ids, follow=False)
+    pipe = r.pipeline(transaction=False)
+    for i, friend_id in enumerate(friend_ids, start=1):
+        key = feed_key(friend_id)
+        pipe.zadd(key, {member: score})
+        pipe.zremrangebyrank(key, 0, -cap - 1)
+        pipe.expire(key, settings.feed_ttl_seconds)
+        if i % 500 == 0:
+            pipe.execute()
+    pipe.execute()
+
+
+def parse_cursor(cursor: str | None) -> tuple[str, int]:
+    if not cursor:
+        return "+inf", 0
+    score, skip = cursor.split(":", 1)
+    return str(int(score)), int(skip)
+
+
+def _next_cursor(items: list[tuple[str, float]], max_score: str, skip: int) -> str:
+    last = int(items[-1][1])
+    ties = sum(1 for _, score in items if int(score) == last)
+    if max_score != "+inf" and int(max_score) == last:
+        ties += skip
+    return f"{last}:{ties}"
+
+
+def read_feed(user_id: int, limit: int, cursor: str | None) -> tuple[list[dict], str | None]:
+    max_score, skip = parse_cursor(cursor)
+    r = get_redis()
+    pipe = r.pipeline(transaction=False)
+    pipe.zrevrangebyscore(feed_key(user_id), max_score, "-inf", start=skip, num=limit, withscores=True)
+    pipe.smembers(follows_key(user_id))
+    items, hubs = pipe.execute()
+
+    if hubs:
+        # merge in hub friends' own timelines; equal scores keep Redis order (member desc)
+        pipe = r.pipeline(transaction=False)
+        pipe.zrevrangebyscore(feed_key(user_id), max_score, "-inf", start=0, num=limit + skip, withscores=True)
+        for hub in hubs:
+            pipe.zrevrangebyscore(author_key(int(hub)), max_score, "-inf", start=0, num=limit + skip, withscores=True)
+        merged = {member: score for chunk in pipe.execute() for member, score in chunk}
+        ordered = sorted(merged.items(), key=lambda kv: (kv[1], kv[0]), reverse=True)
+        # the first `skip` entries are the ties at the cursor score already returned
+        items = ordered[skip : skip + limit]
+
+    next_cursor = _next_cursor(items, max_score, skip) if len(items) == limit else None
+    return [json.loads(member) for member, _ in items], next_cursor
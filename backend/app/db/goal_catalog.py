@@ -0,0 +1,98 @@
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from app.core import metrics
+from app.core.cache import Cache
+from app.core.settings import settings
+from app.db.near_cache import cached_get
+from app.db.neo4j import GOAL_CATALOG, ensure_goal_catalog, list_goal_catalog
+from app.db.redis import get_redis
+
+CATALOG_VERSION_KEY = "goals:catalog:version"
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: str
+    items: tuple[Mapping[str, object], ...]
+    by_id: Mapping[int, Mapping[str, object]]
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+
+def _snapshot(items: list[dict]) -> CatalogSnapshot:
+    frozen = tuple(MappingProxyType(dict(item)) for item in items)
+    raw = json.dumps(items, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return CatalogSnapshot(
+        version=hashlib.sha1(raw).hexdigest()[:16],
+        items=frozen,
+        by_id=MappingProxyType({int(item["id"]): item for item in frozen}),
+    )
+
+
+_CACHE_KEY = "catalog"
+
+_current: CatalogSnapshot | None = None
+_seen_version: str | None = None
+_lock = threading.Lock()
+# fresh for the check interval, then served as is while one thread compares versions
+_cache = Cache("goal_catalog", ttl=24 * 3600, soft_ttl=settings.goal_catalog_check_interval, local=True, maxsize=1)
+
+
+def _install(snapshot: CatalogSnapshot, seen_version: str | None) -> CatalogSnapshot:
+    global _current, _seen_version
+    _current = snapshot
+    _seen_version = seen_version
+    _cache.set(_CACHE_KEY, snapshot)
+    return snapshot
+
+
+def seed_goal_catalog() -> CatalogSnapshot:
+    with _lock:
+        try:
+            ensure_goal_catalog(force=True)
+            snapshot = _snapshot(list_goal_catalog())
+        except Exception:
+            snapshot = _snapshot([dict(goal) for goal in GOAL_CATALOG])
+        try:
+            get_redis().set(CATALOG_VERSION_KEY, snapshot.version)
+        except Exception:
+            pass
+        return _install(snapshot, snapshot.version)
+
+
+def publish_goal_catalog_version() -> None:
+    snapshot = _snapshot(list_goal_catalog())
+    get_redis().set(CATALOG_VERSION_KEY, snapshot.version)
+
+
+def _refresh(remote_version: str | None) -> CatalogSnapshot:
+    try:
+        snapshot = _snapshot(list_goal_catalog())
+    except Exception:
+        return _current or _snapshot([dict(goal) for goal in GOAL_CATALOG])
+    metrics.inc("goal_catalog.refreshes")
+    return _install(snapshot, remote_version)
+
+
+def _load() -> CatalogSnapshot:
+    current = _current
+    if current is None:
+        return seed_goal_catalog()
+    try:
+        remote_version = cached_get(CATALOG_VERSION_KEY)
+    except Exception:
+        return current
+    if remote_version == _seen_version:
+        return current
+    return _refresh(remote_version)
+
+
+def get_goal_catalog() -> CatalogSnapshot:
+    return _cache.get(_CACHE_KEY, _load)
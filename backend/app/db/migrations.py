@@ -0,0 +1,198 @@
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from sqlalchemy import Connection, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, ProgrammingError
+
+from app.db.models import Base, CheckinArchive, OutboxDeadEvent
+
+# arbitrary constant shared by every process that migrates this database
+_LOCK_KEY = 0x48616269
+
+
+def _baseline(conn: Connection) -> None:
+    Base.metadata.create_all(bind=conn)
+    # columns added to pre-existing tables before versioned migrations existed
+    for statement in (
+        "ALTER TABLE habits ADD COLUMN IF NOT EXISTS frequency VARCHAR(32)",
+        "ALTER TABLE habits ADD COLUMN IF NOT EXISTS target_value INTEGER",
+        "ALTER TABLE habits ADD COLUMN IF NOT EXISTS target_unit VARCHAR(32)",
+        "ALTER TABLE habits ADD COLUMN IF NOT EXISTS reminder_time VARCHAR(16)",
+        "ALTER TABLE habits ADD COLUMN IF NOT EXISTS goal_id INTEGER",
+        "ALTER TABLE habits ADD COLUMN IF NOT EXISTS is_archived BOOLEAN NOT NULL DEFAULT FALSE",
+        "ALTER TABLE goals ADD COLUMN IF NOT EXISTS catalog_id INTEGER",
+        "ALTER TABLE goals ADD COLUMN IF NOT EXISTS description VARCHAR(255)",
+        "ALTER TABLE goals ADD COLUMN IF NOT EXISTS is_archived BOOLEAN NOT NULL DEFAULT FALSE",
+    ):
+        conn.execute(text(statement))
+    conn.execute(
+        text(
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.key_column_usage
+                    WHERE table_schema = 'public' AND table_name = 'habits' AND column_name = 'goal_id'
+                ) THEN
+                    ALTER TABLE habits
+                        ADD CONSTRAINT habits_goal_id_fkey
+                        FOREIGN KEY (goal_id) REFERENCES goals(id) ON DELETE SET NULL;
+                END IF;
+            END $$
+            """
+        )
+    )
+
+
+def _user_search_indexes(conn: Connection) -> None:
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS users_username_lower_prefix_idx "
+            "ON users (lower(username) text_pattern_ops)"
+        )
+    )
+    # the extension may need a superuser; search falls back to ILIKE without it
+    try:
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS users_username_trgm_idx "
+                    "ON users USING gin (lower(username) gin_trgm_ops)"
+                )
+            )
+    except DBAPIError:
+        pass
+
+
+def _user_shard_directory(conn: Connection) -> None:
+    # only read on the main database, shards keep an empty copy
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS user_shards ("
+            "user_id BIGINT PRIMARY KEY, "
+            "shard INTEGER NOT NULL, "
+            "moving BOOLEAN NOT NULL DEFAULT FALSE, "
+            "updated_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        )
+    )
+    conn.execute(text("CREATE INDEX IF NOT EXISTS user_shards_shard_idx ON user_shards (shard)"))
+
+
+def _checkin_archive(conn: Connection) -> None:
+    Base.metadata.create_all(bind=conn, tables=[CheckinArchive.__table__])
+    # the archive job scans old rows by date
+    conn.execute(text("CREATE INDEX IF NOT EXISTS checkins_date_idx ON checkins (date)"))
+
+
+def _outbox_retry(conn: Connection) -> None:
+    conn.execute(
+        text("ALTER TABLE outbox ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now()")
+    )
+    # the relay looks up rows waiting for a retry on every batch
+    conn.execute(text("CREATE INDEX IF NOT EXISTS outbox_next_attempt_idx ON outbox (next_attempt_at)"))
+
+
+_BIGINT_COLUMNS = {
+    "users": ("id",),
+    "goals": ("id", "user_id"),
+    "habits": ("id", "user_id", "goal_id"),
+    "checkins": ("id", "user_id", "habit_id"),
+    "checkin_archive": ("user_id", "habit_id"),
+}
+
+
+def _bigint_ids(conn: Connection) -> None:
+    # sharded sequences step by 1024, which would exhaust int4 ids after ~2M rows per shard;
+    # one ALTER per table so each table is rewritten once
+    for table, columns in _BIGINT_COLUMNS.items():
+        clauses = ", ".join(f"ALTER COLUMN {column} TYPE BIGINT" for column in columns)
+        conn.execute(text(f"ALTER TABLE {table} {clauses}"))
+    for table in ("users", "goals", "habits", "checkins"):
+        sequence = conn.scalar(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": table})
+        conn.execute(text(f"ALTER SEQUENCE {sequence} AS BIGINT"))
+
+
+def _outbox_dead_letter(conn: Connection) -> None:
+    conn.execute(text("ALTER TABLE outbox ADD COLUMN IF NOT EXISTS user_id BIGINT"))
+    # published events carry the user inside the event payload
+    conn.execute(
+        text(
+            "UPDATE outbox "
+            "SET user_id = CAST(COALESCE(payload->>'user_id', payload->'payload'->>'user_id') AS BIGINT) "
+            "WHERE user_id IS NULL"
+        )
+    )
+    conn.execute(text("CREATE INDEX IF NOT EXISTS outbox_user_idx ON outbox (user_id, id)"))
+    Base.metadata.create_all(bind=conn, tables=[OutboxDeadEvent.__table__])
+
+
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "baseline", _baseline),
+    (2, "user_search_indexes", _user_search_indexes),
+    (3, "user_shard_directory", _user_shard_directory),
+    (4, "checkin_archive", _checkin_archive),
+    (5, "outbox_retry", _outbox_retry),
+    (6, "bigint_ids", _bigint_ids),
+    (7, "outbox_dead_letter", _outbox_dead_letter),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+@contextmanager
+def migration_lock(engine: Engine) -> Iterator[None]:
+    # the lock migrate() takes per transaction, held here across several transactions
+    with engine.connect() as conn:
+        with conn.begin():
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEY})
+            conn.commit()
+
+
+def is_current(engine: Engine) -> bool:
+    try:
+        with engine.connect() as conn:
+            return (
+                conn.execute(
+                    text("SELECT 1 FROM schema_migrations WHERE version = :v"), {"v": LATEST_VERSION}
+                ).first()
+                is not None
+            )
+    except ProgrammingError:
+        return False
+
+
+def migrate(engine: Engine) -> list[int]:
+    if is_current(engine):
+        return []
+
+    applied_now: list[int] = []
+    with engine.begin() as conn:
+        # waiting for the lock and building indexes may outlast POSTGRES_STATEMENT_TIMEOUT_MS
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        # released at commit; waiting processes then see the versions applied here
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+        conn.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "version INTEGER PRIMARY KEY, "
+                "name VARCHAR(128) NOT NULL, "
+                "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            )
+        )
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+        for version, name, fn in MIGRATIONS:
+            if version in applied:
+                continue
+            fn(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                {"v": version, "n": name},
+            )
+            applied_now.append(version)
+    return applied_now
@@ -0,0 +1,185 @@
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import redis
+
+from app.core import metrics
+from app.core.lru import TTLCache
+from app.core.settings import settings
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+_MISSING = object()
+
+
+def _size(value: Any) -> int:
+    if isinstance(value, tuple):
+        return sum(_size(v) for v in value)
+    return len(value) if isinstance(value, str) else 0
+
+
+# In-process copy of hot keys kept coherent with Redis client tracking: the server sends
+# the names of modified keys under the tracked prefixes to a subscribed connection, and
+# the entries are dropped. While that connection is down reads go straight to Redis.
+class NearCache:
+    def __init__(self, prefixes: list[str], max_keys: int, max_value_bytes: int, ttl: float) -> None:
+        self.prefixes = tuple(prefixes)
+        self.max_keys = max_keys
+        self.max_value_bytes = max_value_bytes
+        # the TTL only bounds staleness if an invalidation is lost
+        self._entries = TTLCache(maxsize=max_keys, ttl=ttl)
+        self._loading: dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._ready = False
+        self._thread: threading.Thread | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="redis-near-cache", daemon=True)
+        self._thread.start()
+
+    def get(self, key: str, fetch: Callable[[], Any]) -> Any:
+        if not self._ready or not key.startswith(self.prefixes):
+            return fetch()
+        value = self._entries.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            metrics.inc("redis.near_cache.hits")
+            return value
+        self.misses += 1
+        metrics.inc("redis.near_cache.misses")
+
+        # an invalidation that arrives while the value is in flight drops the token,
+        # so a value read before the write is never stored after it
+        token = object()
+        with self._lock:
+            self._loading[key] = token
+            generation = self._generation
+        try:
+            value = fetch()
+        except BaseException:
+            with self._lock:
+                if self._loading.get(key) is token:
+                    del self._loading[key]
+            raise
+        with self._lock:
+            if self._loading.get(key) is token:
+                del self._loading[key]
+                if self._ready and generation == self._generation and _size(value) <= self.max_value_bytes:
+                    self._entries.set(key, value)
+        return value
+
+    def invalidate(self, keys: list[str] | None) -> None:
+        with self._lock:
+            if keys is None:
+                # FLUSHDB / FLUSHALL
+                self._loading.clear()
+                self._entries.clear()
+            else:
+                for key in keys:
+                    self._loading.pop(key, None)
+                    self._entries.pop(key)
+        metrics.inc("redis.near_cache.invalidations")
+
+    def _reset(self, ready: bool) -> None:
+        with self._lock:
+            self._ready = ready
+            self._generation += 1
+            self._loading.clear()
+            self._entries.clear()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                metrics.inc("redis.near_cache.disconnects")
+            self._reset(ready=False)
+            time.sleep(1.0)
+
+    def _listen(self) -> None:
+        pool = redis.ConnectionPool.from_url(settings.redis_connection_url(), decode_responses=True)
+        subscriber = pool.make_connection()
+        tracker = pool.make_connection()
+        try:
+            subscriber.send_command("CLIENT", "ID")
+            subscriber_id = subscriber.read_response()
+            subscriber.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+            subscriber.read_response()
+
+            # RESP2 tracking: BCAST sends every change under the prefixes to the subscriber,
+            # so any pooled connection can read the keys
+            args: list[Any] = ["CLIENT", "TRACKING", "ON", "REDIRECT", subscriber_id, "BCAST"]
+            for prefix in self.prefixes:
+                args += ["PREFIX", prefix]
+            tracker.send_command(*args)
+            tracker.read_response()
+            self._reset(ready=True)
+
+            while True:
+                if not subscriber.can_read(timeout=settings.redis_near_cache_ping_interval):
+                    # tracking ends with the tracker connection, so a dead one must be noticed
+                    tracker.send_command("PING")
+                    tracker.read_response()
+                    continue
+                message = subscriber.read_response()
+                if isinstance(message, list) and len(message) == 3 and message[0] == "message":
+                    self.invalidate(message[2])
+        finally:
+            subscriber.disconnect()
+            tracker.disconnect()
+            pool.disconnect()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return round(self.hits / total, 4) if total else 0.0
+
+
+_near: NearCache | None = None
+_near_lock = threading.Lock()
+
+
+def get_near_cache() -> NearCache | None:
+    global _near
+    if not settings.redis_near_cache:
+        return None
+    if _near is None:
+        with _near_lock:
+            if _near is None:
+                near = NearCache(
+                    prefixes=settings.redis_near_cache_prefix_list(),
+                    max_keys=settings.redis_near_cache_max_keys,
+                    max_value_bytes=settings.redis_near_cache_max_value_bytes,
+                    ttl=settings.redis_near_cache_ttl,
+                )
+                metrics.register_gauge("redis.near_cache.entries", lambda: len(near))
+                metrics.register_gauge("redis.near_cache.max_keys", lambda: near.max_keys)
+                # values are capped per key, so this bounds the payload the cache can hold
+                metrics.register_gauge("redis.near_cache.max_value_bytes_total", lambda: near.max_keys * near.max_value_bytes)
+                metrics.register_gauge("redis.near_cache.hit_ratio", near.hit_ratio)
+                near.start()
+                _near = near
+    return _near
+
+
+def near_get(key: str, fetch: Callable[[], Any]) -> Any:
+    near = get_near_cache()
+    if near is None:
+        return fetch()
+    return near.get(key, fetch)
+
+
+def cached_get(key: str) -> str | None:
+    from app.db.redis import get_redis
+
+    return near_get(key, lambda: get_redis().get(key))
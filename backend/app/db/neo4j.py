@@ -1,9 +1,23 @@
-from neo4j import GraphDatabase
+import json
+import threading
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
 
+from neo4j import READ_ACCESS, WRITE_ACCESS, Bookmarks, GraphDatabase
+
+from app.core import metrics
+from app.core.habit_kind import habit_kind_key
+from app.core.lru import TTLCache
 from app.core.settings import settings
 
 _driver = None
 _ready = False
+_catalog_ready = False
+_in_use = 0
+_in_use_lock = threading.Lock()
+# bookmarks of a user's last graph write: their next reads wait until a follower has it
+_bookmarks = TTLCache(maxsize=10_000, ttl=settings.neo4j_read_your_writes_seconds)
 
 GOAL_CATALOG: list[dict[str, object]] = [
     {
@@ -27,172 +41,409 @@ GOAL_CATALOG: list[dict[str, object]] = [
 def get_driver():
     global _driver
     if _driver is None:
+        # a neo4j:// cluster URI enables routing: execute_read goes to followers/read replicas
         _driver = GraphDatabase.driver(
-            settings.neo4j_bolt_uri(), auth=(settings.neo4j_user, settings.neo4j_password)
+            settings.neo4j_cluster_uri or settings.neo4j_bolt_uri(),
+            auth=(settings.neo4j_user, settings.neo4j_password),
+            max_connection_pool_size=settings.neo4j_max_pool_size,
+            connection_acquisition_timeout=settings.neo4j_acquisition_timeout,
+            max_transaction_retry_time=settings.neo4j_max_retry_time,
+        )
+        metrics.register_gauge("neo4j.pool.in_use", lambda: _in_use)
+        metrics.register_gauge("neo4j.pool.max", lambda: settings.neo4j_max_pool_size)
+        metrics.register_gauge(
+            "neo4j.pool.utilization", lambda: round(_in_use / max(1, settings.neo4j_max_pool_size), 3)
         )
     return _driver
 
 
+def _bookmark_key(user_id: int) -> str:
+    return f"neo4j:bookmarks:{user_id}"
+
+
+def _remember_bookmarks(user_ids: set[int], bookmarks: Bookmarks) -> None:
+    values = sorted(bookmarks.raw_values)
+    if not values:
+        return
+    for user_id in user_ids:
+        _bookmarks.set(user_id, values)
+    try:
+        from app.db.redis import get_redis
+
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.set(_bookmark_key(user_id), json.dumps(values), px=int(settings.neo4j_read_your_writes_seconds * 1000))
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def _bookmarks_for(user_id: int) -> Bookmarks | None:
+    values = _bookmarks.get(user_id)
+    if values is None:
+        try:
+            from app.db.redis import get_redis
+
+            raw = get_redis().get(_bookmark_key(user_id))
+        except Exception:
+            raw = None
+        if raw is None:
+            return None
+        values = json.loads(raw)
+    metrics.inc("neo4j.read.bookmarked")
+    return Bookmarks.from_raw_values(values)
+
+
+@contextmanager
+def _session(access_mode: str, bookmarks: Bookmarks | None = None):
+    global _in_use
+    driver = get_driver()
+    with _in_use_lock:
+        _in_use += 1
+    try:
+        with driver.session(
+            database=settings.neo4j_database,
+            default_access_mode=access_mode,
+            fetch_size=settings.neo4j_fetch_size,
+            bookmarks=bookmarks,
+        ) as session:
+            yield session
+    finally:
+        with _in_use_lock:
+            _in_use -= 1
+
+
+def _run_tx(
+    access_mode: str,
+    work: Callable,
+    bookmarks: Bookmarks | None = None,
+    written_by: set[int] | None = None,
+):
+    attempts = 0
+
+    def counted(tx):
+        nonlocal attempts
+        attempts += 1
+        if attempts > 1:
+            metrics.inc("neo4j.retries")
+        return work(tx)
+
+    kind = "read" if access_mode == READ_ACCESS else "write"
+    started = time.monotonic()
+    try:
+        with _session(access_mode, bookmarks) as session:
+            if access_mode == READ_ACCESS:
+                return session.execute_read(counted)
+            result = session.execute_write(counted)
+            if written_by:
+                _remember_bookmarks(written_by, session.last_bookmarks())
+            return result
+    except Exception:
+        metrics.inc(f"neo4j.{kind}_errors")
+        raise
+    finally:
+        metrics.observe(f"neo4j.{kind}", time.monotonic() - started)
+
+
+def _read(query: str, reader: int | None = None, **params) -> list[dict]:
+    # reader: the user the result is shown to, so it reflects that user's own writes
+    _ensure_schema()
+    bookmarks = _bookmarks_for(reader) if reader is not None else None
+    return _run_tx(READ_ACCESS, lambda tx: [dict(r) for r in tx.run(query, **params)], bookmarks=bookmarks)
+
+
+def _write(query: str, written_by: set[int] | None = None, **params) -> None:
+    _ensure_schema()
+    _run_tx(WRITE_ACCESS, lambda tx: tx.run(query, **params).consume(), written_by=written_by)
+
+
 def _ensure_schema() -> None:
     global _ready
     if _ready:
         return
-    driver = get_driver()
-    with driver.session() as session:
-        session.run("CREATE CONSTRAINT user_id IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE")
-        session.run("CREATE CONSTRAINT goal_id IF NOT EXISTS FOR (g:Goal) REQUIRE g.id IS UNIQUE")
-        session.run("CREATE CONSTRAINT habit_id IF NOT EXISTS FOR (h:Habit) REQUIRE h.id IS UNIQUE")
+    for statement in (
+        "CREATE CONSTRAINT user_id IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE",
+        "CREATE CONSTRAINT goal_id IF NOT EXISTS FOR (g:Goal) REQUIRE g.id IS UNIQUE",
+        "CREATE CONSTRAINT habit_id IF NOT EXISTS FOR (h:Habit) REQUIRE h.id IS UNIQUE",
+        "CREATE CONSTRAINT habit_kind_key IF NOT EXISTS FOR (k:HabitKind) REQUIRE k.key IS UNIQUE",
+    ):
+        _run_tx(WRITE_ACCESS, lambda tx, statement=statement: tx.run(statement).consume())
     _ready = True
 
 
 def upsert_user(user_id: int, username: str) -> None:
-    _ensure_schema()
-    driver = get_driver()
-    with driver.session() as session:
-        session.run(
-            "MERGE (u:User {id: $id}) SET u.username = $username",
-            id=user_id,
-            username=username,
-        )
+    upsert_users([{"user_id": user_id, "username": username}])
 
 
 def link_user_goal(user_id: int, goal_id: int) -> None:
-    ensure_goal_catalog()
-    driver = get_driver()
-    with driver.session() as session:
-        session.run(
-            """
-            MERGE (u:User {id: $user_id})
-            WITH u
-            MATCH (g:Goal {id: $goal_id, catalog: true})
-            MERGE (u)-[:HAS_GOAL]->(g)
-            """,
-            user_id=user_id,
-            goal_id=goal_id,
-        )
+    link_user_goals([{"user_id": user_id, "goal_id": goal_id}])
 
 
 def unlink_user_goal(user_id: int, goal_id: int) -> None:
-    _ensure_schema()
-    driver = get_driver()
-    with driver.session() as session:
-        session.run(
-            """
-            MATCH (u:User {id: $user_id})-[r:HAS_GOAL]->(g:Goal {id: $goal_id})
-            DELETE r
-            """,
-            user_id=user_id,
-            goal_id=goal_id,
-        )
+    unlink_user_goals([{"user_id": user_id, "goal_id": goal_id}])
 
 
 def link_user_habit(user_id: int, habit_id: int, title: str) -> None:
-    _ensure_schema()
-    driver = get_driver()
-    with driver.session() as session:
-        session.run(
-            """
-            MERGE (u:User {id: $user_id})
-            MERGE (h:Habit {id: $habit_id})
-            SET h.title = $title
-            MERGE (u)-[:HAS_HABIT]->(h)
-            """,
-            user_id=user_id,
-            habit_id=habit_id,
-            title=title,
-        )
+    link_user_habits([{"user_id": user_id, "habit_id": habit_id, "title": title}])
+
+
+def _write_batch(query: str, rows: list[dict], written_by: set[int] | None = None) -> None:
+    if not rows:
+        return
+    _write(query, written_by=written_by, rows=rows)
+
+
+def upsert_users(rows: list[dict]) -> None:
+    _write_batch(
+        """
+        UNWIND $rows AS row
+        MERGE (u:User {id: row.user_id})
+        SET u.username = row.username
+        """,
+        rows,
+    )
+
+
+_LINK_HABITS_QUERY = """
+UNWIND $rows AS row
+MERGE (u:User {id: row.user_id})
+MERGE (h:Habit {id: row.habit_id})
+SET h.title = row.title
+MERGE (u)-[:HAS_HABIT]->(h)
+MERGE (k:HabitKind {key: row.kind})
+ON CREATE SET k.title = row.title
+WITH h, k
+OPTIONAL MATCH (h)-[old:OF_KIND]->(prev:HabitKind)
+WHERE prev <> k
+DELETE old
+WITH DISTINCT h, k
+MERGE (h)-[:OF_KIND]->(k)
+"""
+
+
+def link_user_habits(rows: list[dict]) -> None:
+    # Cypher runs each clause for every row before the next, so two rows for one habit
+    # (create, then rename) would both MERGE an OF_KIND edge; the last row wins
+    latest = {row["habit_id"]: row for row in rows}
+    _write_batch(
+        _LINK_HABITS_QUERY,
+        [{**row, "kind": habit_kind_key(row["title"])} for row in latest.values()],
+    )
+
+
+def link_user_goals(rows: list[dict]) -> None:
+    if not rows:
+        return
+    ensure_goal_catalog()
+    _write_batch(
+        """
+        UNWIND $rows AS row
+        MERGE (u:User {id: row.user_id})
+        WITH u, row
+        MATCH (g:Goal {id: row.goal_id, catalog: true})
+        MERGE (u)-[:HAS_GOAL]->(g)
+        """,
+        rows,
+    )
+
+
+def unlink_user_goals(rows: list[dict]) -> None:
+    _write_batch(
+        """
+        UNWIND $rows AS row
+        MATCH (u:User {id: row.user_id})-[r:HAS_GOAL]->(g:Goal {id: row.goal_id})
+        DELETE r
+        """,
+        rows,
+    )
 
 
 def add_friend(user_id: int, friend_user_id: int) -> None:
-    _ensure_schema()
-    driver = get_driver()
-    with driver.session() as session:
-        session.run(
-            """
-            MERGE (u:User {id: $user_id})
-            MERGE (v:User {id: $friend_user_id})
-            MERGE (u)-[:FRIEND]->(v)
-            MERGE (v)-[:FRIEND]->(u)
-            """,
-            user_id=user_id,
-            friend_user_id=friend_user_id,
-        )
+    add_friends([{"user_id": user_id, "friend_user_id": friend_user_id}])
+
+
+def add_friends(rows: list[dict]) -> None:
+    _write_batch(
+        """
+        UNWIND $rows AS row
+        MERGE (u:User {id: row.user_id})
+        MERGE (v:User {id: row.friend_user_id})
+        MERGE (u)-[:FRIEND]->(v)
+        MERGE (v)-[:FRIEND]->(u)
+        """,
+        rows,
+        written_by={row["user_id"] for row in rows} | {row["friend_user_id"] for row in rows},
+    )
 
 
 def list_friends(user_id: int) -> list[dict]:
-    _ensure_schema()
-    driver = get_driver()
-    with driver.session() as session:
-        result = session.run(
-            """
-            MATCH (u:User {id: $user_id})-[:FRIEND]->(f:User)
-            RETURN f.id AS user_id, f.username AS username
-            ORDER BY f.username ASC, f.id ASC
-            """,
-            user_id=user_id,
-        )
-        return [dict(r) for r in result]
+    return _read(
+        """
+        MATCH (u:User {id: $user_id})-[:FRIEND]->(f:User)
+        RETURN f.id AS user_id, f.username AS username
+        ORDER BY f.username ASC, f.id ASC
+        """,
+        reader=user_id,
+        user_id=user_id,
+    )
 
 
 def recommend_users(user_id: int, limit: int = 10) -> list[dict]:
-    _ensure_schema()
-    driver = get_driver()
-    with driver.session() as session:
-        result = session.run(
-            """
-            MATCH (me:User {id: $user_id})
-            MATCH (other:User)
-            WHERE other.id <> me.id AND NOT (me)-[:FRIEND]->(other)
-            OPTIONAL MATCH (me)-[:HAS_GOAL]->(g:Goal)<-[:HAS_GOAL]-(other)
-            OPTIONAL MATCH (me)-[:HAS_HABIT]->(h:Habit)<-[:HAS_HABIT]-(other)
-            WITH other, count(DISTINCT g) AS shared_goals, count(DISTINCT h) AS shared_habits
-            WITH other, shared_goals, shared_habits, (shared_goals + shared_habits) AS score
-            WHERE score > 0
-            RETURN other.id AS user_id, other.username AS username, shared_goals, shared_habits, score
-            ORDER BY score DESC, user_id ASC
-            LIMIT $limit
-            """,
-            user_id=user_id,
-            limit=limit,
-        )
-        return [dict(r) for r in result]
+    return _read(
+        """
+        MATCH (me:User {id: $user_id})
+        CALL {
+            WITH me
+            MATCH (me)-[:HAS_GOAL]->(g:Goal)<-[:HAS_GOAL]-(other:User)
+            WHERE other <> me
+            RETURN other, count(DISTINCT g) AS shared_goals, 0 AS shared_habits
+            UNION ALL
+            WITH me
+            MATCH (me)-[:HAS_HABIT]->(:Habit)-[:OF_KIND]->(k:HabitKind)<-[:OF_KIND]-(:Habit)<-[:HAS_HABIT]-(other:User)
+            WHERE other <> me
+            RETURN other, 0 AS shared_goals, count(DISTINCT k) AS shared_habits
+        }
+        WITH me, other, sum(shared_goals) AS shared_goals, sum(shared_habits) AS shared_habits
+        WHERE NOT (me)-[:FRIEND]->(other)
+        WITH other, shared_goals, shared_habits, (shared_goals + shared_habits) AS score
+        RETURN other.id AS user_id, other.username AS username, shared_goals, shared_habits, score
+        ORDER BY score DESC, user_id ASC
+        LIMIT $limit
+        """,
+        user_id=user_id,
+        limit=limit,
+    )
 
 
-def ensure_goal_catalog() -> None:
-    _ensure_schema()
-    driver = get_driver()
-    with driver.session() as session:
-        for goal in GOAL_CATALOG:
-            session.run(
-                """
-                MERGE (g:Goal {id: $id})
-                SET g.title = $title,
-                    g.description = $description,
-                    g.catalog = true
-                """,
-                id=goal["id"],
-                title=goal["title"],
-                description=goal.get("description"),
-            )
+# the fan-out caps keep the neighbours with the smallest id hash salted by the caller: a
+# sample that is stable across pages but does not favour the lowest (oldest) ids.
+# 950706376 is a full-period multiplier modulo 2^31 - 1, so no product overflows int64
+_SAMPLE_MODULUS = 2_147_483_647
+_SAMPLE_MULTIPLIER = 950_706_376
+
+
+def _sample_salt(user_id: int) -> int:
+    return (user_id * 742_938_285 + 1) % _SAMPLE_MODULUS
+
+
+def recommend_friends_of_friends(
+    user_id: int,
+    limit: int = 10,
+    fanout: int = 200,
+    after: tuple[int, int] | None = None,
+) -> list[dict]:
+    return _read(
+        """
+        MATCH (me:User {id: $user_id})
+        CALL {
+            WITH me
+            MATCH (me)-[:FRIEND]->(f:User)
+            RETURN f
+            ORDER BY ((f.id % $modulus) * $multiplier + $salt) % $modulus, f.id
+            LIMIT $fanout
+        }
+        CALL {
+            WITH f
+            MATCH (f)-[:FRIEND]->(fof:User)
+            RETURN fof
+            ORDER BY ((fof.id % $modulus) * $multiplier + $salt) % $modulus, fof.id
+            LIMIT $fanout
+        }
+        WITH me, fof, count(DISTINCT f) AS mutual_friends
+        WHERE fof <> me AND NOT (me)-[:FRIEND]->(fof)
+        OPTIONAL MATCH (me)-[:HAS_GOAL]->(g:Goal)<-[:HAS_GOAL]-(fof)
+        WITH fof, mutual_friends, count(DISTINCT g) AS shared_goals
+        WITH fof, mutual_friends, shared_goals, (mutual_friends + shared_goals) AS score
+        WHERE $after_score IS NULL
+           OR score < $after_score
+           OR (score = $after_score AND fof.id > $after_id)
+        RETURN fof.id AS user_id, fof.username AS username, mutual_friends, shared_goals,
+               0 AS shared_habits, score
+        ORDER BY score DESC, user_id ASC
+        LIMIT $limit
+        """,
+        reader=user_id,
+        user_id=user_id,
+        limit=limit,
+        fanout=fanout,
+        modulus=_SAMPLE_MODULUS,
+        multiplier=_SAMPLE_MULTIPLIER,
+        salt=_sample_salt(user_id),
+        after_score=after[0] if after else None,
+        after_id=after[1] if after else None,
+    )
+
+
+def export_user_features(after: int, limit: int) -> list[dict]:
+    return _read(
+        """
+        MATCH (u:User) WHERE u.id > $after
+        WITH u ORDER BY u.id ASC LIMIT $limit
+        RETURN u.id AS user_id,
+               [(u)-[:HAS_GOAL]->(g:Goal) | g.id] AS goals,
+               [(u)-[:HAS_HABIT]->(:Habit)-[:OF_KIND]->(k:HabitKind) | k.key] AS kinds,
+               [(u)-[:FRIEND]->(f:User) | f.id] AS friends
+        ORDER BY user_id ASC
+        """,
+        after=after,
+        limit=limit,
+    )
+
+
+def users_sharing_with(user_id: int, limit: int = 500) -> list[int]:
+    rows = _read(
+        """
+        MATCH (me:User {id: $user_id})
+        CALL {
+            WITH me
+            MATCH (me)-[:HAS_GOAL]->(:Goal)<-[:HAS_GOAL]-(other:User)
+            RETURN other
+            UNION
+            WITH me
+            MATCH (me)-[:HAS_HABIT]->(:Habit)-[:OF_KIND]->(:HabitKind)<-[:OF_KIND]-(:Habit)<-[:HAS_HABIT]-(other:User)
+            RETURN other
+        }
+        WITH other
+        WHERE other.id <> $user_id
+        RETURN other.id AS user_id
+        LIMIT $limit
+        """,
+        user_id=user_id,
+        limit=limit,
+    )
+    return [int(r["user_id"]) for r in rows]
+
+
+def ensure_goal_catalog(force: bool = False) -> None:
+    global _catalog_ready
+    if _catalog_ready and not force:
+        return
+    _write_batch(
+        """
+        UNWIND $rows AS row
+        MERGE (g:Goal {id: row.id})
+        SET g.title = row.title,
+            g.description = row.description,
+            g.catalog = true
+        """,
+        [{"id": g["id"], "title": g["title"], "description": g.get("description")} for g in GOAL_CATALOG],
+    )
+    _catalog_ready = True
 
 
 def list_goal_catalog() -> list[dict]:
     ensure_goal_catalog()
-    driver = get_driver()
-    with driver.session() as session:
-        result = session.run(
-            """
-            MATCH (g:Goal {catalog: true})
-            RETURN g.id AS id, g.title AS title, g.description AS description
-            ORDER BY g.id ASC
-            """
-        )
-        return [dict(r) for r in result]
+    return _read(
+        """
+        MATCH (g:Goal {catalog: true})
+        RETURN g.id AS id, g.title AS title, g.description AS description
+        ORDER BY g.id ASC
+        """
+    )
 
 
 def clear_goal_graph() -> None:
-    _ensure_schema()
-    driver = get_driver()
-    with driver.session() as session:
-        session.run("MATCH ()-[r:HAS_GOAL]->() DELETE r")
-        session.run("MATCH (g:Goal) DETACH DELETE g")
+    global _catalog_ready
+    _catalog_ready = False
+    _write("MATCH ()-[r:HAS_GOAL]->() DELETE r")
+    _write("MATCH (g:Goal) DETACH DELETE g")
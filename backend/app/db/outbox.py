@@ -0,0 +1,262 @@
+import datetime as dt
+import time
+import uuid
+from collections.abc import Callable
+from itertools import groupby
+
+from sqlalchemy import delete, exists, func, insert, literal_column, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.core import metrics
+from app.core.settings import settings
+from app.db.models import OutboxDeadEvent, OutboxEvent
+
+UPSERT_USER = "graph.upsert_user"
+LINK_HABIT = "graph.link_habit"
+LINK_GOAL = "graph.link_goal"
+UNLINK_GOAL = "graph.unlink_goal"
+RECOMPUTE_STREAK = "streak.recompute"
+PUBLISH_EVENT = "event.publish"
+
+
+def outbox_user_id(payload: dict) -> int | None:
+    # published events carry the user inside the event payload
+    user_id = payload.get("user_id")
+    if user_id is None and isinstance(payload.get("payload"), dict):
+        user_id = payload["payload"].get("user_id")
+    return user_id
+
+
+def add_outbox(db: Session, kind: str, payload: dict) -> None:
+    db.add(OutboxEvent(kind=kind, payload=payload, user_id=outbox_user_id(payload)))
+
+
+def add_outbox_event(db: Session, routing_key: str, payload: dict) -> None:
+    add_outbox(
+        db,
+        PUBLISH_EVENT,
+        {
+            "routing_key": routing_key,
+            "payload": payload,
+            "event_id": uuid.uuid4().hex,
+            "occurred_at_ms": int(time.time() * 1000),
+        },
+    )
+
+
+class EventSink:
+    def __init__(self) -> None:
+        self._channel = None
+
+    def publish(self, rows: list[dict]) -> None:
+        if settings.event_bus == "local":
+            from app.workers.bus import get_local_bus
+
+            bus = get_local_bus()
+            for row in rows:
+                bus.publish(
+                    row["routing_key"],
+                    row["payload"],
+                    event_id=row.get("event_id"),
+                    occurred_at_ms=row.get("occurred_at_ms"),
+                )
+            return
+
+        from app.db.rabbitmq import ConfirmChannel, build_event
+
+        amqp_url = settings.rabbitmq_amqp_url()
+        if not amqp_url:
+            return
+        if self._channel is None or not self._channel.is_open:
+            self.close()
+            self._channel = ConfirmChannel(amqp_url, settings.rabbitmq_confirm_timeout)
+        try:
+            nacked = self._channel.publish_batch(
+                [
+                    build_event(
+                        row["routing_key"],
+                        row["payload"],
+                        event_id=row.get("event_id"),
+                        occurred_at_ms=row.get("occurred_at_ms"),
+                    )
+                    for row in rows
+                ],
+            )
+        except Exception:
+            self.close()
+            raise
+        if nacked:
+            # the rows stay in the outbox and are published again; consumers drop copies by message_id
+            raise RuntimeError(f"RabbitMQ nacked {len(nacked)} of {len(rows)} events")
+
+    def close(self) -> None:
+        if self._channel is not None:
+            self._channel.close()
+        self._channel = None
+
+
+def _recompute_streaks(db: Session, sink: EventSink, rows: list[dict]) -> None:
+    from app.db.redis import STREAK_MILESTONES, compute_and_store_streak
+
+    milestones: list[dict] = []
+    for row in rows:
+        streak = compute_and_store_streak(
+            db=db,
+            user_id=row["user_id"],
+            habit_id=row["habit_id"],
+            end_date=dt.date.fromisoformat(row["date"]),
+        )
+        if streak in STREAK_MILESTONES:
+            milestones.append(
+                {
+                    "routing_key": "habits.streak.milestone",
+                    "payload": {**row, "streak": streak},
+                    # stable id: a retried batch must not announce the milestone twice
+                    "event_id": f"streak:{row['user_id']}:{row['habit_id']}:{row['date']}:{streak}",
+                    "occurred_at_ms": int(time.time() * 1000),
+                }
+            )
+    if milestones:
+        sink.publish(milestones)
+
+
+def _handlers(db: Session, sink: EventSink) -> dict[str, Callable[[list[dict]], None]]:
+    from app.db import neo4j
+
+    return {
+        UPSERT_USER: neo4j.upsert_users,
+        LINK_HABIT: neo4j.link_user_habits,
+        LINK_GOAL: neo4j.link_user_goals,
+        UNLINK_GOAL: neo4j.unlink_user_goals,
+        RECOMPUTE_STREAK: lambda rows: _recompute_streaks(db, sink, rows),
+        PUBLISH_EVENT: sink.publish,
+    }
+
+
+def _apply(db: Session, handler: Callable[[list[dict]], None], rows: list[OutboxEvent]) -> None:
+    # a savepoint keeps the row locks when a handler's own query fails
+    with db.begin_nested():
+        handler([row.payload for row in rows])
+
+
+def _next_attempt_at():
+    seconds = func.least(
+        settings.outbox_retry_base_seconds * func.power(2, OutboxEvent.attempts), settings.outbox_retry_max_seconds
+    )
+    return func.now() + seconds * literal_column("interval '1 second'")
+
+
+def _fail(db: Session, row: OutboxEvent, error: Exception) -> bool:
+    metrics.inc("outbox.failed_rows")
+    if row.attempts + 1 >= settings.outbox_max_attempts:
+        # out of the queue, so the user's later rows stop waiting for it
+        db.execute(
+            insert(OutboxDeadEvent).values(
+                kind=row.kind,
+                payload=row.payload,
+                user_id=row.user_id,
+                attempts=row.attempts + 1,
+                error=f"{type(error).__name__}: {error}"[:1000],
+                created_at=row.created_at,
+            )
+        )
+        db.execute(delete(OutboxEvent).where(OutboxEvent.id == row.id).execution_options(synchronize_session=False))
+        metrics.inc("outbox.dead_rows")
+        return True
+    # the row lock is still held, so no other relay sees the row before its retry time
+    db.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id == row.id)
+        .values(attempts=OutboxEvent.attempts + 1, next_attempt_at=_next_attempt_at())
+        .execution_options(synchronize_session=False)
+    )
+    return False
+
+
+def _relay_rows(
+    rows: list[OutboxEvent],
+    handlers: dict[str, Callable[[list[dict]], None]],
+    apply: Callable[[Callable[[list[dict]], None], list[OutboxEvent]], None],
+    fail: Callable[[OutboxEvent, Exception], bool],
+) -> tuple[list[int], Exception | None]:
+    done: list[int] = []
+    blocked_users: set[int] = set()
+    error: Exception | None = None
+    # consecutive runs of one kind keep the original order across kinds
+    for kind, group in groupby(rows, key=lambda row: row.kind):
+        # rows of a user whose earlier row failed are left for a later batch, behind that row
+        group = [row for row in group if row.user_id not in blocked_users]
+        if not group:
+            continue
+        handler = handlers.get(kind)
+        if handler is None:
+            done.extend(row.id for row in group)
+            continue
+        try:
+            apply(handler, group)
+            done.extend(row.id for row in group)
+            continue
+        except Exception:
+            pass
+        # one row at a time finds the rows that fail; only they are charged an attempt
+        for row in group:
+            if row.user_id in blocked_users:
+                continue
+            try:
+                apply(handler, [row])
+            except Exception as e:
+                error = e
+                # fail() is True when the row was dead-lettered and no longer holds the user back
+                if not fail(row, e) and row.user_id is not None:
+                    blocked_users.add(row.user_id)
+                continue
+            done.append(row.id)
+    return done, error
+
+
+def relay_batch(db: Session, sink: EventSink, batch_size: int | None = None) -> int:
+    waiting = aliased(OutboxEvent)
+    # rows of one user apply in id order: nothing past a row of theirs waiting for its retry
+    query = select(OutboxEvent).where(
+        OutboxEvent.next_attempt_at <= func.now(),
+        ~exists().where(
+            waiting.user_id == OutboxEvent.user_id,
+            waiting.id < OutboxEvent.id,
+            waiting.next_attempt_at > func.now(),
+        ),
+    )
+    rows = db.scalars(
+        query.order_by(OutboxEvent.id).limit(batch_size or settings.outbox_batch_size).with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        db.rollback()
+        return 0
+
+    done, error = _relay_rows(
+        rows,
+        _handlers(db, sink),
+        apply=lambda handler, group: _apply(db, handler, group),
+        fail=lambda row, e: _fail(db, row, e),
+    )
+    if done:
+        db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(done)))
+    db.commit()
+    metrics.inc("outbox.relayed", len(done))
+    if error is not None:
+        metrics.inc("outbox.failed_batches")
+        raise error
+    return len(done)
+
+
+def count_dead(db: Session) -> int:
+    return int(db.scalar(select(func.count(OutboxDeadEvent.id))) or 0)
+
+
+def requeue_dead(db: Session) -> int:
+    # requeued rows get new ids and apply after everything already queued for their user
+    dead = db.scalars(select(OutboxDeadEvent).order_by(OutboxDeadEvent.id).with_for_update()).all()
+    for row in dead:
+        db.add(OutboxEvent(kind=row.kind, payload=row.payload, user_id=row.user_id))
+        db.delete(row)
+    db.commit()
+    return len(dead)
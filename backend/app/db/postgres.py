@@ -1,12 +1,93 @@
-from collections.abc import Generator
+import itertools
+import threading
+import time
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
+from app.core import metrics
+from app.core.lru import TTLCache
 from app.core.settings import settings
-from app.db.models import Base
+from app.db.migrations import migrate
+
+
+class _TimedQueuePool(QueuePool):
+    # QueuePool has no "before checkout" event, so the wait is measured around _do_get
+    metrics_name = "postgres.pool"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.inc(f"{self.metrics_name}.timeouts")
+            raise
+        finally:
+            metrics.observe(f"{self.metrics_name}.checkout_wait", time.perf_counter() - started)
+
+
+def _ping_if_idle(dbapi_conn, record) -> None:
+    # "idle": one SELECT 1 only for connections that sat in the pool long enough to be
+    # dropped by a proxy or failover, instead of a round trip on every checkout
+    if time.monotonic() - record.info.get("checked_in_at", time.monotonic()) < settings.postgres_pre_ping_idle_seconds:
+        return
+    cursor = dbapi_conn.cursor()
+    try:
+        cursor.execute("SELECT 1")
+    except Exception:
+        raise exc.DisconnectionError()
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+
+def create_pooled_engine(dsn: str, metrics_name: str) -> Engine:
+    if settings.postgres_pre_ping not in ("always", "idle", "never"):
+        raise ValueError("POSTGRES_PRE_PING must be 'always', 'idle' or 'never'")
+    connect_args = {}
+    if settings.postgres_statement_timeout_ms > 0:
+        connect_args["options"] = f"-c statement_timeout={settings.postgres_statement_timeout_ms}"
+    pool_class = type("_TimedQueuePool", (_TimedQueuePool,), {"metrics_name": metrics_name})
+    new_engine = create_engine(
+        dsn,
+        poolclass=pool_class,
+        pool_size=settings.postgres_pool_size,
+        max_overflow=settings.postgres_max_overflow,
+        pool_timeout=settings.postgres_pool_timeout,
+        pool_recycle=settings.postgres_pool_recycle,
+        pool_pre_ping=settings.postgres_pre_ping == "always",
+        connect_args=connect_args,
+    )
+    @event.listens_for(new_engine, "checkout")
+    def _on_checkout(dbapi_conn, record, proxy) -> None:
+        record.info["checked_out_at"] = time.perf_counter()
+        metrics.inc(f"{metrics_name}.checkouts")
+        if new_engine.pool.overflow() > 0:
+            metrics.inc(f"{metrics_name}.overflow_checkouts")
+        if settings.postgres_pre_ping == "idle":
+            _ping_if_idle(dbapi_conn, record)
+
+    @event.listens_for(new_engine, "checkin")
+    def _on_checkin(dbapi_conn, record) -> None:
+        checked_out_at = record.info.pop("checked_out_at", None)
+        if checked_out_at is not None:
+            metrics.observe(f"{metrics_name}.held", time.perf_counter() - checked_out_at)
+        record.info["checked_in_at"] = time.monotonic()
+
+    metrics.register_gauge(f"{metrics_name}.in_use", lambda: new_engine.pool.checkedout())
+    metrics.register_gauge(f"{metrics_name}.overflow", lambda: max(0, new_engine.pool.overflow()))
+    metrics.register_gauge(
+        f"{metrics_name}.capacity", lambda: settings.postgres_pool_size + settings.postgres_max_overflow
+    )
+    return new_engine
 
-engine = create_engine(settings.postgres_sqlalchemy_dsn(), pool_pre_ping=True)
+
+engine = create_pooled_engine(settings.postgres_sqlalchemy_dsn(), "postgres.pool")
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 
@@ -43,92 +124,116 @@ def ensure_database_exists() -> None:
 
 
 def init_db() -> None:
-    ensure_database_exists()
-    Base.metadata.create_all(bind=engine)
-    ensure_schema()
-
-
-def _get_columns(conn, table_name: str) -> set[str]:
-    rows = conn.execute(
-        text(
-            "SELECT column_name "
-            "FROM information_schema.columns "
-            "WHERE table_schema='public' AND table_name=:table"
-        ),
-        {"table": table_name},
-    )
-    return {row[0] for row in rows}
-
-
-def _has_fk(conn, table_name: str, column_name: str) -> bool:
-    row = conn.execute(
-        text(
-            "SELECT 1 "
-            "FROM information_schema.key_column_usage "
-            "WHERE table_schema='public' AND table_name=:table AND column_name=:column "
-            "LIMIT 1"
-        ),
-        {"table": table_name, "column": column_name},
-    ).fetchone()
-    return row is not None
-
-
-def ensure_schema() -> None:
-    with engine.begin() as conn:
-        rows = conn.execute(
-            text(
-                "SELECT table_name "
-                "FROM information_schema.tables "
-                "WHERE table_schema='public' AND table_type='BASE TABLE'"
-            )
-        )
-        tables = {row[0] for row in rows}
-
-        if "habits" in tables:
-            cols = _get_columns(conn, "habits")
-            if "frequency" not in cols:
-                conn.execute(text("ALTER TABLE habits ADD COLUMN frequency VARCHAR(32)"))
-            if "target_value" not in cols:
-                conn.execute(text("ALTER TABLE habits ADD COLUMN target_value INTEGER"))
-            if "target_unit" not in cols:
-                conn.execute(text("ALTER TABLE habits ADD COLUMN target_unit VARCHAR(32)"))
-            if "reminder_time" not in cols:
-                conn.execute(text("ALTER TABLE habits ADD COLUMN reminder_time VARCHAR(16)"))
-            if "goal_id" not in cols:
-                conn.execute(text("ALTER TABLE habits ADD COLUMN goal_id INTEGER"))
-            if "is_archived" not in cols:
-                conn.execute(
-                    text("ALTER TABLE habits ADD COLUMN is_archived BOOLEAN NOT NULL DEFAULT FALSE")
-                )
-            if "goals" in tables and not _has_fk(conn, "habits", "goal_id"):
-                try:
-                    conn.execute(
-                        text(
-                            "ALTER TABLE habits "
-                            "ADD CONSTRAINT habits_goal_id_fkey "
-                            "FOREIGN KEY (goal_id) REFERENCES goals(id) ON DELETE SET NULL"
-                        )
-                    )
-                except Exception:
-                    pass
-
-        if "goals" in tables:
-            cols = _get_columns(conn, "goals")
-            if "catalog_id" not in cols:
-                conn.execute(text("ALTER TABLE goals ADD COLUMN catalog_id INTEGER"))
-            if "description" not in cols:
-                conn.execute(text("ALTER TABLE goals ADD COLUMN description VARCHAR(255)"))
-            if "is_archived" not in cols:
-                conn.execute(
-                    text("ALTER TABLE goals ADD COLUMN is_archived BOOLEAN NOT NULL DEFAULT FALSE")
-                )
-
-
-
-
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
     try:
-        yield db
-    finally:
-        db.close()
+        migrate(engine)
+    except OperationalError:
+        # the database itself may be missing on a fresh server
+        ensure_database_exists()
+        migrate(engine)
+
+    from app.db.sharding import init_shards
+
+    init_shards()
+
+
+# replay position equal to receive position means the replica has applied everything
+# it got, so an idle primary does not show up as growing lag
+_LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class _Replica:
+    def __init__(self, index: int, dsn: str):
+        self.index = index
+        self.engine = create_pooled_engine(dsn, f"postgres.replica.{index}.pool")
+        self.sessions = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
+        self.lag: float | None = None
+        self.checked_at = 0.0
+        self._checking = threading.Lock()
+
+    def healthy(self) -> bool:
+        now = time.monotonic()
+        # one thread refreshes the lag, the others keep using the last value
+        if now - self.checked_at >= settings.postgres_replica_check_interval and self._checking.acquire(blocking=False):
+            try:
+                self.lag = _replica_lag(self.engine)
+                self.checked_at = time.monotonic()
+            finally:
+                self._checking.release()
+        return self.lag is not None and self.lag <= settings.postgres_replica_max_lag
+
+
+def _replica_lag(replica_engine: Engine) -> float | None:
+    try:
+        with replica_engine.connect() as conn:
+            return float(conn.scalar(_LAG_QUERY) or 0)
+    except Exception:
+        metrics.inc("postgres.replica.check_errors")
+        return None
+
+
+_replicas = [_Replica(i, dsn) for i, dsn in enumerate(settings.postgres_replica_dsn_list())]
+_next_replica = itertools.count()
+_sticky = TTLCache(maxsize=10_000, ttl=settings.postgres_read_your_writes_seconds)
+
+for _r in _replicas:
+    metrics.register_gauge(f"postgres.replica.{_r.index}.lag_seconds", lambda r=_r: r.lag)
+
+
+def _sticky_key(user_id: int) -> str:
+    return f"rw:sticky:{user_id}"
+
+
+def mark_written(user_id: int) -> None:
+    if not _replicas:
+        return
+    _sticky.set(user_id, True)
+    try:
+        from app.db.redis import get_redis
+
+        get_redis().set(_sticky_key(user_id), 1, px=int(settings.postgres_read_your_writes_seconds * 1000))
+    except Exception:
+        pass
+
+
+def _is_sticky(user_id: int) -> bool:
+    if _sticky.get(user_id):
+        return True
+    try:
+        from app.db.redis import get_redis
+
+        return bool(get_redis().exists(_sticky_key(user_id)))
+    except Exception:
+        # without the shared marker we cannot tell, the primary is always consistent
+        return True
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_write(session: Session, _flush_context) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _stick_after_write(session: Session) -> None:
+    user_id = session.info.get("user_id")
+    if session.info.pop("wrote", False) and user_id is not None:
+        mark_written(user_id)
+
+
+def read_session(user_id: int | None = None) -> Session:
+    if not _replicas:
+        return SessionLocal()
+    if user_id is not None and _is_sticky(user_id):
+        metrics.inc("postgres.read.primary_sticky")
+        return SessionLocal()
+    start = next(_next_replica)
+    for i in range(len(_replicas)):
+        replica = _replicas[(start + i) % len(_replicas)]
+        if replica.healthy():
+            metrics.inc("postgres.read.replica")
+            return replica.sessions()
+    metrics.inc("postgres.read.primary_fallback")
+    return SessionLocal()
+
@@ -2,6 +2,7 @@ import datetime as dt
 import hashlib
 import math
 import uuid
+from collections.abc import Iterator
 
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qm
@@ -24,6 +25,17 @@ def get_qdrant_client() -> QdrantClient:
     return _client
 
 
+def _ensure_payload_indexes(client: QdrantClient, name: str) -> None:
+    for field, schema in (
+        ("user_id", qm.PayloadSchemaType.INTEGER),
+        ("shared", qm.PayloadSchemaType.BOOL),
+    ):
+        try:
+            client.create_payload_index(collection_name=name, field_name=field, field_schema=schema)
+        except Exception:
+            pass
+
+
 def _use_existing_collection(client: QdrantClient, name: str) -> bool:
     global _collection_ready, _collection_name, _vector_size
     try:
@@ -32,6 +44,7 @@ def _use_existing_collection(client: QdrantClient, name: str) -> bool:
         return False
     vectors = info.config.params.vectors
     size = getattr(vectors, "size", DEFAULT_VECTOR_SIZE)
+    _ensure_payload_indexes(client, name)
     _collection_name = name
     _vector_size = int(size)
     _collection_ready = True
@@ -54,6 +67,7 @@ def _ensure_collection() -> None:
             collection_name=primary,
             vectors_config=qm.VectorParams(size=DEFAULT_VECTOR_SIZE, distance=qm.Distance.COSINE),
         )
+        _ensure_payload_indexes(client, primary)
         _collection_name = primary
         _vector_size = DEFAULT_VECTOR_SIZE
         _collection_ready = True
@@ -69,6 +83,23 @@ def _point_id(entry_id: str) -> str:
     return str(uuid.uuid5(uuid.NAMESPACE_URL, f"habitgraph:diary:{entry_id}"))
 
 
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def payload_fingerprint(
+    user_id: int,
+    text_digest: str | None,
+    tags: list[str],
+    mood: str | None,
+    shared: bool = False,
+) -> str:
+    raw = "\x1f".join(
+        [str(user_id), text_digest or "", "\x1e".join(tags or []), mood or "", "1" if shared else "0"]
+    )
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
 def embed_text(text: str) -> list[float]:
     size = _vector_size or DEFAULT_VECTOR_SIZE
     vec = [0.0] * size
@@ -87,38 +118,107 @@ def embed_text(text: str) -> list[float]:
     return [x / norm for x in vec]
 
 
-def upsert_diary_entry(
+def _diary_point(
     entry_id: str,
     user_id: int,
     text: str,
     tags: list[str],
     mood: str | None,
     created_at: dt.datetime,
-) -> None:
-    _ensure_collection()
-    client = get_qdrant_client()
-
+    shared: bool = False,
+) -> qm.PointStruct:
     payload = {
         "entry_id": entry_id,
         "user_id": user_id,
         "tags": tags,
         "mood": mood,
+        "shared": shared,
         "created_at": created_at.isoformat(),
+        "text_hash": text_hash(text),
     }
+    return qm.PointStruct(id=_point_id(entry_id), vector=embed_text(text), payload=payload)
+
+
+def upsert_diary_entry(
+    entry_id: str,
+    user_id: int,
+    text: str,
+    tags: list[str],
+    mood: str | None,
+    created_at: dt.datetime,
+    shared: bool = False,
+) -> None:
+    _ensure_collection()
+    client = get_qdrant_client()
+    client.upsert(
+        collection_name=_collection_name or settings.effective_qdrant_collection(),
+        points=[_diary_point(entry_id, user_id, text, tags, mood, created_at, shared)],
+        wait=True,
+    )
+
+
+def upsert_diary_entries(entries: list[dict]) -> None:
+    if not entries:
+        return
+    _ensure_collection()
+    client = get_qdrant_client()
     client.upsert(
         collection_name=_collection_name or settings.effective_qdrant_collection(),
         points=[
-            qm.PointStruct(
-                id=_point_id(entry_id),
-                vector=embed_text(text),
-                payload=payload,
+            _diary_point(
+                entry_id=e["entry_id"],
+                user_id=e["user_id"],
+                text=e["text"],
+                tags=e.get("tags") or [],
+                mood=e.get("mood"),
+                created_at=e["created_at"],
+                shared=bool(e.get("shared")),
             )
+            for e in entries
         ],
         wait=True,
     )
 
 
-def vector_search_diary(user_id: int, text: str, limit: int = 5) -> list[dict]:
+def diary_point_id(entry_id: str) -> str:
+    return _point_id(entry_id)
+
+
+def scroll_diary_points(batch_size: int = 2000) -> Iterator[tuple[str, dict]]:
+    _ensure_collection()
+    client = get_qdrant_client()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=_collection_name or settings.effective_qdrant_collection(),
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        for p in points:
+            yield str(p.id), p.payload or {}
+        if offset is None:
+            return
+
+
+def _search_filter(user_id: int, friend_ids: list[int] | None) -> qm.Filter:
+    if friend_ids is None:
+        return qm.Filter(must=[qm.FieldCondition(key="user_id", match=qm.MatchValue(value=user_id))])
+    return qm.Filter(
+        must=[
+            qm.FieldCondition(key="user_id", match=qm.MatchAny(any=friend_ids)),
+            qm.FieldCondition(key="shared", match=qm.MatchValue(value=True)),
+        ]
+    )
+
+
+def vector_search_diary(
+    user_id: int,
+    text: str,
+    limit: int = 5,
+    friend_ids: list[int] | None = None,
+) -> list[dict]:
     try:
         _ensure_collection()
     except Exception:
@@ -130,9 +230,7 @@ def vector_search_diary(user_id: int, text: str, limit: int = 5) -> list[dict]:
         collection_name=_collection_name or settings.effective_qdrant_collection(),
         query_vector=query_vector,
         limit=limit,
-        query_filter=qm.Filter(
-            must=[qm.FieldCondition(key="user_id", match=qm.MatchValue(value=user_id))]
-        ),
+        query_filter=_search_filter(user_id, friend_ids),
     )
 
     out: list[dict] = []
@@ -146,10 +244,16 @@ def vector_search_diary(user_id: int, text: str, limit: int = 5) -> list[dict]:
 
 
 def delete_diary_entry(entry_id: str) -> None:
+    delete_diary_points([_point_id(entry_id)])
+
+
+def delete_diary_points(point_ids: list[str]) -> None:
+    if not point_ids:
+        return
     _ensure_collection()
     client = get_qdrant_client()
     client.delete(
         collection_name=_collection_name or settings.effective_qdrant_collection(),
-        points_selector=qm.PointIdsList(points=[_point_id(entry_id)]),
+        points_selector=qm.PointIdsList(points=point_ids),
         wait=True,
     )
@@ -1,35 +1,305 @@
 import json
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
 
 import pika
 
+from app.core import metrics
 from app.core.settings import settings
 
-_connection: pika.BlockingConnection | None = None
-_channel: pika.adapters.blocking_connection.BlockingChannel | None = None
+EXCHANGE = "habitgraph.events"
 
 
-def _get_channel():
-    global _connection, _channel
+@dataclass(frozen=True)
+class OutgoingEvent:
+    routing_key: str
+    body: bytes
+    event_id: str
+    occurred_at_ms: int
+
+
+def build_event(
+    routing_key: str,
+    payload: dict,
+    event_id: str | None = None,
+    occurred_at_ms: int | None = None,
+) -> OutgoingEvent:
+    return OutgoingEvent(
+        routing_key=routing_key,
+        body=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        event_id=event_id or uuid.uuid4().hex,
+        occurred_at_ms=occurred_at_ms or int(time.time() * 1000),
+    )
+
+
+# Publisher confirms on an asynchronous connection: a batch is published without waiting
+# and the broker's acks are collected with one wait per batch. A blocking channel with
+# confirm_delivery() would wait for each message in turn.
+class ConfirmChannel:
+    def __init__(self, amqp_url: str, timeout: float) -> None:
+        self._timeout = timeout
+        self._channel = None
+        self._ready = False
+        self._error: BaseException | None = None
+        self._next_tag = 0
+        self._unconfirmed: dict[int, OutgoingEvent] = {}
+        self._nacked: list[OutgoingEvent] = []
+        self._done: Callable[[], bool] = lambda: True
+        self._connection = pika.SelectConnection(
+            pika.URLParameters(amqp_url),
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_error,
+            on_close_callback=self._on_error,
+        )
+        try:
+            self._run_until(lambda: self._ready)
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def is_open(self) -> bool:
+        return self._ready and self._error is None and self._connection.is_open
+
+    def publish_batch(self, events: list[OutgoingEvent]) -> list[OutgoingEvent]:
+        # returns the events the broker nacked; the caller publishes them again
+        if not self.is_open:
+            raise ConnectionError("RabbitMQ channel is closed")
+        for event in events:
+            self._channel.basic_publish(
+                exchange=EXCHANGE,
+                routing_key=event.routing_key,
+                body=event.body,
+                properties=pika.BasicProperties(
+                    content_type="application/json",
+                    delivery_mode=2,
+                    message_id=event.event_id,
+                    timestamp=event.occurred_at_ms // 1000,
+                    headers={"occurred_at_ms": event.occurred_at_ms},
+                ),
+            )
+            self._next_tag += 1
+            self._unconfirmed[self._next_tag] = event
+        self._run_until(lambda: not self._unconfirmed)
+        nacked, self._nacked = self._nacked, []
+        return nacked
+
+    def close(self) -> None:
+        try:
+            if self._connection.is_open:
+                self._connection.close()
+            if not self._connection.is_closed:
+                self._loop(lambda: self._connection.is_closed, self._timeout)
+        except Exception:
+            pass
+
+    def _on_connection_open(self, connection) -> None:
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_channel_open(self, channel) -> None:
+        self._channel = channel
+        channel.add_on_close_callback(lambda _, reason: self._on_error(None, reason))
+        channel.exchange_declare(
+            exchange=EXCHANGE, exchange_type="topic", durable=True, callback=self._on_exchange_declared
+        )
+
+    def _on_exchange_declared(self, _) -> None:
+        self._channel.confirm_delivery(ack_nack_callback=self._on_confirm, callback=self._on_confirm_select)
+
+    def _on_confirm_select(self, _) -> None:
+        self._ready = True
+        self._wake()
+
+    def _on_confirm(self, frame) -> None:
+        method = frame.method
+        nack = isinstance(method, pika.spec.Basic.Nack)
+        tags = [method.delivery_tag]
+        if method.multiple:
+            tags = [tag for tag in self._unconfirmed if tag <= method.delivery_tag]
+        for tag in tags:
+            event = self._unconfirmed.pop(tag, None)
+            if event is not None and nack:
+                self._nacked.append(event)
+        self._wake()
+
+    def _on_error(self, _, error) -> None:
+        if self._error is None:
+            self._error = error if isinstance(error, BaseException) else ConnectionError(str(error))
+        self._connection.ioloop.stop()
+
+    def _wake(self) -> None:
+        if self._done():
+            self._connection.ioloop.stop()
+
+    def _loop(self, done: Callable[[], bool], timeout: float) -> None:
+        self._done = done
+        ioloop = self._connection.ioloop
+        handle = ioloop.call_later(timeout, ioloop.stop)
+        try:
+            ioloop.start()
+        finally:
+            ioloop.remove_timeout(handle)
+
+    def _run_until(self, done: Callable[[], bool]) -> None:
+        deadline = time.monotonic() + self._timeout
+        while not done():
+            if self._error is not None:
+                raise self._error
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("RabbitMQ did not confirm in time")
+            self._loop(done, remaining)
+
+
+class EventPublisher:
+    def __init__(
+        self,
+        amqp_url: str,
+        max_queue: int,
+        batch_size: int,
+        flush_interval: float,
+        max_backoff: float,
+    ) -> None:
+        self._amqp_url = amqp_url
+        self._queue: queue.Queue[OutgoingEvent] = queue.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_backoff = max_backoff
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._pending: deque[OutgoingEvent] = deque()
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="event-publisher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def depth(self) -> int:
+        return self._queue.qsize() + len(self._pending)
+
+    def enqueue(self, event: OutgoingEvent) -> bool:
+        if self._stop.is_set():
+            # stopped publishers drain what they have and accept nothing new
+            metrics.inc("events.dropped")
+            return False
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            metrics.inc("events.dropped")
+            return False
+        metrics.inc("events.enqueued")
+        return True
+
+    def _fill_pending(self) -> None:
+        try:
+            self._pending.append(self._queue.get(timeout=self._flush_interval))
+        except queue.Empty:
+            return
+        while len(self._pending) < self._batch_size:
+            try:
+                self._pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def _run(self) -> None:
+        channel: ConfirmChannel | None = None
+        backoff = 0.5
+        while not (self._stop.is_set() and not self._pending and self._queue.empty()):
+            if not self._pending:
+                self._fill_pending()
+                if not self._pending:
+                    continue
+            try:
+                if channel is None or not channel.is_open:
+                    if channel is not None:
+                        channel.close()
+                    channel = ConfirmChannel(self._amqp_url, settings.rabbitmq_confirm_timeout)
+                    backoff = 0.5
+                started = time.monotonic()
+                batch = list(self._pending)
+                nacked = channel.publish_batch(batch)
+                # nacked events stay at the front and go out with the next batch
+                self._pending = deque(nacked)
+                metrics.inc("events.published", len(batch) - len(nacked))
+                metrics.observe("events.publish_batch", time.monotonic() - started)
+                if nacked:
+                    metrics.inc("events.nacked", len(nacked))
+                    if self._stop.wait(backoff):
+                        break
+                    backoff = min(backoff * 2, self._max_backoff)
+            except Exception:
+                metrics.inc("events.publish_errors")
+                if channel is not None:
+                    channel.close()
+                channel = None
+                if self._stop.wait(backoff):
+                    break
+                backoff = min(backoff * 2, self._max_backoff)
+                metrics.inc("events.reconnects")
+
+        if self._pending or not self._queue.empty():
+            metrics.inc("events.dropped", len(self._pending) + self._queue.qsize())
+        if channel is not None:
+            channel.close()
+
+
+_publisher: EventPublisher | None = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher() -> EventPublisher | None:
+    global _publisher
     amqp_url = settings.rabbitmq_amqp_url()
     if not amqp_url:
         return None
-    if _channel and _channel.is_open:
-        return _channel
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = EventPublisher(
+                    amqp_url=amqp_url,
+                    max_queue=settings.rabbitmq_queue_size,
+                    batch_size=settings.rabbitmq_batch_size,
+                    flush_interval=settings.rabbitmq_flush_interval,
+                    max_backoff=settings.rabbitmq_reconnect_max_delay,
+                )
+                metrics.register_gauge("events.queue_depth", _publisher.depth)
+    return _publisher
+
+
+def start_publisher() -> None:
+    publisher = get_publisher()
+    if publisher is not None:
+        publisher.start()
+
 
-    params = pika.URLParameters(amqp_url)
-    _connection = pika.BlockingConnection(params)
-    _channel = _connection.channel()
-    _channel.exchange_declare(exchange="habitgraph.events", exchange_type="topic", durable=True)
-    return _channel
+def stop_publisher(timeout: float = 5.0) -> None:
+    if _publisher is not None:
+        _publisher.stop(timeout)
 
 
 def publish_event(routing_key: str, payload: dict) -> None:
-    ch = _get_channel()
-    if ch is None:
+    if settings.event_bus == "local":
+        from app.workers.bus import get_local_bus
+
+        get_local_bus().publish(routing_key, payload)
         return
-    ch.basic_publish(
-        exchange="habitgraph.events",
-        routing_key=routing_key,
-        body=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
-        properties=pika.BasicProperties(content_type="application/json", delivery_mode=2),
-    )
+    publisher = get_publisher()
+    if publisher is None:
+        return
+    publisher.enqueue(build_event(routing_key, payload))
@@ -0,0 +1,99 @@
+import time
+
+from app.core.cache import Cache
+from app.core.settings import settings
+from app.db.redis import get_redis
+
+TOP_K = 50
+RECS_TTL_SECONDS = 24 * 3600
+DIRTY_KEY = "recs:dirty"
+
+# members are "user_id:shared_goals:shared_habits"; "0:0:0" marks a computed empty list
+_EMPTY = "0:0:0"
+
+
+def _recs_key(user_id: int) -> str:
+    return f"recs:{user_id}"
+
+
+def _encode(rows: list[dict]) -> dict[str, int]:
+    members = {f"{row['user_id']}:{row['shared_goals']}:{row['shared_habits']}": row["score"] for row in rows}
+    return members or {_EMPTY: -1}
+
+
+def _decode(items: list[tuple[str, float]]) -> list[dict]:
+    out: list[dict] = []
+    for member, score in items:
+        if member == _EMPTY:
+            continue
+        uid, shared_goals, shared_habits = (int(x) for x in member.split(":"))
+        out.append(
+            {
+                "user_id": uid,
+                "shared_goals": shared_goals,
+                "shared_habits": shared_habits,
+                "score": int(score),
+            }
+        )
+    out.sort(key=lambda row: (-row["score"], row["user_id"]))
+    return out
+
+
+class _SortedSetCache(Cache):
+    # top-K stays a sorted set read with one ZREVRANGE; its age comes from PTTL like any entry
+    def queue_read(self, pipe, key: str) -> None:
+        pipe.zrevrange(key, 0, TOP_K - 1, withscores=True)
+
+    def queue_write(self, pipe, key: str, raw: dict[str, int], px: int) -> None:
+        pipe.delete(key)
+        pipe.zadd(key, raw)
+        pipe.pexpire(key, px)
+
+
+# the recompute workers keep entries fresh; the soft TTL only bounds how old a list can get
+_recs = _SortedSetCache(
+    "recs", ttl=RECS_TTL_SECONDS, soft_ttl=settings.recs_soft_ttl_seconds, encode=_encode, decode=_decode
+)
+
+
+def _queue_store(pipe, user_id: int, rows: list[dict]) -> None:
+    _recs.queue_set(pipe, _recs_key(user_id), rows)
+
+
+def store_recommendations(user_id: int, rows: list[dict]) -> None:
+    pipe = get_redis().pipeline()
+    _queue_store(pipe, user_id, rows)
+    pipe.execute()
+
+
+def store_recommendations_many(items: list[tuple[int, list[dict]]]) -> None:
+    pipe = get_redis().pipeline(transaction=False)
+    for user_id, rows in items:
+        _queue_store(pipe, user_id, rows)
+    pipe.execute()
+
+
+def cached_recommendations(user_id: int, limit: int) -> list[dict]:
+    from app.db.neo4j import recommend_users
+
+    rows = _recs.get(_recs_key(user_id), loader=lambda: recommend_users(user_id=user_id, limit=TOP_K))
+    return rows[:limit]
+
+
+def mark_dirty(user_ids: list[int], debounce_seconds: float) -> None:
+    if not user_ids:
+        return
+    due = time.time() + debounce_seconds
+    get_redis().zadd(DIRTY_KEY, {str(uid): due for uid in user_ids}, nx=True)
+
+
+def pop_due(batch_size: int) -> list[int]:
+    r = get_redis()
+    candidates = r.zrangebyscore(DIRTY_KEY, "-inf", time.time(), start=0, num=batch_size)
+    if not candidates:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for member in candidates:
+        pipe.zrem(DIRTY_KEY, member)
+    removed = pipe.execute()
+    return [int(member) for member, ok in zip(candidates, removed) if ok]
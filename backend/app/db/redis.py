@@ -4,7 +4,9 @@ import redis
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from app.core.cache import Cache
 from app.core.settings import settings
+from app.db.checkin_archive import get_archive, has_date
 from app.db.models import Checkin
 
 _client: redis.Redis | None = None
@@ -17,50 +19,260 @@ def get_redis() -> redis.Redis:
     return _client
 
 
+FRIENDS_TTL_SECONDS = 10 * 60
+
+
+def friends_key(user_id: int) -> str:
+    return f"friends:{user_id}"
+
+
+def get_friend_ids(user_id: int) -> list[int]:
+    key = friends_key(user_id)
+    try:
+        r = get_redis()
+        members = r.smembers(key)
+        if members:
+            return sorted(int(m) for m in members if m != "0")
+    except Exception:
+        r = None
+
+    from app.db.neo4j import list_friends
+
+    ids = [int(f["user_id"]) for f in list_friends(user_id=user_id)]
+    if r is not None:
+        try:
+            # "0" marks a cached empty set, user ids start at 1
+            pipe = r.pipeline()
+            pipe.delete(key)
+            pipe.sadd(key, "0", *ids)
+            pipe.expire(key, FRIENDS_TTL_SECONDS)
+            pipe.execute()
+        except Exception:
+            pass
+    return ids
+
+
+def invalidate_friend_ids(*user_ids: int) -> None:
+    r = get_redis()
+    r.delete(*(friends_key(uid) for uid in user_ids))
+
+
+STREAK_MILESTONES = (3, 7, 14, 30, 50, 100, 200, 365)
+STREAK_TTL_SECONDS = 7 * 24 * 3600
+LEADERBOARD_KEY = "leaderboard:streak"
+
+
+LEADERBOARD_DAYS_KEY = "leaderboard:streak:days"
+
+
 def _streak_key(user_id: int, habit_id: int) -> str:
     return f"streak:{user_id}:{habit_id}"
 
 
+def user_streaks_key(user_id: int) -> str:
+    return f"streaks:{user_id}"
+
+
+_streaks = Cache(
+    "streak",
+    ttl=STREAK_TTL_SECONDS,
+    soft_ttl=settings.streak_soft_ttl_seconds,
+    decode=int,
+    loader_stores=True,
+    near=True,
+)
+
+# streaks:{uid} holds "<streak>:<last day>" per habit. A streak counts for the leaderboard
+# while its last day is today or yesterday; LEADERBOARD_DAYS_KEY scores each ranked user by
+# the earliest such day (YYYYMMDD), so users whose best streak lapsed are found by score.
+# One script keeps the hash and both sorted sets consistent under concurrent updates.
+_STORE_STREAK = """
+if ARGV[2] ~= '' then
+    redis.call('set', KEYS[1], ARGV[3], 'px', ARGV[6])
+    redis.call('hset', KEYS[2], ARGV[2], ARGV[4] .. ':' .. ARGV[5])
+end
+local best, oldest = 0, nil
+local entries = redis.call('hgetall', KEYS[2])
+for i = 1, #entries, 2 do
+    local value = entries[i + 1]
+    local sep = string.find(value, ':', 1, true)
+    if not sep then
+        redis.call('hdel', KEYS[2], entries[i])
+    else
+        local streak = tonumber(string.sub(value, 1, sep - 1))
+        local day = string.sub(value, sep + 1)
+        if streak > 0 and day >= ARGV[7] then
+            if streak > best then best = streak end
+            if oldest == nil or day < oldest then oldest = day end
+        end
+    end
+end
+if best > 0 then
+    redis.call('zadd', KEYS[3], best, ARGV[1])
+    redis.call('zadd', KEYS[4], tonumber((string.gsub(oldest, '-', ''))), ARGV[1])
+else
+    redis.call('zrem', KEYS[3], ARGV[1])
+    redis.call('zrem', KEYS[4], ARGV[1])
+end
+return best
+"""
+
+
+def _queue_store_streak(
+    pipe, user_id: int, habit_id: int | None = None, streak: int = 0, last_day: dt.date | None = None
+) -> None:
+    today = dt.date.today()
+    pipe.eval(
+        _STORE_STREAK,
+        4,
+        _streak_key(user_id, habit_id or 0),
+        user_streaks_key(user_id),
+        LEADERBOARD_KEY,
+        LEADERBOARD_DAYS_KEY,
+        str(user_id),
+        "" if habit_id is None else str(habit_id),
+        # the per-habit key is the dashboard's streak up to today
+        streak if last_day == today else 0,
+        streak,
+        (last_day or today).isoformat(),
+        STREAK_TTL_SECONDS * 1000,
+        (today - dt.timedelta(days=1)).isoformat(),
+    )
+
+
+def store_streak(user_id: int, habit_id: int, streak: int, last_day: dt.date) -> None:
+    pipe = get_redis().pipeline(transaction=False)
+    _queue_store_streak(pipe, user_id, habit_id, streak, last_day)
+    pipe.execute()
+
+
+def rerank_users(user_ids: list[int]) -> None:
+    pipe = get_redis().pipeline(transaction=False)
+    for user_id in user_ids:
+        _queue_store_streak(pipe, user_id)
+    pipe.execute()
+
+
+_swept_on: dt.date | None = None
+
+
+def sweep_stale_streaks(batch_size: int = 500) -> int:
+    # streaks only lapse when the day changes, so each process sweeps once a day
+    global _swept_on
+    today = dt.date.today()
+    if _swept_on == today:
+        return 0
+    r = get_redis()
+    cutoff = int((today - dt.timedelta(days=1)).strftime("%Y%m%d"))
+    total = 0
+    while True:
+        user_ids = r.zrangebyscore(LEADERBOARD_DAYS_KEY, "-inf", f"({cutoff}", start=0, num=batch_size)
+        if not user_ids:
+            break
+        rerank_users([int(uid) for uid in user_ids])
+        total += len(user_ids)
+    _swept_on = today
+    return total
+
+
 def compute_streak(db: Session, user_id: int, habit_id: int, end_date: dt.date) -> int:
-    dates = db.scalars(
-        select(Checkin.date)
-        .where(Checkin.user_id == user_id, Checkin.habit_id == habit_id)
-        .order_by(Checkin.date.desc())
-        .limit(400)
-    ).all()
-    date_set = set(dates)
+    date_set = set(
+        db.scalars(
+            select(Checkin.date).where(
+                Checkin.user_id == user_id, Checkin.habit_id == habit_id, Checkin.date <= end_date
+            )
+        )
+    )
 
+    # older days live in the archive, it is read only once the hot rows run out
+    archive = None
     streak = 0
     cur = end_date
-    while cur in date_set:
+    while True:
+        if cur not in date_set:
+            if archive is None:
+                archive = get_archive(db, user_id, habit_id) or False
+            if not archive or not has_date(archive, cur):
+                break
         streak += 1
         cur -= dt.timedelta(days=1)
     return streak
 
 
+def current_streak(db: Session, user_id: int, habit_id: int, today: dt.date) -> tuple[int, dt.date]:
+    # a streak not yet continued today is still current until the day is over
+    streak = compute_streak(db=db, user_id=user_id, habit_id=habit_id, end_date=today)
+    if streak:
+        return streak, today
+    yesterday = today - dt.timedelta(days=1)
+    return compute_streak(db=db, user_id=user_id, habit_id=habit_id, end_date=yesterday), yesterday
+
+
 def compute_and_store_streak(db: Session, user_id: int, habit_id: int, end_date: dt.date) -> int:
+    # returns the streak up to end_date; a backdated check-in still stores the current streak
     streak = compute_streak(db=db, user_id=user_id, habit_id=habit_id, end_date=end_date)
-    r = get_redis()
-    r.set(_streak_key(user_id, habit_id), str(streak), ex=7 * 24 * 3600)
+    today = dt.date.today()
+    current = (streak, today) if end_date == today and streak else current_streak(db, user_id, habit_id, today)
+    store_streak(user_id, habit_id, *current)
     return streak
 
 
-def get_streak(db: Session, user_id: int, habit_id: int) -> int:
+def _load_streak(db: Session, user_id: int, habit_id: int) -> int:
+    today = dt.date.today()
+    streak, last_day = current_streak(db, user_id, habit_id, today)
     try:
-        r = get_redis()
-        value = r.get(_streak_key(user_id, habit_id))
-        if value is not None:
-            return int(value)
+        store_streak(user_id, habit_id, streak, last_day)
     except Exception:
         pass
+    return streak if last_day == today else 0
 
+
+def _refresh_streak(user_id: int, habit_id: int) -> int:
+    from app.db.sharding import session_for_user
+
+    with session_for_user(user_id) as db:
+        return _load_streak(db, user_id, habit_id)
+
+
+def get_streak(db: Session, user_id: int, habit_id: int) -> int:
+    # a day without a check-in breaks the streak, so values are revalidated after the soft TTL
     try:
-        streak = compute_streak(db=db, user_id=user_id, habit_id=habit_id, end_date=dt.date.today())
-        try:
-            r = get_redis()
-            r.set(_streak_key(user_id, habit_id), str(streak), ex=7 * 24 * 3600)
-        except Exception:
-            pass
-        return streak
+        return _streaks.get(
+            _streak_key(user_id, habit_id),
+            loader=lambda: _load_streak(db, user_id, habit_id),
+            refresh=lambda: _refresh_streak(user_id, habit_id),
+        )
     except Exception:
         return 0
+
+
+def leaderboard_global(user_id: int, limit: int) -> tuple[list[tuple[int, int]], int | None]:
+    sweep_stale_streaks()
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.zrevrange(LEADERBOARD_KEY, 0, limit - 1, withscores=True)
+    pipe.zscore(LEADERBOARD_KEY, str(user_id))
+    top, mine = pipe.execute()
+    return [(int(m), int(s)) for m, s in top], None if mine is None else int(mine)
+
+
+def leaderboard_friends(user_id: int, limit: int) -> list[tuple[int, int]]:
+    sweep_stale_streaks()
+    r = get_redis()
+    tmp = f"leaderboard:tmp:{user_id}"
+    for attempt in range(2):
+        pipe = r.pipeline()
+        pipe.exists(friends_key(user_id))
+        # the friend set scores 0 and the leaderboard its value, so the sum is the streak
+        pipe.zinterstore(tmp, {friends_key(user_id): 0, LEADERBOARD_KEY: 1})
+        pipe.zrevrange(tmp, 0, limit - 1, withscores=True)
+        pipe.delete(tmp)
+        pipe.zscore(LEADERBOARD_KEY, str(user_id))
+        cached, _, top, _, mine = pipe.execute()
+        if cached or attempt:
+            break
+        get_friend_ids(user_id)
+
+    rows = [(int(m), int(s)) for m, s in top if m != str(user_id)]
+    rows.append((user_id, int(mine or 0)))
+    rows.sort(key=lambda row: (-row[1], row[0]))
+    return rows[:limit]
@@ -0,0 +1,365 @@
+import threading
+import time
+import zlib
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypeVar
+
+from sqlalchemy import Engine, delete, func, insert, select, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core import metrics
+from app.core.lru import TTLCache
+from app.core.settings import settings
+from app.db.migrations import migrate, migration_lock
+from app.db.models import Base, OutboxDeadEvent, OutboxEvent, User
+from app.db.postgres import SessionLocal, create_pooled_engine, engine, read_session
+
+# ids are allocated as stride * n + shard on every shard, so rows keep their ids when moved
+SHARD_ID_STRIDE = 1024
+
+# copy order follows the foreign keys; deleting the user row cascades to the rest
+_USER_TABLES = ("users", "goals", "habits", "checkins", "checkin_archive")
+_ID_TABLES = ("users", "goals", "habits", "checkins")
+
+T = TypeVar("T")
+
+
+class UserMovingError(RuntimeError):
+    pass
+
+
+class _Shard:
+    def __init__(self, index: int, shard_engine: Engine, sessions: sessionmaker):
+        self.index = index
+        self.engine = shard_engine
+        self.sessions = sessions
+
+
+def _build_shards() -> list[_Shard]:
+    # shard 0 is the main database: it keeps the directory and every user created before sharding
+    shards = [_Shard(0, engine, SessionLocal)]
+    for index, dsn in enumerate(settings.postgres_shard_dsn_list(), start=1):
+        shard_engine = create_pooled_engine(dsn, f"postgres.shard.{index}.pool")
+        shards.append(_Shard(index, shard_engine, sessionmaker(bind=shard_engine, autoflush=False, autocommit=False)))
+    if len(shards) > SHARD_ID_STRIDE:
+        raise ValueError(f"no more than {SHARD_ID_STRIDE} shards are supported")
+    return shards
+
+
+_shards = _build_shards()
+_directory = TTLCache(maxsize=100_000, ttl=settings.shard_directory_cache_seconds)
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def is_sharded() -> bool:
+    return len(_shards) > 1
+
+
+def shard_count() -> int:
+    return len(_shards)
+
+
+def shard_sessions() -> list[sessionmaker]:
+    return [shard.sessions for shard in _shards]
+
+
+def shard_engines() -> list[Engine]:
+    return [shard.engine for shard in _shards]
+
+
+def _lookup(user_ids: list[int]) -> dict[int, tuple[int, bool]]:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT user_id, shard, moving FROM user_shards WHERE user_id = ANY(:ids)"),
+            {"ids": user_ids},
+        )
+        return {int(r.user_id): (int(r.shard), bool(r.moving)) for r in rows}
+
+
+def locate_users(user_ids: Iterable[int]) -> dict[int, tuple[int, bool]]:
+    user_ids = list(dict.fromkeys(user_ids))
+    if not is_sharded():
+        return {user_id: (0, False) for user_id in user_ids}
+    out: dict[int, tuple[int, bool]] = {}
+    missing = []
+    for user_id in user_ids:
+        location = _directory.get(user_id)
+        if location is None:
+            missing.append(user_id)
+        else:
+            out[user_id] = location
+    if missing:
+        metrics.inc("shards.directory_lookups")
+        found = _lookup(missing)
+        for user_id in missing:
+            # users without an entry were created before sharding and live on shard 0
+            location = found.get(user_id, (0, False))
+            _directory.set(user_id, location)
+            out[user_id] = location
+    return out
+
+
+def shard_of(user_id: int) -> int:
+    return locate_users([user_id])[user_id][0]
+
+
+def session_for_user(user_id: int, write: bool = False) -> Session:
+    shard, moving = locate_users([user_id])[user_id]
+    if write and moving:
+        metrics.inc("shards.moving_rejects")
+        raise UserMovingError(user_id)
+    return _shards[shard].sessions()
+
+
+class LazySession:
+    # the shard is resolved on first use: requests that never touch Postgres neither look
+    # up the directory nor get rejected while their user is being moved
+    def __init__(self, factory: Callable[[], Session]) -> None:
+        self._factory = factory
+        self._session: Session | None = None
+        self.info: dict = {}
+
+    def _resolve(self) -> Session:
+        if self._session is None:
+            session = self._factory()
+            session.info.update(self.info)
+            self.info = session.info
+            self._session = session
+        return self._session
+
+    def __getattr__(self, name: str):
+        return getattr(self._resolve(), name)
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+
+
+def session_for_shard(shard: int) -> Session:
+    return _shards[shard].sessions()
+
+
+def place_new_user(username: str) -> int:
+    return zlib.crc32(username.lower().encode("utf-8")) % len(_shards)
+
+
+def _set_directory(user_id: int, shard: int, moving: bool) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO user_shards (user_id, shard, moving) VALUES (:user_id, :shard, :moving) "
+                "ON CONFLICT (user_id) DO UPDATE "
+                "SET shard = EXCLUDED.shard, moving = EXCLUDED.moving, updated_at = now()"
+            ),
+            {"user_id": user_id, "shard": shard, "moving": moving},
+        )
+    _directory.set(user_id, (shard, moving))
+
+
+def register_user(user_id: int, shard: int) -> None:
+    if is_sharded():
+        _set_directory(user_id, shard, moving=False)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.shard_scatter_workers, thread_name_prefix="shard")
+        return _executor
+
+
+def scatter(fn: Callable[[int, Session], T], shards: Iterable[int] | None = None, read: bool = False) -> list[T]:
+    targets = list(range(len(_shards)) if shards is None else shards)
+
+    def _run(index: int) -> T:
+        # read=True lets shard 0 use its replicas
+        db = read_session() if read and index == 0 else _shards[index].sessions()
+        try:
+            return fn(index, db)
+        finally:
+            db.close()
+
+    if len(targets) <= 1:
+        return [_run(index) for index in targets]
+    started = time.perf_counter()
+    try:
+        return list(_get_executor().map(_run, targets))
+    finally:
+        metrics.observe("shards.scatter", time.perf_counter() - started)
+
+
+def usernames(user_ids: Iterable[int]) -> dict[int, str]:
+    by_shard: dict[int, list[int]] = defaultdict(list)
+    for user_id, (shard, _) in locate_users(user_ids).items():
+        by_shard[shard].append(user_id)
+    if not by_shard:
+        return {}
+    parts = scatter(
+        lambda shard, db: db.execute(select(User.id, User.username).where(User.id.in_(by_shard[shard]))).all(),
+        by_shard,
+        read=True,
+    )
+    return {user_id: username for rows in parts for user_id, username in rows}
+
+
+def username_taken(username: str, exclude_user_id: int | None = None) -> bool:
+    # the unique index only covers one shard; two shards can still race on the same name
+    def _exists(_: int, db: Session) -> bool:
+        query = select(User.id).where(User.username == username)
+        if exclude_user_id is not None:
+            query = query.where(User.id != exclude_user_id)
+        return db.scalar(query.limit(1)) is not None
+
+    return any(scatter(_exists))
+
+
+def _configure_id_sequences() -> None:
+    # processes starting together must not both restart a sequence: the second restart
+    # would rewind it below ids the first one already handed out
+    with migration_lock(engine):
+        _configure_id_sequences_locked()
+
+
+def _configure_id_sequences_locked() -> None:
+    floors = {}
+    for table in _ID_TABLES:
+        floors[table] = max(
+            scatter(lambda _, db, table=table: int(db.scalar(text(f"SELECT COALESCE(max(id), 0) FROM {table}")) or 0))
+        )
+    for shard in _shards:
+        with shard.engine.begin() as conn:
+            for table in _ID_TABLES:
+                sequence = conn.scalar(text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": table})
+                step, seq_type = conn.execute(
+                    text(
+                        "SELECT seqincrement, format_type(seqtypid, NULL) FROM pg_sequence "
+                        "WHERE seqrelid = CAST(:s AS regclass)"
+                    ),
+                    {"s": sequence},
+                ).one()
+                if step == SHARD_ID_STRIDE:
+                    continue
+                # migration 6 widens the ids; int4 runs out after ~2M strided ids per shard
+                if seq_type != "bigint":
+                    raise RuntimeError(f"{sequence} is {seq_type}, apply migrations before enabling shards")
+                # start above every id that exists anywhere, those were allocated without the stride
+                start = (floors[table] // SHARD_ID_STRIDE + 1) * SHARD_ID_STRIDE + shard.index
+                conn.execute(text(f"ALTER SEQUENCE {sequence} INCREMENT BY {SHARD_ID_STRIDE} RESTART WITH {start}"))
+
+
+def init_shards() -> None:
+    if not is_sharded():
+        return
+    for shard in _shards[1:]:
+        migrate(shard.engine)
+    _configure_id_sequences()
+
+
+def _copy_user_rows(src: Session, dst: Session, user_id: int) -> dict[str, int]:
+    counts = {}
+    for name in _USER_TABLES:
+        table = Base.metadata.tables[name]
+        column = table.c.id if name == "users" else table.c.user_id
+        query = select(table).where(column == user_id).order_by(*table.primary_key.columns)
+        rows = [dict(r._mapping) for r in src.execute(query)]
+        if rows:
+            dst.execute(insert(table), rows)
+        counts[name] = len(rows)
+
+    # pending events follow the user: the streak handler reads check-ins from the shard of the event.
+    # FOR UPDATE waits for a relay that already holds some of them; rows it finishes are gone by then
+    pending = list(
+        src.scalars(
+            select(OutboxEvent).where(OutboxEvent.user_id == user_id).order_by(OutboxEvent.id).with_for_update()
+        )
+    )
+    for event in pending:
+        dst.add(
+            OutboxEvent(
+                kind=event.kind,
+                payload=event.payload,
+                user_id=event.user_id,
+                attempts=event.attempts,
+                next_attempt_at=event.next_attempt_at,
+            )
+        )
+    if pending:
+        src.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([e.id for e in pending])))
+    dead = list(src.scalars(select(OutboxDeadEvent).where(OutboxDeadEvent.user_id == user_id).with_for_update()))
+    for event in dead:
+        dst.add(
+            OutboxDeadEvent(
+                kind=event.kind,
+                payload=event.payload,
+                user_id=event.user_id,
+                attempts=event.attempts,
+                error=event.error,
+                created_at=event.created_at,
+                dead_at=event.dead_at,
+            )
+        )
+    if dead:
+        src.execute(delete(OutboxDeadEvent).where(OutboxDeadEvent.id.in_([e.id for e in dead])))
+    counts["outbox"] = len(pending)
+    return counts
+
+
+def set_moving(user_ids: list[int], shard: int, moving: bool) -> None:
+    for user_id in user_ids:
+        _set_directory(user_id, shard, moving=moving)
+
+
+def move_user(user_id: int, target: int, settle_seconds: float | None = None) -> dict[str, int]:
+    if not 0 <= target < len(_shards):
+        raise ValueError(f"unknown shard {target}")
+    source, _ = _lookup([user_id]).get(user_id, (0, False))
+    if source == target:
+        return {}
+
+    _set_directory(user_id, source, moving=True)
+    # every process sees the moving flag once its directory cache expires
+    time.sleep(settings.shard_directory_cache_seconds if settle_seconds is None else settle_seconds)
+
+    src = _shards[source].sessions()
+    dst = _shards[target].sessions()
+    copied = moved = False
+    try:
+        # inserts referencing the user hold KEY SHARE on its row: FOR UPDATE waits for them
+        # and blocks new ones; habits and goals are locked against in-place updates
+        if src.execute(text("SELECT 1 FROM users WHERE id = :u FOR UPDATE"), {"u": user_id}).first() is None:
+            raise ValueError(f"user {user_id} not found on shard {source}")
+        src.execute(text("SELECT 1 FROM habits WHERE user_id = :u FOR UPDATE"), {"u": user_id})
+        src.execute(text("SELECT 1 FROM goals WHERE user_id = :u FOR UPDATE"), {"u": user_id})
+
+        counts = _copy_user_rows(src, dst, user_id)
+        dst.commit()
+        copied = True
+        _set_directory(user_id, target, moving=False)
+        moved = True
+        src.execute(delete(User).where(User.id == user_id))
+        src.commit()
+    except Exception:
+        src.rollback()
+        dst.rollback()
+        # once the directory points at the target only the source copy is left to delete,
+        # rerunning the move for this user is a no-op and the copy has to be removed by hand
+        if not moved:
+            if copied:
+                with session_for_shard(target) as cleanup:
+                    cleanup.execute(delete(User).where(User.id == user_id))
+                    cleanup.commit()
+            _set_directory(user_id, source, moving=False)
+        raise
+    finally:
+        src.close()
+        dst.close()
+    metrics.inc("shards.moved_users")
+    return counts
+
+
+def user_counts() -> list[int]:
+    return scatter(lambda _, db: int(db.scalar(select(func.count()).select_from(User)) or 0))
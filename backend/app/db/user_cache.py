@@ -0,0 +1,51 @@
+import json
+
+from app.core import metrics
+from app.core.lru import TTLCache
+from app.core.settings import settings
+from app.db.models import User
+from app.db.near_cache import cached_get
+from app.db.redis import get_redis
+
+_local = TTLCache(maxsize=settings.user_cache_local_size, ttl=settings.user_cache_local_ttl)
+
+
+def _user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def get_cached_user(user_id: int) -> User | None:
+    # cached users are transient objects: read id/username, load from the session to modify
+    data = _local.get(user_id)
+    if data is not None:
+        metrics.inc("user_cache.local_hits")
+        return User(**data)
+    try:
+        raw = cached_get(_user_key(user_id))
+    except Exception:
+        raw = None
+    if raw is None:
+        metrics.inc("user_cache.misses")
+        return None
+    metrics.inc("user_cache.redis_hits")
+    data = json.loads(raw)
+    _local.set(user_id, data)
+    return User(**data)
+
+
+def cache_user(user: User) -> None:
+    data = {"id": user.id, "username": user.username}
+    _local.set(user.id, data)
+    try:
+        get_redis().set(_user_key(user.id), json.dumps(data, ensure_ascii=False), ex=settings.user_cache_ttl_seconds)
+    except Exception:
+        pass
+
+
+def invalidate_user(user_id: int) -> None:
+    # other processes keep their copy for at most USER_CACHE_LOCAL_TTL seconds
+    _local.pop(user_id)
+    try:
+        get_redis().delete(_user_key(user_id))
+    except Exception:
+        pass
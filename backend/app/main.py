@@ -6,14 +6,29 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from app.api.router import api_router
+from app.core import metrics
 from app.core.settings import settings
+from app.db.goal_catalog import seed_goal_catalog
 from app.db.postgres import init_db
+from app.db.rabbitmq import start_publisher, stop_publisher
+from app.db.sharding import UserMovingError
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     init_db()
+    seed_goal_catalog()
+    start_publisher()
+    recs_loop = None
+    if settings.event_bus == "local":
+        from app.workers.recommendations import RecomputeLoop
+
+        recs_loop = RecomputeLoop(interval=settings.recs_recompute_interval)
+        recs_loop.start()
     yield
+    if recs_loop is not None:
+        recs_loop.stop()
+    stop_publisher()
 
 
 def create_app() -> FastAPI:
@@ -26,12 +41,17 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["ETag", "X-Next-Cursor"],
     )
 
     @app.get("/health")
     def health() -> dict:
         return {"status": "ok"}
 
+    @app.get("/metrics")
+    def get_metrics() -> dict:
+        return metrics.snapshot()
+
     @app.exception_handler(HTTPException)
     async def http_exception_handler(_: Request, exc: HTTPException) -> JSONResponse:
         return JSONResponse(
@@ -39,6 +59,17 @@ def create_app() -> FastAPI:
             content={"code": "http_error", "message": exc.detail, "details": None},
         )
 
+    @app.exception_handler(UserMovingError)
+    async def user_moving_handler(_: Request, __: UserMovingError) -> JSONResponse:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "code": "http_error",
+                "message": "Данные пользователя переносятся, повторите запрос позже",
+                "details": None,
+            },
+        )
+
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(_: Request, exc: RequestValidationError) -> JSONResponse:
         return JSONResponse(
@@ -0,0 +1,55 @@
+import argparse
+import datetime as dt
+import time
+
+from app.core.settings import settings
+from app.db.checkin_archive import MIN_ARCHIVE_DAYS, archive_batch
+from app.db.postgres import init_db
+from app.db.redis import compute_and_store_streak
+from app.db.sharding import shard_sessions
+
+
+def archive(after_days: int, batch_size: int, refresh_streaks: bool) -> int:
+    cutoff = dt.date.today() - dt.timedelta(days=max(after_days, MIN_ARCHIVE_DAYS))
+    print(f"Архивация отметок старше {cutoff.isoformat()}…")
+    total = 0
+    for shard, sessions in enumerate(shard_sessions()):
+        started = time.monotonic()
+        pairs: set[tuple[int, int]] = set()
+        batches = 0
+        db = sessions()
+        try:
+            while True:
+                moved = archive_batch(db, cutoff, batch_size)
+                if not moved:
+                    break
+                pairs.update(moved)
+                batches += 1
+            # cached streaks used to stop at 400 hot rows; recompute them through the archive
+            if refresh_streaks:
+                today = dt.date.today()
+                for user_id, habit_id in sorted(pairs):
+                    try:
+                        compute_and_store_streak(db, user_id=user_id, habit_id=habit_id, end_date=today)
+                    except Exception as e:
+                        print(f"⚠ серия {user_id}/{habit_id} не пересчитана ({e})")
+        finally:
+            db.close()
+        total += len(pairs)
+        print(f"✓ Шард {shard}: {batches} пачек, {len(pairs)} пар (пользователь, привычка) за {time.monotonic() - started:.1f}s")
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Перенос старых отметок в компактный архив")
+    parser.add_argument("--after-days", type=int, default=settings.checkin_archive_after_days)
+    parser.add_argument("--batch-size", type=int, default=settings.checkin_archive_batch_size)
+    parser.add_argument("--skip-streaks", action="store_true", help="не пересчитывать серии затронутых привычек")
+    args = parser.parse_args()
+
+    init_db()
+    archive(args.after_days, args.batch_size, refresh_streaks=not args.skip_streaks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import random
+import time
+from collections.abc import Iterator
+
+from app.core import cooccurrence
+from app.core.settings import settings
+from app.db.neo4j import export_user_features, recommend_users
+from app.db.recommendations import TOP_K, store_recommendations_many
+
+
+def _export(batch_size: int) -> Iterator[dict]:
+    after = -1
+    total = 0
+    while True:
+        rows = export_user_features(after=after, limit=batch_size)
+        if not rows:
+            return
+        yield from rows
+        total += len(rows)
+        after = rows[-1]["user_id"]
+        if total % (batch_size * 20) == 0:
+            print(f"  выгружено пользователей: {total}")
+
+
+def export(directory: str, batch_size: int) -> None:
+    started = time.monotonic()
+    bp = cooccurrence.build(_export(batch_size))
+    cooccurrence.save(bp, directory)
+    print(f"✓ Граф выгружен: {len(bp.user_ids)} пользователей за {time.monotonic() - started:.1f}s")
+
+
+def recompute(directory: str, block_size: int, processes: int, dry_run: bool) -> int:
+    started = time.monotonic()
+    total = 0
+    for block in cooccurrence.recompute_all(directory, TOP_K, block_size, processes):
+        if not dry_run:
+            store_recommendations_many(block)
+        total += len(block)
+        if total % (block_size * 50) == 0:
+            print(f"  пересчитано: {total} ({total / (time.monotonic() - started):.0f}/s)")
+    print(f"✓ Пересчитано {total} пользователей за {time.monotonic() - started:.1f}s")
+    return total
+
+
+def verify(directory: str, samples: int, seed: int) -> int:
+    bp = cooccurrence.load(directory)
+    rng = random.Random(seed)
+    mismatches = 0
+    for row in rng.sample(range(len(bp.user_ids)), min(samples, len(bp.user_ids))):
+        user_id, expected = cooccurrence.top_k_rows(bp, row, row + 1, TOP_K)[0]
+        live = recommend_users(user_id=user_id, limit=TOP_K)
+        key = ("user_id", "shared_goals", "shared_habits", "score")
+        if [tuple(r[k] for k in key) for r in live] != [tuple(r[k] for k in key) for r in expected]:
+            mismatches += 1
+            print(f"⚠ расхождение для пользователя {user_id}")
+    print(f"Сверка с recommend_users: {samples} пользователей, расхождений: {mismatches}")
+    return mismatches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пакетный пересчёт рекомендаций через разреженные матрицы")
+    parser.add_argument("--dir", default=settings.recs_matrix_dir)
+    parser.add_argument("--reuse", action="store_true", help="взять сохранённые матрицы без выгрузки из Neo4j")
+    parser.add_argument("--export-batch", type=int, default=10_000)
+    parser.add_argument("--block-size", type=int, default=settings.recs_block_size)
+    parser.add_argument("--processes", type=int, default=settings.recs_processes or os.cpu_count() or 1)
+    parser.add_argument("--verify", type=int, default=0, help="сверить N случайных пользователей с recommend_users")
+    parser.add_argument("--dry-run", action="store_true", help="не записывать результат в Redis")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not (args.reuse and os.path.exists(os.path.join(args.dir, "meta.json"))):
+        print("Выгрузка графа из Neo4j…")
+        export(args.dir, args.export_batch)
+    if args.verify:
+        verify(args.dir, args.verify, args.seed)
+    recompute(args.dir, args.block_size, args.processes, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import random
+import statistics
+import time
+
+from app.core.minhash import NUM_PERM, band_keys
+from app.db.diary_lsh import find_duplicate, lsh_key
+from app.db.redis import get_redis
+
+BENCH_PREFIX = "bench:diary:lsh"
+
+
+def _used_memory() -> int:
+    return int(get_redis().info("memory")["used_memory"])
+
+
+def _random_sig(rng: random.Random) -> list[int]:
+    return [rng.getrandbits(32) for _ in range(NUM_PERM)]
+
+
+def _cleanup() -> None:
+    r = get_redis()
+    for key in r.scan_iter(match=f"{BENCH_PREFIX}:*", count=1000):
+        r.unlink(key)
+
+
+def run(entries: int, users: int, lookups: int, batch_size: int, seed: int) -> dict:
+    r = get_redis()
+    rng = random.Random(seed)
+    _cleanup()
+    before = _used_memory()
+
+    samples: list[tuple[int, list[int]]] = []
+    started = time.perf_counter()
+    pipe = r.pipeline(transaction=False)
+    for i in range(entries):
+        user_id = rng.randrange(users)
+        sig = _random_sig(rng)
+        pipe.hset(lsh_key(user_id, BENCH_PREFIX), mapping={band: f"{i:024x}" for band in band_keys(sig)})
+        if len(samples) < lookups:
+            samples.append((user_id, sig))
+        if (i + 1) % batch_size == 0:
+            pipe.execute()
+            if (i + 1) % (batch_size * 100) == 0:
+                print(f"  записано {i + 1}/{entries}")
+    pipe.execute()
+    load_s = time.perf_counter() - started
+    after = _used_memory()
+
+    latencies: list[float] = []
+    hits = 0
+    for user_id, sig in samples:
+        t0 = time.perf_counter()
+        found = find_duplicate(user_id=user_id, sig=sig, threshold=0.85, prefix=BENCH_PREFIX)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += 1 if found else 0
+
+    misses: list[float] = []
+    for _ in range(min(lookups, 1000)):
+        t0 = time.perf_counter()
+        find_duplicate(user_id=rng.randrange(users), sig=_random_sig(rng), threshold=0.85, prefix=BENCH_PREFIX)
+        misses.append((time.perf_counter() - t0) * 1000)
+
+    latencies.sort()
+    return {
+        "entries": entries,
+        "users": users,
+        "load_s": round(load_s, 1),
+        "memory_mb": round((after - before) / 1024 / 1024, 1),
+        "bytes_per_entry": round((after - before) / max(1, entries), 1),
+        "lookup_p50_ms": round(statistics.median(latencies), 3),
+        "lookup_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        "miss_p50_ms": round(statistics.median(misses), 3),
+        "recall": round(hits / max(1, len(samples)), 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк LSH-индекса дублей дневника в Redis")
+    parser.add_argument("--entries", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="не удалять ключи бенчмарка")
+    args = parser.parse_args()
+
+    print(f"Бенчмарк LSH: {args.entries} записей, {args.users} пользователей…")
+    try:
+        result = run(args.entries, args.users, args.lookups, args.batch_size, args.seed)
+    finally:
+        if not args.keep:
+            _cleanup()
+    for k, v in result.items():
+        print(f"  {k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
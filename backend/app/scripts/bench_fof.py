@@ -0,0 +1,153 @@
+import argparse
+import random
+import statistics
+import time
+
+from app.db.neo4j import get_driver, recommend_friends_of_friends
+
+BENCH_OFFSET = 2 * 10**12
+
+
+def _write(query: str, rows: list[dict]) -> None:
+    with get_driver().session() as session:
+        session.execute_write(lambda tx: tx.run(query, rows=rows).consume())
+
+
+def _cleanup() -> None:
+    with get_driver().session() as session:
+        session.run(
+            """
+            MATCH (n:User) WHERE n.id >= $offset
+            CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+            """,
+            offset=BENCH_OFFSET,
+        ).consume()
+
+
+def generate(users: int, edges_per_user: int, batch_size: int, seed: int) -> list[int]:
+    rng = random.Random(seed)
+    # preferential attachment: every endpoint is listed once per edge, so picks follow degree
+    endpoints: list[int] = []
+    degree = [0] * users
+    edges: list[dict] = []
+
+    for start in range(0, users, batch_size):
+        end = min(users, start + batch_size)
+        _write(
+            "UNWIND $rows AS row CREATE (:User {id: row.id, username: row.username})",
+            [{"id": BENCH_OFFSET + i, "username": f"fof_{i}"} for i in range(start, end)],
+        )
+
+    for i in range(users):
+        targets: set[int] = set()
+        attempts = 0
+        while endpoints and len(targets) < edges_per_user and attempts < edges_per_user * 4:
+            targets.add(endpoints[rng.randrange(len(endpoints))])
+            attempts += 1
+        for t in targets:
+            edges.append({"u": BENCH_OFFSET + i, "v": BENCH_OFFSET + t})
+            endpoints.extend((i, t))
+            degree[i] += 1
+            degree[t] += 1
+        if not targets:
+            endpoints.append(i)
+        if len(edges) >= batch_size:
+            _write_edges(edges)
+            edges = []
+        if (i + 1) % 100_000 == 0:
+            print(f"  связей для пользователей: {i + 1}/{users}")
+    _write_edges(edges)
+    return degree
+
+
+def _write_edges(rows: list[dict]) -> None:
+    if not rows:
+        return
+    _write(
+        """
+        UNWIND $rows AS row
+        MATCH (u:User {id: row.u}), (v:User {id: row.v})
+        CREATE (u)-[:FRIEND]->(v), (v)-[:FRIEND]->(u)
+        """,
+        rows,
+    )
+
+
+def _degrees(users: int) -> list[int]:
+    with get_driver().session() as session:
+        result = session.run(
+            """
+            MATCH (u:User) WHERE u.id >= $offset
+            RETURN u.id - $offset AS i, COUNT { (u)-[:FRIEND]->() } AS d
+            """,
+            offset=BENCH_OFFSET,
+        )
+        degree = [0] * users
+        for r in result:
+            if r["i"] < users:
+                degree[r["i"]] = r["d"]
+        return degree
+
+
+def measure(degree: list[int], samples: int, fanout: int, pages: int, seed: int) -> list[tuple[int, float]]:
+    rng = random.Random(seed + 1)
+    # half uniform users, half the best connected ones to hit the long tail
+    hubs = sorted(range(len(degree)), key=degree.__getitem__, reverse=True)[: max(1, samples // 2)]
+    picks = [rng.randrange(len(degree)) for _ in range(samples - len(hubs))] + hubs
+
+    out: list[tuple[int, float]] = []
+    for i in picks:
+        user_id = BENCH_OFFSET + i
+        recommend_friends_of_friends(user_id=user_id, limit=20, fanout=fanout)
+        after = None
+        t0 = time.perf_counter()
+        for _ in range(pages):
+            rows = recommend_friends_of_friends(user_id=user_id, limit=20, fanout=fanout, after=after)
+            if len(rows) < 20:
+                break
+            after = (rows[-1]["score"], rows[-1]["user_id"])
+        out.append((degree[i], (time.perf_counter() - t0) * 1000 / pages))
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк strategy=fof на графе друзей со степенным распределением")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--edges-per-user", type=int, default=5)
+    parser.add_argument("--fanout", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-generate", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="не удалять сгенерированный граф")
+    args = parser.parse_args()
+
+    try:
+        if args.skip_generate:
+            degree = _degrees(args.users)
+        else:
+            print(f"Генерация графа друзей: {args.users} пользователей…")
+            _cleanup()
+            degree = generate(args.users, args.edges_per_user, args.batch_size, args.seed)
+
+        results = measure(degree, args.samples, args.fanout, args.pages, args.seed)
+        buckets: dict[int, list[float]] = {}
+        for d, ms in results:
+            bucket = 1
+            while bucket < d:
+                bucket *= 10
+            buckets.setdefault(bucket, []).append(ms)
+
+        print(f"max степень: {max(degree)}, fanout: {args.fanout}")
+        print("друзей (до) | замеров | p50, ms/стр | max, ms/стр")
+        for bucket in sorted(buckets):
+            values = buckets[bucket]
+            print(f"{bucket:>11} | {len(values):>7} | {statistics.median(values):>11.2f} | {max(values):>11.2f}")
+    finally:
+        if not args.keep:
+            _cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import random
+import statistics
+import time
+
+from app.db.neo4j import get_driver, recommend_users
+
+BENCH_OFFSET = 10**12
+
+
+def _write(query: str, rows: list[dict]) -> None:
+    with get_driver().session() as session:
+        session.execute_write(lambda tx: tx.run(query, rows=rows).consume())
+
+
+def _cleanup() -> None:
+    with get_driver().session() as session:
+        session.run(
+            """
+            MATCH (k:HabitKind) WHERE k.key STARTS WITH 'bench:'
+            CALL { WITH k DETACH DELETE k } IN TRANSACTIONS OF 10000 ROWS
+            """
+        ).consume()
+        for label in ("User", "Goal", "Habit"):
+            session.run(
+                f"""
+                MATCH (n:{label}) WHERE n.id >= $offset
+                CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF 10000 ROWS
+                """,
+                offset=BENCH_OFFSET,
+            ).consume()
+
+
+def _pick(rng: random.Random, size: int) -> int:
+    # log-uniform popularity: a few goals/habits are shared by many users
+    return min(size - 1, int(size ** rng.random()) - 1)
+
+
+def generate(users: int, goals: int, kinds: int, per_user: int, batch_size: int, seed: int) -> None:
+    rng = random.Random(seed)
+
+    _write(
+        # not catalog goals: the live catalog must never list them
+        "UNWIND $rows AS row CREATE (:Goal {id: row.id, title: row.title})",
+        [{"id": BENCH_OFFSET + i, "title": f"bench goal {i}"} for i in range(goals)],
+    )
+    for start in range(0, kinds, batch_size):
+        _write(
+            "UNWIND $rows AS row CREATE (:HabitKind {key: row.key, title: row.key})",
+            [{"key": f"bench:{i}"} for i in range(start, min(kinds, start + batch_size))],
+        )
+
+    habit_id = BENCH_OFFSET
+    for start in range(0, users, batch_size):
+        end = min(users, start + batch_size)
+        _write(
+            "UNWIND $rows AS row CREATE (:User {id: row.id, username: row.username})",
+            [{"id": BENCH_OFFSET + i, "username": f"bench_{i}"} for i in range(start, end)],
+        )
+        goal_rows: list[dict] = []
+        habit_rows: list[dict] = []
+        for i in range(start, end):
+            for g in {_pick(rng, goals) for _ in range(per_user)}:
+                goal_rows.append({"u": BENCH_OFFSET + i, "g": BENCH_OFFSET + g})
+            for k in {_pick(rng, kinds) for _ in range(per_user)}:
+                habit_rows.append({"u": BENCH_OFFSET + i, "h": habit_id, "k": f"bench:{k}"})
+                habit_id += 1
+        _write(
+            """
+            UNWIND $rows AS row
+            MATCH (u:User {id: row.u}), (g:Goal {id: row.g})
+            CREATE (u)-[:HAS_GOAL]->(g)
+            """,
+            goal_rows,
+        )
+        _write(
+            """
+            UNWIND $rows AS row
+            MATCH (u:User {id: row.u}), (k:HabitKind {key: row.k})
+            CREATE (u)-[:HAS_HABIT]->(:Habit {id: row.h})-[:OF_KIND]->(k)
+            """,
+            habit_rows,
+        )
+        if (end // batch_size) % 20 == 0:
+            print(f"  создано пользователей: {end}/{users}")
+
+
+def _neighbourhood(user_id: int) -> int:
+    with get_driver().session() as session:
+        record = session.run(
+            """
+            MATCH (me:User {id: $user_id})
+            CALL {
+                WITH me
+                MATCH (me)-[:HAS_GOAL]->(:Goal)<-[:HAS_GOAL]-(other:User)
+                RETURN other
+                UNION
+                WITH me
+                MATCH (me)-[:HAS_HABIT]->(:Habit)-[:OF_KIND]->(:HabitKind)<-[:OF_KIND]-(:Habit)<-[:HAS_HABIT]-(other:User)
+                RETURN other
+            }
+            RETURN count(other) AS n
+            """,
+            user_id=user_id,
+        ).single()
+        return int(record["n"]) if record else 0
+
+
+def measure(users: int, samples: int, seed: int) -> list[tuple[int, float]]:
+    rng = random.Random(seed + 1)
+    out: list[tuple[int, float]] = []
+    for _ in range(samples):
+        user_id = BENCH_OFFSET + rng.randrange(users)
+        recommend_users(user_id=user_id, limit=10)
+        t0 = time.perf_counter()
+        recommend_users(user_id=user_id, limit=10)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        out.append((_neighbourhood(user_id), elapsed_ms))
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк recommend_users на синтетическом графе")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--goals", type=int, default=5_000)
+    parser.add_argument("--habit-kinds", type=int, default=50_000)
+    parser.add_argument("--per-user", type=int, default=3)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-generate", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="не удалять сгенерированный граф")
+    args = parser.parse_args()
+
+    try:
+        if not args.skip_generate:
+            print(f"Генерация графа: {args.users} пользователей…")
+            _cleanup()
+            generate(args.users, args.goals, args.habit_kinds, args.per_user, args.batch_size, args.seed)
+
+        results = measure(args.users, args.samples, args.seed)
+        buckets: dict[int, list[float]] = {}
+        for size, ms in results:
+            bucket = 1
+            while bucket < size:
+                bucket *= 10
+            buckets.setdefault(bucket, []).append(ms)
+
+        print("соседей (до) | замеров | p50, ms | max, ms")
+        for bucket in sorted(buckets):
+            values = buckets[bucket]
+            print(f"{bucket:>12} | {len(values):>7} | {statistics.median(values):>7.2f} | {max(values):>7.2f}")
+    finally:
+        if not args.keep:
+            _cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.api.routers.users import search_users
+from app.db.models import User
+from app.db.postgres import SessionLocal, engine, init_db
+
+BENCH_PREFIX = "bench_"
+# generated users get ids in their own range, so cleanup never touches real users named bench*
+BENCH_OFFSET = 3 * 10**12
+BENCH_END = BENCH_OFFSET + 10**12
+
+
+def generate(users: int, batch_size: int) -> None:
+    with engine.begin() as conn:
+        start = conn.execute(
+            text("SELECT COALESCE(max(id) - :lo + 1, 0) FROM users WHERE id >= :lo AND id < :hi"),
+            {"lo": BENCH_OFFSET, "hi": BENCH_END},
+        ).scalar_one()
+    for lo in range(start, users, batch_size):
+        hi = min(users, lo + batch_size)
+        with engine.begin() as conn:
+            # readable-ish names: two syllable chunks plus a hex tail, so trigrams repeat like real names
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO users (id, username)
+                    SELECT :offset + i, :prefix
+                        || (ARRAY['an','bo','ka','li','mi','na','ol','ra','se','ti','vo','ya'])[1 + i % 12]
+                        || (ARRAY['dr','ks','len','mar','nik','pol','ser','tan','vik','zhe'])[1 + (i / 12) % 10]
+                        || '_' || substr(md5(i::text), 1, 8)
+                    FROM generate_series(:lo, :hi - 1) AS i
+                    ON CONFLICT DO NOTHING
+                    """
+                ),
+                {"offset": BENCH_OFFSET, "prefix": BENCH_PREFIX, "lo": lo, "hi": hi},
+            )
+        if (hi // batch_size) % 10 == 0:
+            print(f"  создано пользователей: {hi}/{users}")
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE users"))
+
+
+def cleanup() -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text("DELETE FROM users WHERE id >= :lo AND id < :hi"), {"lo": BENCH_OFFSET, "hi": BENCH_END}
+        )
+
+
+def measure(queries: list[str], user: User) -> list[float]:
+    out = []
+    for q in queries:
+        t0 = time.perf_counter()
+        search_users(q=q, limit=10, user=user)
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска пользователей (pg_trgm)")
+    parser.add_argument("--users", type=int, default=5_000_000)
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-generate", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="не удалять сгенерированных пользователей")
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        if not args.skip_generate:
+            print(f"Генерация {args.users} пользователей…")
+            generate(args.users, args.batch_size)
+
+        with engine.begin() as conn:
+            user_id = conn.execute(text("SELECT min(id) FROM users")).scalar_one()
+        rng = random.Random(args.seed)
+        syllables = ["an", "bo", "ka", "li", "mi", "na", "ol", "ra", "se", "ti", "vo", "ya"]
+        tails = ["dr", "ks", "len", "mar", "nik", "pol", "ser", "tan", "vik", "zhe"]
+        cases = {
+            "префикс": [f"{BENCH_PREFIX}{rng.choice(syllables)}{rng.choice(tails)}" for _ in range(args.samples)],
+            "подстрока": [f"{rng.choice(tails)}_{rng.randrange(16**3):03x}" for _ in range(args.samples)],
+            "опечатка": [f"{rng.choice(syllables)}{rng.choice(tails)}x" for _ in range(args.samples)],
+        }
+
+        with SessionLocal() as db:
+            user = db.get(User, user_id)
+            print("запрос     | p50, ms | p95, ms | max, ms")
+            for label, queries in cases.items():
+                ms = sorted(measure(queries, user))
+                p95 = ms[int(len(ms) * 0.95) - 1]
+                print(f"{label:<10} | {statistics.median(ms):>7.2f} | {p95:>7.2f} | {ms[-1]:>7.2f}")
+    finally:
+        if not args.keep:
+            cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import time
+
+from app.core.settings import settings
+from app.db.outbox import EventSink, relay_batch, requeue_dead
+from app.db.postgres import init_db
+from app.db.sharding import shard_sessions
+
+
+def run(batch_size: int, poll_interval: float, once: bool = False) -> None:
+    sink = EventSink()
+    backoff = poll_interval
+    try:
+        while True:
+            # every shard keeps its own outbox next to the rows it describes
+            relayed = []
+            for sessions in shard_sessions():
+                db = sessions()
+                try:
+                    relayed.append(relay_batch(db, sink, batch_size=batch_size))
+                    backoff = poll_interval
+                except Exception as e:
+                    print(f"⚠ outbox: пачка не обработана ({e})")
+                    relayed.append(0)
+                    backoff = min(backoff * 2, 30.0)
+                finally:
+                    db.close()
+
+            if once and not any(relayed):
+                return
+            if max(relayed) < batch_size:
+                time.sleep(backoff)
+    finally:
+        sink.close()
+
+
+def requeue() -> int:
+    total = 0
+    for sessions in shard_sessions():
+        with sessions() as db:
+            total += requeue_dead(db)
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Релей outbox: PostgreSQL → Neo4j / Redis / RabbitMQ")
+    parser.add_argument("--batch-size", type=int, default=settings.outbox_batch_size)
+    parser.add_argument("--poll-interval", type=float, default=settings.outbox_poll_interval)
+    parser.add_argument("--once", action="store_true", help="разобрать очередь и выйти")
+    parser.add_argument("--requeue-dead", action="store_true", help="вернуть строки из outbox_dead в очередь и выйти")
+    args = parser.parse_args()
+
+    init_db()
+    if args.requeue_dead:
+        print(f"Возвращено в очередь: {requeue()} строк")
+        return
+    print("Outbox relay запущен…")
+    run(batch_size=args.batch_size, poll_interval=args.poll_interval, once=args.once)
+
+
+if __name__ == "__main__":
+    main()
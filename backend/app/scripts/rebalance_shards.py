@@ -0,0 +1,104 @@
+import argparse
+import time
+
+from sqlalchemy import select
+
+from app.core.settings import settings
+from app.db.models import User
+from app.db.postgres import init_db
+from app.db.sharding import is_sharded, move_user, session_for_shard, set_moving, shard_count, user_counts
+
+
+def _pick_users(shard: int, count: int) -> list[int]:
+    # newest users first: they have the least history to copy
+    with session_for_shard(shard) as db:
+        return list(db.scalars(select(User.id).order_by(User.id.desc()).limit(count)))
+
+
+def plan(counts: list[int], tolerance: int, max_moves: int) -> list[tuple[int, int, int]]:
+    counts = list(counts)
+    moves: list[tuple[int, int, int]] = []
+    budget = max_moves
+    while budget > 0:
+        source = max(range(len(counts)), key=counts.__getitem__)
+        target = min(range(len(counts)), key=counts.__getitem__)
+        gap = counts[source] - counts[target]
+        batch = min(gap // 2, budget)
+        if gap <= tolerance or batch <= 0:
+            break
+        moves.append((source, target, batch))
+        counts[source] -= batch
+        counts[target] += batch
+        budget -= batch
+    return moves
+
+
+def rebalance(tolerance: int, max_moves: int, chunk_size: int, settle_seconds: float | None, dry_run: bool) -> int:
+    counts = user_counts()
+    print("Пользователей по шардам: " + ", ".join(f"{i}={n}" for i, n in enumerate(counts)))
+    settle = settings.shard_directory_cache_seconds if settle_seconds is None else settle_seconds
+    moved = 0
+    for source, target, batch in plan(counts, tolerance, max_moves):
+        print(f"Шард {source} → {target}: {batch} пользователей")
+        if dry_run:
+            continue
+        user_ids = _pick_users(source, batch)
+        # users are read-only from their mark until their copy is done: mark a small chunk
+        # at a time, sharing one pause per chunk instead of one per user
+        for start in range(0, len(user_ids), chunk_size):
+            pending = user_ids[start : start + chunk_size]
+            set_moving(pending, source, moving=True)
+            try:
+                time.sleep(settle)
+                while pending:
+                    user_id = pending.pop(0)
+                    started = time.monotonic()
+                    try:
+                        stats = move_user(user_id, target, settle_seconds=0)
+                    except Exception as e:
+                        print(f"⚠ пользователь {user_id}: перенос не выполнен ({e})")
+                        continue
+                    moved += 1
+                    rows = ", ".join(f"{k}={v}" for k, v in stats.items())
+                    print(f"  ✓ {user_id}: {rows} за {time.monotonic() - started:.2f}s")
+            finally:
+                # an interrupted chunk must not leave users read-only
+                set_moving(pending, source, moving=False)
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Перенос пользователей между шардами PostgreSQL без остановки API")
+    parser.add_argument("--user", type=int, help="перенести одного пользователя")
+    parser.add_argument("--to", type=int, help="целевой шард для --user")
+    parser.add_argument("--tolerance", type=int, default=100, help="допустимая разница числа пользователей")
+    parser.add_argument("--max-moves", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=20, help="сколько пользователей помечать переносимыми за раз")
+    parser.add_argument(
+        "--settle-seconds",
+        type=float,
+        default=None,
+        help="пауза после пометки переноса (по умолчанию SHARD_DIRECTORY_CACHE_SECONDS)",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="только показать план")
+    args = parser.parse_args()
+
+    init_db()
+    if not is_sharded():
+        print("Шардирование не настроено (POSTGRES_SHARD_DSNS пуст).")
+        return
+
+    if args.user is not None:
+        if args.to is None or not 0 <= args.to < shard_count():
+            parser.error(f"--to должен быть от 0 до {shard_count() - 1}")
+        stats = move_user(args.user, args.to, settle_seconds=args.settle_seconds)
+        print(f"✓ Пользователь {args.user} перенесён: " + (", ".join(f"{k}={v}" for k, v in stats.items()) or "уже на месте"))
+        return
+
+    moved = rebalance(args.tolerance, args.max_moves, max(1, args.chunk_size), args.settle_seconds, args.dry_run)
+    if not args.dry_run:
+        print(f"Готово: перенесено {moved} пользователей")
+
+
+if __name__ == "__main__":
+    main()
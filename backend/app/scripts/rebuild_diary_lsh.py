@@ -0,0 +1,43 @@
+import argparse
+
+from app.core.minhash import band_keys, signature
+from app.db.diary_lsh import LSH_PREFIX, lsh_key
+from app.db.mongo import get_diary_collection
+from app.db.redis import get_redis
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    r = get_redis()
+    col = get_diary_collection()
+
+    cursor = r.scan_iter(match=f"{LSH_PREFIX}:*", count=1000)
+    for key in cursor:
+        r.unlink(key)
+
+    total = 0
+    pipe = r.pipeline(transaction=False)
+    for doc in col.find({}, {"user_id": 1, "text": 1}).sort("_id", 1).batch_size(batch_size):
+        entry_id = str(doc["_id"])
+        sig = signature(doc.get("text") or "")
+        if sig is None:
+            continue
+        pipe.hset(lsh_key(doc["user_id"]), mapping={band: entry_id for band in band_keys(sig)})
+        total += 1
+        if total % batch_size == 0:
+            pipe.execute()
+    pipe.execute()
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пересборка LSH-индекса дублей дневника из MongoDB")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print("Пересборка LSH-индекса дневника…")
+    total = rebuild(batch_size=args.batch_size)
+    print(f"Готово: проиндексировано записей — {total}")
+
+
+if __name__ == "__main__":
+    main()
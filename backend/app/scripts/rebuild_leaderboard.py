@@ -0,0 +1,29 @@
+from app.db.redis import LEADERBOARD_DAYS_KEY, LEADERBOARD_KEY, get_redis, rerank_users
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    r = get_redis()
+    r.delete(LEADERBOARD_KEY, LEADERBOARD_DAYS_KEY)
+
+    # each user is re-ranked from streaks:{user_id}; entries without a last day are dropped
+    total = 0
+    user_ids: list[int] = []
+    for key in r.scan_iter(match="streaks:*", count=batch_size):
+        user_ids.append(int(key.split(":", 1)[1]))
+        if len(user_ids) >= batch_size:
+            rerank_users(user_ids)
+            total += len(user_ids)
+            user_ids.clear()
+    if user_ids:
+        rerank_users(user_ids)
+        total += len(user_ids)
+    return total
+
+
+def main() -> None:
+    print("Пересборка leaderboard:streak из хешей streaks:*…")
+    print(f"Готово: {rebuild()} пользователей")
+
+
+if __name__ == "__main__":
+    main()
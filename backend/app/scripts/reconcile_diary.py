@@ -0,0 +1,228 @@
+import argparse
+import heapq
+import json
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+
+from bson import ObjectId
+
+from app.db.mongo import get_diary_collection
+from app.db.qdrant import (
+    delete_diary_points,
+    diary_point_id,
+    payload_fingerprint,
+    scroll_diary_points,
+    text_hash,
+    upsert_diary_entries,
+)
+from app.db.redis import get_redis
+
+STATS_KEY = "reconcile:diary"
+
+Row = tuple[str, str, str]
+
+
+def _mongo_rows(batch_size: int) -> Iterator[Row]:
+    col = get_diary_collection()
+    cursor = (
+        col.find({}, {"user_id": 1, "text": 1, "tags": 1, "mood": 1, "shared": 1})
+        .sort("_id", 1)
+        .batch_size(batch_size)
+    )
+    for doc in cursor:
+        entry_id = str(doc["_id"])
+        fingerprint = payload_fingerprint(
+            user_id=doc.get("user_id"),
+            text_digest=text_hash(doc.get("text") or ""),
+            tags=doc.get("tags") or [],
+            mood=doc.get("mood"),
+            shared=bool(doc.get("shared")),
+        )
+        yield diary_point_id(entry_id), entry_id, fingerprint
+
+
+def _write_run(rows: list[Row], tmp_dir: str) -> str:
+    rows.sort()
+    fd, path = tempfile.mkstemp(prefix="diary-run-", suffix=".tsv", dir=tmp_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write("\t".join(row))
+            f.write("\n")
+    return path
+
+
+def _read_run(path: str) -> Iterator[Row]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            point_id, entry_id, fingerprint = line.rstrip("\n").split("\t")
+            yield point_id, entry_id, fingerprint
+
+
+def _sorted_mongo_rows(batch_size: int, run_size: int, tmp_dir: str, stats: dict) -> Iterator[Row]:
+    # Qdrant scrolls in point-id order, and point ids are uuid5(entry_id), so the
+    # Mongo stream is re-sorted by point id through bounded on-disk runs.
+    runs: list[str] = []
+    buf: list[Row] = []
+    try:
+        for row in _mongo_rows(batch_size):
+            stats["mongo_scanned"] += 1
+            buf.append(row)
+            if len(buf) >= run_size:
+                runs.append(_write_run(buf, tmp_dir))
+                buf = []
+        if buf:
+            runs.append(_write_run(buf, tmp_dir))
+            buf = []
+        yield from heapq.merge(*(_read_run(p) for p in runs))
+    finally:
+        for p in runs:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+def _qdrant_rows(batch_size: int, stats: dict) -> Iterator[tuple[str, str]]:
+    prev = ""
+    for point_id, payload in scroll_diary_points(batch_size=batch_size):
+        if point_id < prev:
+            raise RuntimeError("Qdrant вернул точки не по порядку id, сверка прервана")
+        prev = point_id
+        stats["qdrant_scanned"] += 1
+        fingerprint = payload_fingerprint(
+            user_id=payload.get("user_id"),
+            text_digest=payload.get("text_hash"),
+            tags=payload.get("tags") or [],
+            mood=payload.get("mood"),
+            shared=bool(payload.get("shared")),
+        )
+        yield point_id, fingerprint
+
+
+def _repair_upserts(entry_ids: list[str], stats: dict, dry_run: bool) -> None:
+    if not entry_ids or dry_run:
+        return
+    col = get_diary_collection()
+    docs = col.find({"_id": {"$in": [ObjectId(e) for e in entry_ids]}})
+    batch = [
+        {
+            "entry_id": str(doc["_id"]),
+            "user_id": doc["user_id"],
+            "text": doc.get("text") or "",
+            "tags": doc.get("tags") or [],
+            "mood": doc.get("mood"),
+            # older entries may lack created_at; the ObjectId carries the insert time
+            "created_at": doc.get("created_at") or doc["_id"].generation_time,
+            "shared": bool(doc.get("shared")),
+        }
+        for doc in docs
+    ]
+    try:
+        upsert_diary_entries(batch)
+        stats["upserted"] += len(batch)
+    except Exception:
+        stats["errors"] += len(batch)
+
+
+def _repair_deletes(point_ids: list[str], stats: dict, dry_run: bool) -> None:
+    if not point_ids or dry_run:
+        return
+    try:
+        delete_diary_points(point_ids)
+        stats["deleted"] += len(point_ids)
+    except Exception:
+        stats["errors"] += len(point_ids)
+
+
+def reconcile(
+    batch_size: int = 2000,
+    run_size: int = 200_000,
+    repair_batch_size: int = 256,
+    dry_run: bool = False,
+    tmp_dir: str | None = None,
+) -> dict:
+    stats = {
+        "mongo_scanned": 0,
+        "qdrant_scanned": 0,
+        "missing": 0,
+        "orphaned": 0,
+        "stale": 0,
+        "upserted": 0,
+        "deleted": 0,
+        "errors": 0,
+    }
+    started = time.monotonic()
+
+    to_upsert: list[str] = []
+    to_delete: list[str] = []
+
+    def flush(force: bool = False) -> None:
+        if to_upsert and (force or len(to_upsert) >= repair_batch_size):
+            _repair_upserts(to_upsert, stats, dry_run)
+            to_upsert.clear()
+        if to_delete and (force or len(to_delete) >= repair_batch_size):
+            _repair_deletes(to_delete, stats, dry_run)
+            to_delete.clear()
+
+    with tempfile.TemporaryDirectory(prefix="habitgraph-reconcile-", dir=tmp_dir) as work_dir:
+        mongo_it = _sorted_mongo_rows(batch_size, run_size, work_dir, stats)
+        qdrant_it = _qdrant_rows(batch_size, stats)
+        m = next(mongo_it, None)
+        q = next(qdrant_it, None)
+        while m is not None or q is not None:
+            if q is None or (m is not None and m[0] < q[0]):
+                stats["missing"] += 1
+                to_upsert.append(m[1])
+                m = next(mongo_it, None)
+            elif m is None or q[0] < m[0]:
+                stats["orphaned"] += 1
+                to_delete.append(q[0])
+                q = next(qdrant_it, None)
+            else:
+                if m[2] != q[1]:
+                    stats["stale"] += 1
+                    to_upsert.append(m[1])
+                m = next(mongo_it, None)
+                q = next(qdrant_it, None)
+            flush()
+        flush(force=True)
+
+    stats["duration_s"] = round(time.monotonic() - started, 3)
+    stats["dry_run"] = dry_run
+    stats["finished_at"] = int(time.time())
+    return stats
+
+
+def _publish_stats(stats: dict) -> None:
+    try:
+        r = get_redis()
+        r.hset(STATS_KEY, mapping={k: str(v) for k, v in stats.items()})
+    except Exception:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сверка дневника MongoDB с векторами в Qdrant")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать расхождения")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--run-size", type=int, default=200_000)
+    parser.add_argument("--repair-batch-size", type=int, default=256)
+    parser.add_argument("--tmp-dir", default=None)
+    args = parser.parse_args()
+
+    print("Сверка diary_entries (MongoDB) и точек Qdrant…")
+    stats = reconcile(
+        batch_size=args.batch_size,
+        run_size=args.run_size,
+        repair_batch_size=args.repair_batch_size,
+        dry_run=args.dry_run,
+        tmp_dir=args.tmp_dir,
+    )
+    _publish_stats(stats)
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,22 @@
+from sqlalchemy import text
+
 from app.db.mongo import get_mongo_client
-from app.db.neo4j import get_driver
-from app.db.postgres import engine, init_db
+from app.db.neo4j import ensure_goal_catalog, get_driver
+from app.db.postgres import init_db
 from app.db.qdrant import get_qdrant_client
 from app.db.redis import get_redis
+from app.db.sharding import shard_engines
 from app.db.models import Base
 from app.core.settings import settings
 
 
 def reset_postgres() -> None:
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    for engine in shard_engines():
+        Base.metadata.drop_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS user_shards"))
+            conn.execute(text("DROP TABLE IF EXISTS schema_migrations"))
+    init_db()
 
 
 def reset_mongo() -> None:
@@ -37,6 +44,9 @@ def reset_neo4j() -> None:
         session.run("MATCH (n:User) DETACH DELETE n")
         session.run("MATCH (n:Goal) DETACH DELETE n")
         session.run("MATCH (n:Habit) DETACH DELETE n")
+        session.run("MATCH (n:HabitKind) DETACH DELETE n")
+    # running API processes cache "catalog exists", keep the nodes in place for them
+    ensure_goal_catalog(force=True)
 
 
 def main() -> None:
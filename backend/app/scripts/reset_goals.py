@@ -1,5 +1,6 @@
 from sqlalchemy import delete
 
+from app.db.goal_catalog import publish_goal_catalog_version
 from app.db.models import Goal
 from app.db.neo4j import clear_goal_graph, ensure_goal_catalog
 from app.db.postgres import SessionLocal, init_db
@@ -17,6 +18,7 @@ def reset_postgres_goals() -> None:
 def reset_neo4j_goals() -> None:
     clear_goal_graph()
     ensure_goal_catalog()
+    publish_goal_catalog_version()
 
 
 def main() -> None:
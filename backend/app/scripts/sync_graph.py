@@ -0,0 +1,99 @@
+import argparse
+import time
+from collections.abc import Callable
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db.models import Goal, Habit, User
+from app.db.neo4j import ensure_goal_catalog, link_user_goals, link_user_habits, upsert_users
+from app.db.postgres import init_db
+from app.db.sharding import shard_sessions
+
+
+def _sync(
+    db: Session,
+    label: str,
+    query,
+    id_column,
+    to_row: Callable,
+    write: Callable[[list[dict]], None],
+    batch_size: int,
+) -> int:
+    started = time.monotonic()
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.execute(query.where(id_column > last_id).order_by(id_column).limit(batch_size)).all()
+        if not rows:
+            break
+        write([to_row(r) for r in rows])
+        total += len(rows)
+        last_id = rows[-1].id
+        elapsed = time.monotonic() - started
+        print(f"  {label}: {total} ({total / max(elapsed, 1e-6):.0f}/s)")
+    return total
+
+
+def _sync_shard(db: Session, batch_size: int, only: set[str] | None, stats: dict[str, int]) -> None:
+    if not only or "users" in only:
+        stats["users"] = stats.get("users", 0) + _sync(
+            db,
+            "пользователи",
+            select(User.id, User.username),
+            User.id,
+            lambda r: {"user_id": r.id, "username": r.username},
+            upsert_users,
+            batch_size,
+        )
+    if not only or "habits" in only:
+        stats["habits"] = stats.get("habits", 0) + _sync(
+            db,
+            "привычки",
+            select(Habit.id, Habit.user_id, Habit.title),
+            Habit.id,
+            lambda r: {"user_id": r.user_id, "habit_id": r.id, "title": r.title},
+            link_user_habits,
+            batch_size,
+        )
+    if not only or "goals" in only:
+        stats["goals"] = stats.get("goals", 0) + _sync(
+            db,
+            "цели",
+            select(Goal.id, Goal.user_id, Goal.catalog_id).where(
+                Goal.catalog_id.is_not(None), Goal.is_archived.is_(False)
+            ),
+            Goal.id,
+            lambda r: {"user_id": r.user_id, "goal_id": r.catalog_id},
+            link_user_goals,
+            batch_size,
+        )
+
+
+def sync(batch_size: int = 10_000, only: set[str] | None = None) -> dict[str, int]:
+    ensure_goal_catalog(force=True)
+    stats: dict[str, int] = {}
+    for sessions in shard_sessions():
+        db = sessions()
+        try:
+            _sync_shard(db, batch_size, only, stats)
+        finally:
+            db.close()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Загрузка пользователей, привычек и целей из PostgreSQL в Neo4j")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--only", default="", help="users,habits,goals (по умолчанию всё)")
+    args = parser.parse_args()
+
+    init_db()
+    only = {name.strip() for name in args.only.split(",") if name.strip()}
+    print("Синхронизация графа…")
+    stats = sync(batch_size=args.batch_size, only=only or None)
+    print("Готово: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
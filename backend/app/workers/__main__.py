@@ -0,0 +1,68 @@
+import argparse
+import json
+import signal
+import threading
+
+from app.core import metrics
+from app.core.settings import settings
+from app.workers.dispatch import HANDLERS
+from app.workers.recommendations import RecomputeLoop
+from app.workers.runtime import WorkerRuntime
+
+
+def _report_metrics(interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        snap = metrics.snapshot()
+        worker_only = {
+            section: {k: v for k, v in values.items() if k.startswith(("worker.", "recs."))}
+            for section, values in snap.items()
+        }
+        print(json.dumps(worker_only, ensure_ascii=False))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Воркеры событий HabitGraph (exchange habitgraph.events)")
+    parser.add_argument("--concurrency", type=int, default=settings.worker_concurrency)
+    parser.add_argument("--pool", choices=["thread", "process"], default=settings.worker_pool)
+    parser.add_argument("--prefetch", type=int, default=settings.worker_prefetch)
+    parser.add_argument("--handlers", default="", help="имена обработчиков через запятую (по умолчанию все)")
+    parser.add_argument("--report-interval", type=float, default=30.0)
+    args = parser.parse_args()
+
+    amqp_url = settings.rabbitmq_amqp_url()
+    if not amqp_url:
+        print("RabbitMQ не настроен. Для одного узла используйте EVENT_BUS=local — обработчики выполнятся в процессе API.")
+        return
+
+    selected = [name.strip() for name in args.handlers.split(",") if name.strip()]
+    handlers = [h for name, h in HANDLERS.items() if not selected or name in selected]
+    if not handlers:
+        print("Нет обработчиков для запуска.")
+        return
+
+    runtime = WorkerRuntime(
+        amqp_url=amqp_url,
+        handlers=handlers,
+        concurrency=args.concurrency,
+        pool=args.pool,
+        prefetch=args.prefetch,
+    )
+    stop = threading.Event()
+    threading.Thread(target=_report_metrics, args=(args.report_interval, stop), daemon=True).start()
+    recs_loop = RecomputeLoop(interval=settings.recs_recompute_interval)
+    recs_loop.start()
+
+    def shutdown(*_: object) -> None:
+        stop.set()
+        recs_loop.stop()
+        runtime.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    print(f"Воркеры запущены: {', '.join(h.name for h in handlers)} ({args.pool} × {args.concurrency})")
+    runtime.run()
+
+
+if __name__ == "__main__":
+    main()
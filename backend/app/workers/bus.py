@@ -0,0 +1,52 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app.core.settings import settings
+from app.workers.dispatch import execute, record
+from app.workers.registry import Event, handlers_for
+
+
+class LocalBus:
+    def __init__(self, concurrency: int) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="local-bus")
+
+    def publish(
+        self,
+        routing_key: str,
+        payload: dict,
+        event_id: str | None = None,
+        occurred_at_ms: int | None = None,
+    ) -> list[Future]:
+        event = Event(
+            event_id=event_id or uuid.uuid4().hex,
+            routing_key=routing_key,
+            payload=payload,
+            occurred_at_ms=occurred_at_ms or int(time.time() * 1000),
+        )
+        return [self._executor.submit(self._run, h.name, event) for h in handlers_for(routing_key)]
+
+    def _run(self, handler_name: str, event: Event) -> None:
+        try:
+            outcome, latency = execute(handler_name, event)
+        except Exception:
+            record(handler_name, event, None, 0.0)
+            return
+        record(handler_name, event, outcome, latency)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+_bus: LocalBus | None = None
+_bus_lock = threading.Lock()
+
+
+def get_local_bus() -> LocalBus:
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = LocalBus(concurrency=settings.worker_concurrency)
+    return _bus
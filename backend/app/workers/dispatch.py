@@ -0,0 +1,74 @@
+import time
+
+from app.core import metrics
+from app.core.settings import settings
+from app.db.redis import get_redis
+from app.workers import feed as _feed  # noqa: F401
+from app.workers import handlers as _handlers  # noqa: F401  registers built-in handlers
+from app.workers import recommendations as _recommendations  # noqa: F401
+from app.workers.registry import HANDLERS, Event
+
+PROCESSED = "processed"
+DUPLICATE = "duplicate"
+
+# the seen key holds IN_PROGRESS while a handler runs and "1" once it succeeded
+IN_PROGRESS = "running"
+
+
+def _seen_key(handler_name: str, event_id: str) -> str:
+    return f"events:seen:{handler_name}:{event_id}"
+
+
+def _claim(key: str) -> bool:
+    r = get_redis()
+    ttl = settings.worker_claim_ttl_seconds
+    deadline = time.monotonic() + ttl + 1
+    while True:
+        # the short claim expires if the worker dies mid-handler, so a redelivery can run it
+        if r.set(key, IN_PROGRESS, nx=True, ex=ttl):
+            return True
+        state = r.get(key)
+        if state is not None and state != IN_PROGRESS:
+            return False
+        if time.monotonic() >= deadline:
+            return True
+        time.sleep(0.5)
+
+
+def execute(handler_name: str, event: Event) -> tuple[str, float]:
+    h = HANDLERS[handler_name]
+    key = _seen_key(handler_name, event.event_id)
+    try:
+        claimed = _claim(key)
+    except Exception:
+        claimed = True
+    if not claimed:
+        return DUPLICATE, 0.0
+
+    started = time.monotonic()
+    try:
+        h.fn(event)
+    except Exception:
+        try:
+            get_redis().delete(key)
+        except Exception:
+            pass
+        raise
+    latency = time.monotonic() - started
+    try:
+        get_redis().set(key, "1", ex=settings.worker_dedup_ttl_seconds)
+    except Exception:
+        pass
+    return PROCESSED, latency
+
+
+def record(handler_name: str, event: Event, outcome: str | None, latency: float) -> None:
+    if outcome is None:
+        metrics.inc(f"worker.{handler_name}.failed")
+        return
+    if outcome == DUPLICATE:
+        metrics.inc(f"worker.{handler_name}.duplicates")
+        return
+    metrics.inc(f"worker.{handler_name}.processed")
+    metrics.observe(f"worker.{handler_name}.latency", latency)
+    metrics.observe(f"worker.{handler_name}.lag", max(0.0, time.time() - event.occurred_at_ms / 1000))
@@ -0,0 +1,28 @@
+from app.db.feed import fan_out
+from app.db.redis import get_friend_ids
+from app.workers.registry import Event, handler
+
+_FEED_TYPES = {
+    "habits.checkin.recorded": "checkin",
+    "habits.streak.milestone": "streak_milestone",
+}
+
+
+@handler("habits.#", name="feed_fanout")
+def fan_out_feed(event: Event) -> None:
+    kind = _FEED_TYPES.get(event.routing_key)
+    user_id = event.payload.get("user_id")
+    if kind is None or user_id is None:
+        return
+    item = {
+        "id": event.event_id,
+        "type": kind,
+        "user_id": int(user_id),
+        "username": event.payload.get("username"),
+        "habit_id": event.payload.get("habit_id"),
+        "habit_title": event.payload.get("habit_title"),
+        "date": event.payload.get("date"),
+        "streak": event.payload.get("streak"),
+        "occurred_at_ms": event.occurred_at_ms,
+    }
+    fan_out(int(user_id), get_friend_ids(int(user_id)), item, event.occurred_at_ms)
@@ -0,0 +1,12 @@
+from app.db.redis import get_redis
+from app.workers.registry import Event, handler
+
+LAST_ACTIVE_KEY = "activity:last_seen"
+
+
+@handler("#", name="user_activity")
+def touch_user_activity(event: Event) -> None:
+    user_id = event.payload.get("user_id")
+    if user_id is None:
+        return
+    get_redis().zadd(LAST_ACTIVE_KEY, {str(user_id): event.occurred_at_ms / 1000}, gt=True)
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from app.core import metrics
+from app.core.settings import settings
+from app.db.neo4j import recommend_users, users_sharing_with
+from app.db.recommendations import TOP_K, mark_dirty, pop_due, store_recommendations
+from app.workers.registry import Event, handler
+
+
+@handler("user.*.changed", name="recommendations_invalidate")
+def invalidate_recommendations(event: Event) -> None:
+    user_id = event.payload.get("user_id")
+    if user_id is None:
+        return
+    affected = [int(user_id)] + users_sharing_with(int(user_id), limit=settings.recs_fanout_limit)
+    mark_dirty(affected, debounce_seconds=settings.recs_debounce_seconds)
+
+
+def recompute(user_id: int) -> None:
+    started = time.monotonic()
+    store_recommendations(user_id, recommend_users(user_id=user_id, limit=TOP_K))
+    metrics.observe("recs.recompute", time.monotonic() - started)
+
+
+def drain_due(batch_size: int = 100) -> int:
+    done = 0
+    for user_id in pop_due(batch_size):
+        try:
+            recompute(user_id)
+            done += 1
+        except Exception:
+            metrics.inc("recs.recompute_failed")
+            mark_dirty([user_id], debounce_seconds=settings.recs_debounce_seconds)
+    return done
+
+
+class RecomputeLoop:
+    def __init__(self, interval: float) -> None:
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="recs-recompute", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5.0)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                done = drain_due()
+            except Exception:
+                done = 0
+            if done == 0:
+                self._stop.wait(self._interval)
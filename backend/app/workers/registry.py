@@ -0,0 +1,46 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Event:
+    event_id: str
+    routing_key: str
+    payload: dict
+    occurred_at_ms: int
+
+
+@dataclass(frozen=True)
+class Handler:
+    name: str
+    pattern: str
+    fn: Callable[[Event], None]
+
+
+HANDLERS: dict[str, Handler] = {}
+
+
+def handler(pattern: str, name: str | None = None) -> Callable[[Callable[[Event], None]], Callable[[Event], None]]:
+    def decorator(fn: Callable[[Event], None]) -> Callable[[Event], None]:
+        handler_name = name or fn.__name__
+        HANDLERS[handler_name] = Handler(name=handler_name, pattern=pattern, fn=fn)
+        return fn
+
+    return decorator
+
+
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    def match(p: list[str], k: list[str]) -> bool:
+        if not p:
+            return not k
+        if p[0] == "#":
+            return any(match(p[1:], k[i:]) for i in range(len(k) + 1))
+        if not k:
+            return False
+        return (p[0] == "*" or p[0] == k[0]) and match(p[1:], k[1:])
+
+    return match(pattern.split("."), routing_key.split("."))
+
+
+def handlers_for(routing_key: str) -> list[Handler]:
+    return [h for h in HANDLERS.values() if topic_matches(h.pattern, routing_key)]
@@ -0,0 +1,152 @@
+import functools
+import json
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import pika
+
+from app.core import metrics
+from app.db.rabbitmq import EXCHANGE
+from app.workers.dispatch import execute, record
+from app.workers.registry import Event, Handler
+
+QUEUE_PREFIX = "habitgraph.worker"
+
+
+def queue_name(handler: Handler) -> str:
+    return f"{QUEUE_PREFIX}.{handler.name}"
+
+
+def _event_from_message(method, properties, body: bytes) -> Event:
+    headers = properties.headers or {}
+    occurred_at_ms = headers.get("occurred_at_ms")
+    if occurred_at_ms is None:
+        occurred_at_ms = (properties.timestamp or int(time.time())) * 1000
+    event_id = properties.message_id or f"{method.routing_key}:{method.delivery_tag}:{time.time_ns()}"
+    return Event(
+        event_id=event_id,
+        routing_key=method.routing_key,
+        payload=json.loads(body.decode("utf-8")),
+        occurred_at_ms=int(occurred_at_ms),
+    )
+
+
+class WorkerRuntime:
+    def __init__(
+        self,
+        amqp_url: str,
+        handlers: list[Handler],
+        concurrency: int,
+        pool: str,
+        prefetch: int,
+        max_backoff: float = 30.0,
+    ) -> None:
+        self._amqp_url = amqp_url
+        self._handlers = handlers
+        self._prefetch = prefetch
+        self._max_backoff = max_backoff
+        self._executor: Executor
+        if pool == "process":
+            self._executor = ProcessPoolExecutor(max_workers=concurrency)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="worker")
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._connection = None
+        self._channel = None
+        metrics.register_gauge("worker.in_flight", lambda: self._in_flight)
+
+    def _setup(self, channel) -> None:
+        channel.exchange_declare(exchange=EXCHANGE, exchange_type="topic", durable=True)
+        channel.basic_qos(prefetch_count=self._prefetch)
+        for h in self._handlers:
+            name = queue_name(h)
+            channel.queue_declare(queue=name, durable=True)
+            channel.queue_bind(queue=name, exchange=EXCHANGE, routing_key=h.pattern)
+            channel.basic_consume(
+                queue=name,
+                on_message_callback=functools.partial(self._on_message, h.name),
+            )
+
+    def _on_message(self, handler_name: str, channel, method, properties, body: bytes) -> None:
+        try:
+            event = _event_from_message(method, properties, body)
+        except Exception:
+            metrics.inc(f"worker.{handler_name}.malformed")
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        with self._lock:
+            self._in_flight += 1
+        future = self._executor.submit(execute, handler_name, event)
+        future.add_done_callback(
+            functools.partial(self._on_done, channel, method.delivery_tag, method.redelivered, handler_name, event)
+        )
+
+    def _on_done(
+        self,
+        channel,
+        delivery_tag: int,
+        redelivered: bool,
+        handler_name: str,
+        event: Event,
+        future: Future,
+    ) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        try:
+            outcome, latency = future.result()
+        except Exception:
+            record(handler_name, event, None, 0.0)
+            # one retry through redelivery, then the message is dropped
+            settle = functools.partial(channel.basic_nack, delivery_tag=delivery_tag, requeue=not redelivered)
+        else:
+            record(handler_name, event, outcome, latency)
+            settle = functools.partial(channel.basic_ack, delivery_tag=delivery_tag)
+
+        connection = self._connection
+        if connection is not None and connection.is_open:
+            connection.add_callback_threadsafe(functools.partial(self._settle, channel, settle))
+
+    def _settle(self, channel, settle) -> None:
+        # runs on the connection thread; after a reconnect the delivery tag belongs to a
+        # closed channel and the broker has already requeued the message
+        if channel is not self._channel or not channel.is_open:
+            metrics.inc("worker.stale_settles")
+            return
+        settle()
+
+    def run(self) -> None:
+        backoff = 0.5
+        while not self._stopping.is_set():
+            try:
+                self._connection = pika.BlockingConnection(pika.URLParameters(self._amqp_url))
+                channel = self._connection.channel()
+                self._channel = channel
+                self._setup(channel)
+                backoff = 0.5
+                channel.start_consuming()
+            except Exception as e:
+                if self._stopping.is_set():
+                    break
+                metrics.inc("worker.reconnects")
+                print(f"⚠ workers: соединение с RabbitMQ потеряно ({e}), повтор через {backoff:.1f}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self._max_backoff)
+            finally:
+                try:
+                    if self._connection is not None and self._connection.is_open:
+                        self._connection.close()
+                except Exception:
+                    pass
+                self._connection = None
+                self._channel = None
+
+    def stop(self) -> None:
+        self._stopping.set()
+        connection = self._connection
+        if connection is not None and connection.is_open:
+            connection.add_callback_threadsafe(connection.close)
+        self._executor.shutdown(wait=True, cancel_futures=True)
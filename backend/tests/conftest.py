@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    from app.db import redis as redis_db
+
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_db, "_client", client)
+    return client
+
+
+# a migrated database for tests that need Postgres; the public schema of TEST_POSTGRES_DSN is dropped
+@pytest.fixture
+def pg_engine():
+    dsn = os.environ.get("TEST_POSTGRES_DSN")
+    if not dsn:
+        pytest.skip("TEST_POSTGRES_DSN is not set")
+    from sqlalchemy import create_engine, text
+
+    from app.db.migrations import migrate
+
+    engine = create_engine(dsn)
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+    migrate(engine)
+    yield engine
+    engine.dispose()
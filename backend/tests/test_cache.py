@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pytest
+
+from app.core.cache import NEGATIVE, Cache
+
+
+class Loader:
+    def __init__(self, *values, delay: float = 0) -> None:
+        self.values = list(values)
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        value = self.values[min(self.calls, len(self.values)) - 1]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def _concurrently(fn, n: int = 8) -> list:
+    results: list = [None] * n
+    start = threading.Barrier(n)
+
+    def run(i: int) -> None:
+        start.wait()
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def _eventually(check, timeout: float = 2) -> None:
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_concurrent_misses_load_once():
+    cache = Cache("t", ttl=60, local=True)
+    loader = Loader("v", delay=0.1)
+    assert _concurrently(lambda: cache.get("k", loader)) == ["v"] * 8
+    assert loader.calls == 1
+    assert cache.get("k", loader) == "v"
+    assert loader.calls == 1
+
+
+def test_loader_error_reaches_every_waiter_and_is_not_cached():
+    cache = Cache("t", ttl=60, local=True)
+    loader = Loader(RuntimeError("down"), "v", delay=0.1)
+    results = _concurrently(lambda: cache.get("k", loader))
+    assert loader.calls == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert cache.get("k", loader) == "v"
+
+
+def test_stale_value_is_served_while_one_refresh_runs():
+    cache = Cache("t", ttl=60, soft_ttl=0.05, local=True)
+    cache.set("k", "old")
+    time.sleep(0.1)
+    loader = Loader("new", delay=0.1)
+    assert _concurrently(lambda: cache.get("k", loader)) == ["old"] * 8
+    _eventually(lambda: cache.peek("k") == "new")
+    assert loader.calls == 1
+
+
+def test_refresh_callback_replaces_loader_for_stale_reads():
+    cache = Cache("t", ttl=60, soft_ttl=0.01, local=True)
+    cache.set("k", "old")
+    time.sleep(0.05)
+    loader, refresh = Loader("from loader"), Loader("from refresh")
+    assert cache.get("k", loader, refresh=refresh) == "old"
+    _eventually(lambda: cache.peek("k") == "from refresh")
+    assert loader.calls == 0
+
+
+@pytest.mark.parametrize("negative_ttl,calls", [(0, 3), (60, 1)])
+def test_missing_values_are_cached_only_with_negative_ttl(negative_ttl, calls):
+    cache = Cache("t", ttl=60, negative_ttl=negative_ttl, local=True)
+    loader = Loader(None)
+    for _ in range(3):
+        assert cache.get("k", loader) is None
+    assert loader.calls == calls
+
+
+class TestRedisCache:
+    @pytest.fixture
+    def cache(self, fake_redis):
+        return Cache("t", ttl=60, soft_ttl=30, negative_ttl=10, encode=str, decode=int)
+
+    def test_values_are_stored_with_ttl(self, cache, fake_redis):
+        assert cache.get("t:1", Loader(7)) == 7
+        assert fake_redis.get("t:1") == "7"
+        assert 59_000 < fake_redis.pttl("t:1") <= 60_000
+        assert cache.get("t:1", Loader(8)) == 7
+
+    def test_age_comes_from_remaining_ttl(self, cache, fake_redis):
+        fake_redis.set("t:1", "1", px=20_000)
+        loader = Loader(2)
+        assert cache.get("t:1", loader) == 1
+        _eventually(lambda: fake_redis.get("t:1") == "2")
+        assert loader.calls == 1
+        # written without a TTL: never stale
+        fake_redis.set("t:2", "3")
+        assert cache.get("t:2", loader) == 3
+        assert loader.calls == 1
+
+    def test_negative_entries(self, cache, fake_redis):
+        loader = Loader(None)
+        assert cache.get("t:1", loader) is None
+        assert fake_redis.get("t:1") == NEGATIVE
+        assert cache.get("t:1", loader) is None
+        assert loader.calls == 1
+
+    def test_waits_for_another_process_holding_the_lock(self, cache, fake_redis, monkeypatch):
+        monkeypatch.setattr("app.core.cache.settings.cache_lock_wait", 2.0)
+        fake_redis.set("lock:t:1", "other", px=5000)
+        threading.Timer(0.1, lambda: fake_redis.set("t:1", "5", px=60_000)).start()
+        loader = Loader(6)
+        assert cache.get("t:1", loader) == 5
+        assert loader.calls == 0
+
+    def test_loads_itself_when_the_lock_holder_never_writes(self, cache, fake_redis, monkeypatch):
+        monkeypatch.setattr("app.core.cache.settings.cache_lock_wait", 0.1)
+        fake_redis.set("lock:t:1", "other", px=5000)
+        assert cache.get("t:1", Loader(6)) == 6
+
+    def test_recommendations_round_trip_through_a_sorted_set(self, fake_redis):
+        from app.db import recommendations
+
+        rows = [
+            {"user_id": 3, "shared_goals": 1, "shared_habits": 1, "score": 2},
+            {"user_id": 9, "shared_goals": 2, "shared_habits": 1, "score": 3},
+            {"user_id": 1, "shared_goals": 0, "shared_habits": 2, "score": 2},
+        ]
+        recommendations.store_recommendations(5, rows)
+        recommendations.store_recommendations(6, [])
+        assert fake_redis.type("recs:5") == "zset"
+        assert recommendations._recs.peek("recs:5") == [rows[1], rows[2], rows[0]]
+        assert recommendations._recs.peek("recs:6") == []
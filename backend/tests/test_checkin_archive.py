@@ -0,0 +1,81 @@
+import datetime as dt
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db.checkin_archive import archive_batch, checkin_dates, decode, encode, has_date
+from app.db.models import Checkin, CheckinArchive, Habit, User
+
+START = dt.date(2024, 2, 26)
+
+
+def _days(*offsets: int) -> list[dt.date]:
+    return [START + dt.timedelta(days=o) for o in offsets]
+
+
+def test_encode_sets_one_bit_per_day():
+    start, days = encode(_days(0, 1, 9))
+    assert start == START
+    assert days == bytes([0b11, 0b10])
+
+
+def test_encode_ignores_order_and_duplicates():
+    assert encode(_days(9, 0, 1, 9, 0)) == encode(_days(0, 1, 9))
+
+
+@pytest.mark.parametrize("span", [1, 7, 8, 9, 16, 366, 1000])
+def test_byte_length_covers_the_span(span):
+    start, days = encode(_days(0, span - 1))
+    assert len(days) == (span + 7) // 8
+    assert decode(start, days) == sorted(set(_days(0, span - 1)))
+
+
+def test_round_trip_random_dates():
+    rng = random.Random(5)
+    for _ in range(50):
+        dates = sorted(set(_days(*(rng.randrange(800) for _ in range(rng.randrange(1, 60))))))
+        assert decode(*encode(dates)) == dates
+
+
+def test_round_trip_across_leap_day():
+    dates = [dt.date(2024, 2, 28), dt.date(2024, 2, 29), dt.date(2024, 3, 1)]
+    assert decode(*encode(dates)) == dates
+
+
+def test_has_date():
+    dates = _days(0, 3, 8, 20)
+    start, days = encode(dates)
+    row = SimpleNamespace(start_date=start, days=days)
+    for offset in range(-3, len(days) * 8 + 3):
+        day = START + dt.timedelta(days=offset)
+        assert has_date(row, day) == (day in dates)
+
+
+def test_archive_batch_merges_into_existing_rows(pg_engine):
+    old = _days(0, 2, 5, 30)
+    with Session(pg_engine) as db:
+        user = User(username="archive")
+        db.add(user)
+        db.flush()
+        habit = Habit(user_id=user.id, title="бег")
+        db.add(habit)
+        db.flush()
+        db.add_all(Checkin(user_id=user.id, habit_id=habit.id, date=d) for d in old + _days(40))
+        db.commit()
+        user_id, habit_id = user.id, habit.id
+
+        assert archive_batch(db, cutoff=START + dt.timedelta(days=3), batch_size=100) == [(user_id, habit_id)]
+        assert archive_batch(db, cutoff=START + dt.timedelta(days=35), batch_size=1) == [(user_id, habit_id)]
+        assert archive_batch(db, cutoff=START + dt.timedelta(days=35), batch_size=100) == [(user_id, habit_id)]
+        assert archive_batch(db, cutoff=START + dt.timedelta(days=35), batch_size=100) == []
+
+        row = db.scalars(select(CheckinArchive)).one()
+        assert (row.start_date, row.total, row.last_date) == (START, 4, old[-1])
+        assert decode(row.start_date, row.days) == old
+        assert db.scalars(select(Checkin.date)).all() == _days(40)
+        assert checkin_dates(db, user_id, habit_id) == old + _days(40)
+        assert checkin_dates(db, user_id, habit_id, since=_days(3)[0], until=_days(35)[0]) == _days(5, 30)
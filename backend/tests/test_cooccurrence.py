@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from app.core import cooccurrence
+
+
+def _graph(seed: int, n_users: int = 80) -> list[dict]:
+    rng = random.Random(seed)
+    ids = sorted(rng.sample(range(1, 10_000), n_users))
+    rows = []
+    for uid in ids:
+        # a few popular catalog goals and a long tail of habit kinds
+        goals = [rng.randrange(4) for _ in range(rng.randrange(3))] + [100 + rng.randrange(40) for _ in range(rng.randrange(2))]
+        kinds = [f"k{rng.randrange(30)}" for _ in range(rng.randrange(4))] + ["walk"] * rng.randrange(2)
+        friends = rng.sample(ids, rng.randrange(6)) + [-1]
+        rows.append({"user_id": uid, "goals": goals, "kinds": kinds, "friends": friends})
+    return rows
+
+
+# recommend_users in Python: distinct shared goals plus distinct shared kinds, friends and
+# self excluded, ORDER BY score DESC, user_id ASC
+def _live(rows: list[dict], user_id: int, k: int) -> list[dict]:
+    me = next(r for r in rows if r["user_id"] == user_id)
+    recs = []
+    for other in rows:
+        if other["user_id"] == user_id or other["user_id"] in me["friends"]:
+            continue
+        goals = len(set(me["goals"]) & set(other["goals"]))
+        kinds = len(set(me["kinds"]) & set(other["kinds"]))
+        if goals + kinds:
+            recs.append({"user_id": other["user_id"], "shared_goals": goals, "shared_habits": kinds, "score": goals + kinds})
+    recs.sort(key=lambda r: (-r["score"], r["user_id"]))
+    return recs[:k]
+
+
+@pytest.mark.parametrize("heavy_min_df", [cooccurrence.HEAVY_MIN_DF, 10, 1])
+@pytest.mark.parametrize("k", [3, 10, 200])
+def test_top_k_matches_live_recommender(heavy_min_df, k):
+    rows = _graph(seed=heavy_min_df * 31 + k)
+    bp = cooccurrence.build(rows, heavy_min_df=heavy_min_df)
+    if heavy_min_df < cooccurrence.HEAVY_MIN_DF:
+        assert bp.heavy_mask.any()
+    for user_id, recs in cooccurrence.top_k_rows(bp, 0, len(rows), k):
+        assert recs == _live(rows, user_id, k)
+
+
+def test_blocks_match_single_pass():
+    bp = cooccurrence.build(_graph(seed=7), heavy_min_df=10)
+    n = len(bp.user_ids)
+    blocks = [r for start in range(0, n, 7) for r in cooccurrence.top_k_rows(bp, start, min(start + 7, n), 5)]
+    assert blocks == cooccurrence.top_k_rows(bp, 0, n, 5)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    bp = cooccurrence.build(_graph(seed=3), heavy_min_df=10)
+    directory = str(tmp_path / "recs")
+    cooccurrence.save(bp, directory)
+    cooccurrence.save(bp, directory)
+    assert list(cooccurrence.recompute_all(directory, 5, block_size=16, processes=1)) == [
+        cooccurrence.top_k_rows(bp, start, min(start + 16, len(bp.user_ids)), 5)
+        for start in range(0, len(bp.user_ids), 16)
+    ]
+
+
+def test_rows_must_be_ordered():
+    with pytest.raises(ValueError):
+        cooccurrence.build(
+            [
+                {"user_id": 2, "goals": [], "kinds": [], "friends": []},
+                {"user_id": 1, "goals": [], "kinds": [], "friends": []},
+            ]
+        )
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+pytest.importorskip("redis")
+
+from app.db import feed
+from app.db.feed import fan_out, parse_cursor, read_feed
+
+
+def _read_all(user_id: int, limit: int) -> list[dict]:
+    items, cursor, pages = [], None, 0
+    while True:
+        page, cursor = read_feed(user_id, limit, cursor)
+        items.extend(page)
+        pages += 1
+        assert pages < 50
+        if cursor is None:
+            return items
+
+
+def _expected(items: list[tuple[dict, int]]) -> list[dict]:
+    # Redis order: score desc, equal scores by member desc
+    members = sorted(((score, json.dumps(item, sort_keys=True)) for item, score in items), reverse=True)
+    return [json.loads(member) for _, member in members]
+
+
+def test_parse_cursor():
+    assert parse_cursor(None) == ("+inf", 0)
+    assert parse_cursor("") == ("+inf", 0)
+    assert parse_cursor("1700000000:3") == ("1700000000", 3)
+    with pytest.raises(ValueError):
+        parse_cursor("abc")
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 10])
+def test_pages_cover_every_item_once_across_ties(fake_redis, limit):
+    posted = [({"id": i, "author": 1}, score) for i, score in enumerate([100, 100, 100, 90, 90, 80, 100, 70])]
+    for item, score in posted:
+        fan_out(1, [2, 3], item, score)
+
+    assert _read_all(2, limit) == _expected(posted)
+    assert read_feed(4, limit, None) == ([], None)
+
+
+def test_cursor_skips_ties_already_returned(fake_redis):
+    for i in range(5):
+        fan_out(1, [2], {"id": i}, 100)
+
+    page, cursor = read_feed(2, 2, None)
+    assert cursor == "100:2"
+    page, cursor = read_feed(2, 2, cursor)
+    assert cursor == "100:4"
+    page, cursor = read_feed(2, 2, cursor)
+    assert len(page) == 1 and cursor is None
+
+
+def test_hub_items_are_merged_on_read(fake_redis, monkeypatch):
+    monkeypatch.setattr(feed.settings, "feed_fanout_limit", 2)
+    hub_items = [({"id": i, "author": 9}, score) for i, score in enumerate([100, 95, 95, 60])]
+    for item, score in hub_items:
+        fan_out(9, [2, 3, 4], item, score)
+    own_items = [({"id": i, "author": 5}, score) for i, score in enumerate([95, 90, 60])]
+    for item, score in own_items:
+        fan_out(5, [2], item, score)
+
+    assert fake_redis.sismember(feed.HUBS_KEY, "9")
+    assert not fake_redis.exists(feed.feed_key(3))
+    for limit in (1, 2, 4, 10):
+        assert _read_all(2, limit) == _expected(hub_items + own_items)
+    assert _read_all(3, 2) == _expected(hub_items)
+
+
+def test_author_below_limit_stops_being_a_hub(fake_redis, monkeypatch):
+    monkeypatch.setattr(feed.settings, "feed_fanout_limit", 2)
+    fan_out(9, [2, 3, 4], {"id": 1}, 100)
+    assert fake_redis.smembers(feed.follows_key(2)) == {"9"}
+
+    fan_out(9, [2, 3], {"id": 2}, 110)
+    assert not fake_redis.sismember(feed.HUBS_KEY, "9")
+    assert fake_redis.smembers(feed.follows_key(2)) == set()
+    assert read_feed(2, 10, None) == ([{"id": 2}], None)
+
+
+def test_timelines_are_capped(fake_redis, monkeypatch):
+    monkeypatch.setattr(feed.settings, "feed_max_items", 3)
+    for i in range(5):
+        fan_out(1, [2], {"id": i}, i)
+    assert [item["id"] for item in _read_all(2, 2)] == [4, 3, 2]
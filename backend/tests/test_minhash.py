@@ -0,0 +1,79 @@
+import pytest
+
+from app.core.minhash import BANDS, NUM_PERM, band_keys, shingles, signature, similarity_from_bands
+
+TEXT = "сегодня утром пробежал пять километров по набережной и потом долго растягивался дома"
+
+
+def test_signature_is_deterministic():
+    assert signature(TEXT) == signature(TEXT)
+    assert len(signature(TEXT)) == NUM_PERM
+
+
+def test_signature_ignores_case_and_punctuation():
+    assert signature(TEXT) == signature(TEXT.upper().replace(" ", ", "))
+
+
+def test_text_without_words_has_no_signature():
+    assert shingles("🙂🙂 !!! ...") == set()
+    assert signature("🙂🙂 !!! ...") is None
+
+
+def test_short_text_is_one_shingle():
+    assert len(shingles("два слова")) == 1
+
+
+def test_near_duplicates_share_most_bands():
+    edited = TEXT.replace("дома", "дома вечером")
+    shared = len(set(band_keys(signature(TEXT))) & set(band_keys(signature(edited))))
+    other = "прочитал главу книги про историю древнего рима и записал несколько мыслей на полях"
+    unrelated = len(set(band_keys(signature(TEXT))) & set(band_keys(signature(other))))
+    assert shared >= BANDS // 2
+    assert unrelated == 0
+
+
+def test_band_keys_are_prefixed_by_band():
+    keys = band_keys(signature(TEXT))
+    assert [int(key[0], 16) for key in keys] == list(range(BANDS))
+
+
+def test_similarity_from_bands():
+    assert similarity_from_bands(0) == 0.0
+    assert similarity_from_bands(BANDS) == 1.0
+    assert similarity_from_bands(1) < similarity_from_bands(BANDS // 2) < 1.0
+
+
+class TestDiaryLsh:
+    @pytest.fixture(autouse=True)
+    def lsh(self, fake_redis):
+        from app.db import diary_lsh
+
+        return diary_lsh
+
+    def test_finds_indexed_duplicate(self, lsh):
+        lsh.index_entry(1, "a", signature(TEXT))
+        assert lsh.find_duplicate(1, signature(TEXT), threshold=0.85) == ("a", 1.0)
+
+    def test_duplicates_are_per_user(self, lsh):
+        lsh.index_entry(1, "a", signature(TEXT))
+        assert lsh.find_duplicate(2, signature(TEXT), threshold=0.85) is None
+
+    def test_below_threshold_is_not_a_duplicate(self, lsh):
+        lsh.index_entry(1, "a", signature(TEXT))
+        other = "прочитал главу книги про историю древнего рима и записал несколько мыслей на полях"
+        assert lsh.find_duplicate(1, signature(other), threshold=0.85) is None
+
+    def test_remove_keeps_bands_owned_by_other_entries(self, lsh, fake_redis):
+        sig = signature(TEXT)
+        lsh.index_entry(1, "a", sig)
+        lsh.index_entry(1, "b", sig)
+        lsh.remove_entry(1, "a", sig)
+        assert lsh.find_duplicate(1, sig, threshold=0.85) == ("b", 1.0)
+        lsh.remove_entry(1, "b", sig)
+        assert fake_redis.exists(lsh.lsh_key(1)) == 0
+
+    def test_entries_without_signature_are_skipped(self, lsh, fake_redis):
+        lsh.index_entry(1, "a", None)
+        lsh.remove_entry(1, "a", None)
+        assert lsh.find_duplicate(1, None, threshold=0.0) is None
+        assert fake_redis.exists(lsh.lsh_key(1)) == 0
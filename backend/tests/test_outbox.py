@@ -0,0 +1,149 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.db import outbox
+from app.db.outbox import _relay_rows
+
+KIND = "test.kind"
+OTHER = "test.other"
+
+
+def _row(id: int, user_id: int | None, kind: str = KIND, poison: bool = False):
+    return SimpleNamespace(id=id, user_id=user_id, kind=kind, payload={"id": id, "poison": poison})
+
+
+class Relay:
+    def __init__(self, dead: bool = False) -> None:
+        self.applied: list[list[int]] = []
+        self.failed: list[int] = []
+        self.dead = dead
+
+    def handler(self, payloads: list[dict]) -> None:
+        if any(p["poison"] for p in payloads):
+            raise RuntimeError("poison")
+
+    def apply(self, handler, group) -> None:
+        handler([row.payload for row in group])
+        self.applied.append([row.id for row in group])
+
+    def fail(self, row, error) -> bool:
+        self.failed.append(row.id)
+        return self.dead
+
+    def run(self, rows):
+        return _relay_rows(rows, {KIND: self.handler, OTHER: self.handler}, self.apply, self.fail)
+
+
+def test_batch_applies_each_kind_run_once():
+    relay = Relay()
+    done, error = relay.run([_row(1, 1), _row(2, 2), _row(3, 1, OTHER), _row(4, 2)])
+    assert done == [1, 2, 3, 4]
+    assert error is None
+    assert relay.applied == [[1, 2], [3], [4]]
+
+
+def test_failing_row_holds_back_only_its_user():
+    relay = Relay()
+    rows = [_row(1, 1), _row(2, 1, poison=True), _row(3, 2), _row(4, 1), _row(5, 1, OTHER), _row(6, 2, OTHER)]
+    done, error = relay.run(rows)
+    assert done == [1, 3, 6]
+    assert isinstance(error, RuntimeError)
+    assert relay.failed == [2]
+
+
+def test_dead_lettered_row_stops_blocking():
+    relay = Relay(dead=True)
+    done, error = relay.run([_row(1, 1, poison=True), _row(2, 1), _row(3, 1, OTHER)])
+    assert done == [2, 3]
+    assert relay.failed == [1]
+    assert error is not None
+
+
+def test_rows_without_user_are_not_ordered():
+    relay = Relay()
+    done, _ = relay.run([_row(1, None, poison=True), _row(2, None), _row(3, None, OTHER)])
+    assert done == [2, 3]
+    assert relay.failed == [1]
+
+
+def test_unknown_kinds_are_dropped():
+    relay = Relay()
+    done, error = relay.run([_row(1, 1, "gone.kind"), _row(2, 1)])
+    assert done == [1, 2]
+    assert error is None
+
+
+def test_user_id_comes_from_nested_event_payload():
+    assert outbox.outbox_user_id({"user_id": 5}) == 5
+    assert outbox.outbox_user_id({"routing_key": "x", "payload": {"user_id": 7}}) == 7
+    assert outbox.outbox_user_id({"routing_key": "x", "payload": {}}) is None
+
+
+@pytest.fixture
+def pg(pg_engine, monkeypatch):
+    seen: list[int] = []
+
+    def handler(payloads: list[dict]) -> None:
+        if any(p.get("poison") for p in payloads):
+            raise RuntimeError("poison")
+        seen.extend(p["n"] for p in payloads)
+
+    monkeypatch.setattr(outbox, "_handlers", lambda db, sink: {KIND: handler})
+    monkeypatch.setattr(outbox.settings, "outbox_max_attempts", 2)
+    return SimpleNamespace(sessions=sessionmaker(bind=pg_engine), seen=seen, engine=pg_engine)
+
+
+def _add(pg, *rows: dict) -> None:
+    with pg.sessions() as db:
+        for payload in rows:
+            outbox.add_outbox(db, KIND, payload)
+        db.commit()
+
+
+def _relay(pg) -> None:
+    with pg.sessions() as db:
+        try:
+            outbox.relay_batch(db, sink=None)
+        except RuntimeError:
+            pass
+
+
+def _retry_now(pg) -> None:
+    from sqlalchemy import text
+
+    with pg.engine.begin() as conn:
+        conn.execute(text("UPDATE outbox SET next_attempt_at = now()"))
+
+
+def test_relay_keeps_a_users_rows_behind_their_failed_row(pg):
+    _add(pg, {"user_id": 1, "n": 1, "poison": True}, {"user_id": 2, "n": 2}, {"user_id": 1, "n": 3})
+    _relay(pg)
+    assert pg.seen == [2]
+    # the failed row waits for its retry time and user 1's later row waits behind it
+    _relay(pg)
+    assert pg.seen == [2]
+
+    _add(pg, {"user_id": 2, "n": 4})
+    _relay(pg)
+    assert pg.seen == [2, 4]
+
+
+def test_relay_dead_letters_rows_out_of_attempts(pg):
+    from sqlalchemy import func, select
+
+    from app.db.models import OutboxDeadEvent, OutboxEvent
+
+    _add(pg, {"user_id": 1, "n": 1, "poison": True}, {"user_id": 1, "n": 2})
+    _relay(pg)
+    _retry_now(pg)
+    _relay(pg)
+    assert pg.seen == [2]
+    with pg.sessions() as db:
+        assert db.scalar(select(func.count()).select_from(OutboxEvent)) == 0
+        dead = db.scalars(select(OutboxDeadEvent)).one()
+        assert (dead.user_id, dead.attempts, dead.payload["n"]) == (1, 2, 1)
+        assert "poison" in dead.error
+        assert outbox.requeue_dead(db) == 1
+        assert db.scalars(select(OutboxEvent)).one().payload["n"] == 1